@@ -0,0 +1,200 @@
+"""Control de admisión: concurrencia máxima y cola acotada por ruta.
+
+Cada ruta tiene su propio presupuesto de peticiones en curso y en espera.
+Las rutas pesadas (listados sin paginar, estadísticas, cargas masivas, bcrypt)
+reciben uno chico: al saturarse esperan o se rechazan ellas solas, sin
+acaparar el threadpool ni la CPU que necesitan las ligeras. Una petición que
+no cabe en la cola, o que espera en ella más de ADMISION_ESPERA segundos,
+recibe 503 (o el estado de LIBRERIA_ADMISION_ESTADO) con Retry-After.
+"""
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from functools import lru_cache
+
+from starlette.routing import Match
+
+ADMISION_HABILITADA = os.getenv("LIBRERIA_ADMISION", "1").lower() in ("1", "true", "si")
+
+def _limites(variable, defecto):
+    """'concurrencia/cola' -> (concurrencia, cola)"""
+    concurrencia, _, cola = os.getenv(variable, defecto).partition("/")
+    return int(concurrencia), int(cola or 0)
+
+# Las pesadas son CPU (serializar, agregar): más de una por CPU en curso no suma
+# throughput y le quita el GIL a las ligeras (python -m benchmarks.admision)
+LIMITES_PESADAS = _limites("LIBRERIA_ADMISION_PESADAS", f"{os.cpu_count() or 1}/16")
+LIMITES_LIGERAS = _limites("LIBRERIA_ADMISION_LIGERAS", "64/256")
+ADMISION_ESPERA = float(os.getenv("LIBRERIA_ADMISION_ESPERA", "2"))
+# 503 (servidor saturado) por defecto; 429 si los clientes solo reintentan ante ese estado
+ESTADO_RECHAZO = int(os.getenv("LIBRERIA_ADMISION_ESTADO", "503"))
+
+# Peso del último tiempo de servicio en la media móvil que estima Retry-After
+PESO_MEDIA = 0.1
+
+
+class Presupuesto:
+    """Semáforo FIFO con cola acotada, tiempo máximo de espera y contadores"""
+
+    def __init__(self, concurrencia: int, cola: int, espera_maxima: float = ADMISION_ESPERA):
+        self.concurrencia = concurrencia
+        self.cola = cola
+        self.espera_maxima = espera_maxima
+        self.en_curso = 0
+        self.admitidas = 0
+        self.rechazadas_cola = 0      # Cola llena al llegar
+        self.rechazadas_espera = 0    # Venció la espera máxima en la cola
+        self.duracion_media = 0.0
+        self._esperando = deque()
+
+    @property
+    def en_cola(self) -> int:
+        return len(self._esperando)
+
+    async def entrar(self) -> bool:
+        """True si la petición puede seguir (y debe llamar a salir); False si se rechaza"""
+        if self.en_curso < self.concurrencia and not self._esperando:
+            self.en_curso += 1
+            self.admitidas += 1
+            return True
+        if len(self._esperando) >= self.cola:
+            self.rechazadas_cola += 1
+            return False
+
+        turno = asyncio.get_running_loop().create_future()
+        self._esperando.append(turno)
+        try:
+            await asyncio.wait_for(turno, self.espera_maxima)
+        except asyncio.TimeoutError:
+            self._descartar(turno)
+            self.rechazadas_espera += 1
+            return False
+        except asyncio.CancelledError:
+            # El cliente se fue: si ya tenía el turno se lo pasa al siguiente
+            if turno.done() and not turno.cancelled():
+                self.salir()
+            else:
+                self._descartar(turno)
+            raise
+        self.admitidas += 1
+        return True
+
+    def salir(self, duracion: float = None):
+        if duracion is not None:
+            self.duracion_media += PESO_MEDIA * (duracion - self.duracion_media)
+        # El lugar pasa directo al primero de la cola: en_curso no cambia
+        while self._esperando:
+            turno = self._esperando.popleft()
+            if not turno.done():
+                turno.set_result(None)
+                return
+        self.en_curso -= 1
+
+    def reintentar_en(self) -> int:
+        """Segundos estimados hasta que se vacíe la cola actual (al menos 1)"""
+        pendientes = (self.en_cola + self.en_curso) / max(self.concurrencia, 1)
+        return max(1, math.ceil(self.duracion_media * pendientes))
+
+    def metricas(self) -> dict:
+        return {
+            "concurrencia": self.concurrencia,
+            "cola": self.cola,
+            "en_curso": self.en_curso,
+            "en_cola": self.en_cola,
+            "admitidas": self.admitidas,
+            "rechazadas_cola": self.rechazadas_cola,
+            "rechazadas_espera": self.rechazadas_espera,
+        }
+
+    def _descartar(self, turno):
+        try:
+            self._esperando.remove(turno)
+        except ValueError:
+            pass
+
+
+# (metodo, plantilla de la ruta) -> Presupuesto; se crean con la primera petición
+presupuestos = {}
+
+
+class MiddlewareAdmision:
+    """Middleware ASGI que limita cada ruta según su presupuesto.
+
+    La ruta se resuelve con las mismas reglas que el router (plantilla y
+    método); las peticiones sin ruta y las `exentas` pasan sin control.
+    """
+
+    def __init__(self, app, router, pesadas=(), exentas=(),
+                 limites_pesadas=LIMITES_PESADAS, limites_ligeras=LIMITES_LIGERAS):
+        self.app = app
+        self.router = router
+        self.pesadas = set(pesadas)
+        self.exentas = set(exentas)
+        self.limites_pesadas = limites_pesadas
+        self.limites_ligeras = limites_ligeras
+        self._resolver = lru_cache(maxsize=4096)(self._resolver_ruta)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        route = self._resolver(scope["method"], scope["path"])
+        if route is None or route.path in self.exentas:
+            return await self.app(scope, receive, send)
+
+        presupuesto = self._presupuesto(scope["method"], route)
+        if not await presupuesto.entrar():
+            scope["route"] = route  # Para que las métricas cuenten el rechazo en su ruta
+            return await self._rechazar(presupuesto, send)
+        inicio = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            presupuesto.salir(time.perf_counter() - inicio)
+
+    def _presupuesto(self, metodo, route):
+        clave = (metodo, route.path)
+        presupuesto = presupuestos.get(clave)
+        if presupuesto is None:
+            concurrencia, cola = self.limites_pesadas if clave in self.pesadas else self.limites_ligeras
+            presupuesto = presupuestos[clave] = Presupuesto(concurrencia, cola)
+        return presupuesto
+
+    def _resolver_ruta(self, metodo, ruta):
+        scope = {"type": "http", "method": metodo, "path": ruta, "root_path": ""}
+        for route in self.router.routes:
+            coincidencia, _ = route.matches(scope)
+            if coincidencia == Match.FULL:
+                return route
+        return None
+
+    @staticmethod
+    async def _rechazar(presupuesto, send):
+        cuerpo = '{"detail":"Servidor saturado, reintente más tarde"}'.encode()
+        await send({
+            "type": "http.response.start",
+            "status": ESTADO_RECHAZO,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(cuerpo)).encode()),
+                (b"retry-after", str(presupuesto.reintentar_en()).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": cuerpo})
+
+
+def metricas() -> dict:
+    """Estado de cada presupuesto por 'METODO plantilla'"""
+    return {f"{metodo} {ruta}": presupuesto.metricas() for (metodo, ruta), presupuesto in sorted(presupuestos.items())}
+
+def series(campo: str) -> list:
+    """Pares (etiquetas, valor) de un contador de cada presupuesto, para /metrics"""
+    return [
+        ({"metodo": metodo, "ruta": ruta}, getattr(presupuesto, campo))
+        for (metodo, ruta), presupuesto in sorted(presupuestos.items())
+    ]
+
+def instalar(app, pesadas=(), exentas=()):
+    if ADMISION_HABILITADA:
+        app.add_middleware(MiddlewareAdmision, router=app.router, pesadas=pesadas, exentas=exentas)
@@ -1,11 +1,133 @@
-# Usando SQLAlchemy ORM
+"""Autenticación: contraseñas con bcrypt y tokens JWT (Bearer).
+
+bcrypt es deliberadamente lento (~250 ms con 12 rondas): el hash y la
+verificación corren en un pool de hilos acotado (bcrypt libera el GIL) para
+que un login no detenga el event loop. Los tokens ya verificados y los
+usuarios detrás de ellos se guardan en cachés LRU; así una petición
+autenticada no vuelve a validar la firma ni a consultar la base de datos.
+Un token sale de la caché cuando vence.
+"""
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+
+import bcrypt
+import jwt
+from fastapi import Depends, HTTPException, status
+from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
-from models import Autor
 
-def obtener_todos_autores(db: Session):
-    return db.query(Autor).all()
+import crud
+import schemas
+from cache import CacheLRU
+from database import ejecutar, obtener_db
+
+# Sin valor por defecto: una clave conocida permitiría falsificar tokens. Tampoco
+# una al azar por proceso, porque los workers de serve.py deben compartirla
+SECRET_KEY = os.getenv("LIBRERIA_SECRET_KEY")
+if not SECRET_KEY:
+    raise RuntimeError("Falta LIBRERIA_SECRET_KEY: la clave con la que se firman los tokens JWT")
+ALGORITHM = "HS256"
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("LIBRERIA_TOKEN_MINUTOS", "30"))
+BCRYPT_RONDAS = int(os.getenv("LIBRERIA_BCRYPT_RONDAS", "12"))
+# Hashes simultáneos como máximo; los demás logins esperan su turno en la cola del pool
+BCRYPT_HILOS = int(os.getenv("LIBRERIA_BCRYPT_HILOS", "0")) or os.cpu_count() or 1
+
+AUTH_CACHE_HABILITADA = os.getenv("LIBRERIA_AUTH_CACHE", "1").lower() in ("1", "true", "si")
+AUTH_CACHE_MAX_ENTRADAS = int(os.getenv("LIBRERIA_AUTH_CACHE_MAX_ENTRADAS", "10000"))
+# Un usuario cacheado se vuelve a leer pasado este tiempo aunque su token siga vigente (0 = no cachearlos)
+AUTH_CACHE_USUARIO_TTL = float(os.getenv("LIBRERIA_AUTH_CACHE_USUARIO_TTL", "60"))
+
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
+
+_pool_bcrypt = ThreadPoolExecutor(max_workers=BCRYPT_HILOS, thread_name_prefix="bcrypt")
+
+# token -> email y email -> schemas.User; la etiqueta por usuario permite invalidar ambos
+tokens = CacheLRU(AUTH_CACHE_MAX_ENTRADAS)
+usuarios = CacheLRU(AUTH_CACHE_MAX_ENTRADAS)
+
+def etiqueta_usuario(email: str) -> str:
+    return f"usuario:{email}"
+
+def invalidar_usuario(email: str):
+    """Olvida los tokens y el usuario cacheados (p. ej. al desactivarlo o cambiar su contraseña)"""
+    tokens.invalidar([etiqueta_usuario(email)])
+    usuarios.invalidar([etiqueta_usuario(email)])
+
+def limpiar_caches():
+    tokens.limpiar()
+    usuarios.limpiar()
+
+
+# CONTRASEÑAS
+def _hash(password: str) -> str:
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds=BCRYPT_RONDAS)).decode("ascii")
+
+def _verificar(password: str, hashed_password: str) -> bool:
+    return bcrypt.checkpw(password.encode("utf-8"), hashed_password.encode("ascii"))
+
+@lru_cache(maxsize=None)
+def _hash_ficticio() -> str:
+    # Se compara contra él cuando el email no existe: el login tarda lo mismo y
+    # no revela qué cuentas existen
+    return _hash("contraseña-inexistente")
+
+async def _en_pool(funcion, *args):
+    return await asyncio.get_running_loop().run_in_executor(_pool_bcrypt, funcion, *args)
+
+async def get_password_hash(password: str) -> str:
+    return await _en_pool(_hash, password)
+
+async def verify_password(password: str, hashed_password: str = None) -> bool:
+    """Compara en el pool; sin hash (usuario inexistente) usa uno ficticio y devuelve False"""
+    if hashed_password is None:
+        await _en_pool(_verificar, password, await _en_pool(_hash_ficticio))
+        return False
+    return await _en_pool(_verificar, password, hashed_password)
+
+
+# TOKENS
+def create_access_token(data: dict, expires_delta: timedelta = None) -> str:
+    datos = dict(data)
+    vence = datetime.now(timezone.utc) + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+    datos["exp"] = vence
+    return jwt.encode(datos, SECRET_KEY, algorithm=ALGORITHM)
+
+credenciales_invalidas = HTTPException(
+    status_code=status.HTTP_401_UNAUTHORIZED,
+    detail="Could not validate credentials",
+    headers={"WWW-Authenticate": "Bearer"},
+)
 
-autores = obtener_todos_autores()
-for autor in autores:
-    print(f"ID: {autor.id}, Nombre: {autor.nombre}, Nacionalidad: {autor.nacionalidad}")
+def verificar_token(token: str) -> str:
+    """Email (`sub`) de un token válido y vigente; 401 si no lo es"""
+    if AUTH_CACHE_HABILITADA:
+        email = tokens.obtener(token)
+        if email is not None:
+            return email
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM], options={"require": ["exp", "sub"]})
+    except jwt.InvalidTokenError:
+        raise credenciales_invalidas
+    email = payload["sub"]
+    if AUTH_CACHE_HABILITADA:
+        # Vive en la caché solo mientras el token sea válido
+        tokens.guardar(token, email, [etiqueta_usuario(email)], payload["exp"] - time.time())
+    return email
 
+async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(obtener_db)) -> schemas.User:
+    """Usuario del token como schemas.User (no ligado a ninguna sesión, apto para la caché)"""
+    email = verificar_token(token)
+    cachear = AUTH_CACHE_HABILITADA and AUTH_CACHE_USUARIO_TTL > 0
+    usuario = usuarios.obtener(email) if cachear else None
+    if usuario is None:
+        fila = await ejecutar(db, crud.obtener_usuario_por_email, email)
+        if fila is None or not fila.is_active:
+            raise credenciales_invalidas
+        usuario = schemas.User.model_validate(fila)
+        if cachear:
+            usuarios.guardar(email, usuario, [etiqueta_usuario(email)], AUTH_CACHE_USUARIO_TTL)
+    return usuario
@@ -0,0 +1,7 @@
+"""Benchmarks de la API: `python -m benchmarks.<nombre>`"""
+import os
+import secrets
+
+# Los tokens de una corrida no salen de ella: basta una clave al azar, que los
+# servidores lanzados por los benchmarks heredan por el entorno
+os.environ.setdefault("LIBRERIA_SECRET_KEY", secrets.token_hex(32))
@@ -0,0 +1,102 @@
+"""Latencia de las rutas ligeras mientras las pesadas están saturadas.
+
+Levanta `serve.py` con el control de admisión activado y desactivado. Durante
+`--segundos` segundos, `--pesados` clientes piden sin pausa GET /libros/ sin
+paginar y /estadisticas/ (caché de respuestas desactivada; tras un 503 esperan
+lo que indica Retry-After) mientras `--ligeros` clientes piden GET / y el
+detalle de un autor. Se reportan las peticiones/s, los rechazos y la latencia
+p50/p99 de cada grupo.
+
+Uso: python -m benchmarks.admision [--libros N] [--segundos S] [--pesados N] [--ligeros N]
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+from benchmarks.carga import puerto_libre
+from benchmarks.datos import crear_base_temporal, sembrar
+from benchmarks.escalado import esperar_servidor
+from benchmarks.medicion import percentil
+
+PESADAS = ["/libros/", "/estadisticas/?fuente=sql"]
+LIGERAS = ["/", "/autores/{id}"]
+
+class Resultado:
+    def __init__(self):
+        self.latencias = []
+        self.rechazadas = 0
+
+async def cliente_en_bucle(cliente, rutas, indice, total_autores, fin, resultado):
+    i = indice
+    while time.perf_counter() < fin:
+        url = rutas[i % len(rutas)].format(id=1 + (i * 7919) % total_autores)
+        i += 1
+        inicio = time.perf_counter()
+        respuesta = await cliente.get(url)
+        if respuesta.status_code in (429, 503):
+            resultado.rechazadas += 1
+            await asyncio.sleep(float(respuesta.headers.get("retry-after", 1)))
+            continue
+        respuesta.raise_for_status()
+        resultado.latencias.append(time.perf_counter() - inicio)
+
+async def cargar(base, args):
+    total_autores = max(1, args.libros // 10)
+    pesadas, ligeras = Resultado(), Resultado()
+    limites = httpx.Limits(max_connections=args.pesados + args.ligeros)
+    async with httpx.AsyncClient(base_url=base, limits=limites, timeout=120) as cliente:
+        fin = time.perf_counter() + args.segundos
+        await asyncio.gather(
+            *(cliente_en_bucle(cliente, PESADAS, i, total_autores, fin, pesadas) for i in range(args.pesados)),
+            *(cliente_en_bucle(cliente, LIGERAS, i, total_autores, fin, ligeras) for i in range(args.ligeros)),
+        )
+    return pesadas, ligeras
+
+def medir(url_bd, admision, args):
+    puerto = puerto_libre()
+    entorno = dict(os.environ, LIBRERIA_DATABASE_URL=url_bd, LIBRERIA_CACHE="0",
+                   LIBRERIA_ADMISION="1" if admision else "0")
+    servidor = subprocess.Popen(
+        [sys.executable, "serve.py", "--workers", "1", "--puerto", str(puerto),
+         "--sin-migrar", "--log-level", "warning"],
+        env=entorno
+    )
+    base = f"http://127.0.0.1:{puerto}"
+    try:
+        esperar_servidor(base, servidor)
+        return asyncio.run(cargar(base, args))
+    finally:
+        servidor.terminate()
+        servidor.wait()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--libros", type=int, default=20_000)
+    parser.add_argument("--segundos", type=float, default=10)
+    parser.add_argument("--pesados", type=int, default=64, help="Clientes concurrentes en rutas pesadas")
+    parser.add_argument("--ligeros", type=int, default=8, help="Clientes concurrentes en rutas ligeras")
+    args = parser.parse_args()
+
+    engine, _ = crear_base_temporal()
+    sembrar(engine, args.libros, realista=True)
+    url_bd = engine.url.render_as_string(hide_password=False)
+    engine.dispose()
+
+    print(f"libros: {args.libros}  clientes pesados: {args.pesados}  ligeros: {args.ligeros}  "
+          f"{args.segundos:g} s por corrida")
+    print(f"{'admisión':>9} {'grupo':>8} {'ok/s':>8} {'rechazos':>9} {'p50 ms':>9} {'p99 ms':>9}")
+    for admision in (False, True):
+        pesadas, ligeras = medir(url_bd, admision, args)
+        for nombre, resultado in (("pesadas", pesadas), ("ligeras", ligeras)):
+            latencias = resultado.latencias or [float("nan")]
+            print(f"{'sí' if admision else 'no':>9} {nombre:>8} {len(resultado.latencias) / args.segundos:>8.1f} "
+                  f"{resultado.rechazadas:>9} {percentil(latencias, 0.50) * 1000:>9.1f} "
+                  f"{percentil(latencias, 0.99) * 1000:>9.1f}")
+
+if __name__ == "__main__":
+    main()
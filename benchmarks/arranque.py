@@ -0,0 +1,70 @@
+"""Tiempo de arranque en frío: importar `main`, iniciar la app (lifespan) y servir la primera petición.
+
+Cada medición corre en un proceso nuevo. Se comparan una base vacía, una base
+ya migrada con el esquema creado al iniciar y una base ya migrada con
+LIBRERIA_CREAR_ESQUEMA=0.
+
+Uso: python -m benchmarks.arranque [--repeticiones N]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HIJO = """
+import json, time
+from fastapi.testclient import TestClient
+inicio = time.perf_counter()
+import main
+importado = time.perf_counter()
+with TestClient(main.app) as cliente:
+    iniciado = time.perf_counter()
+    cliente.get("/libros/?limit=1").raise_for_status()
+    respondido = time.perf_counter()
+print(json.dumps({
+    "importar": importado - inicio,
+    "iniciar": iniciado - importado,
+    "primera_peticion": respondido - iniciado,
+}))
+"""
+
+FASES = ["importar", "iniciar", "primera_peticion", "proceso"]
+
+def medir(url, crear_esquema):
+    entorno = dict(os.environ, LIBRERIA_DATABASE_URL=url, LIBRERIA_CREAR_ESQUEMA=crear_esquema)
+    inicio = time.perf_counter()
+    salida = subprocess.run(
+        [sys.executable, "-c", HIJO], env=entorno, capture_output=True, text=True, check=True
+    ).stdout
+    tiempos = json.loads(salida.splitlines()[-1])
+    tiempos["proceso"] = time.perf_counter() - inicio
+    return tiempos
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args()
+
+    directorio = tempfile.mkdtemp(prefix="libreria-arranque-")
+    migrada = f"sqlite:///{os.path.join(directorio, 'migrada.db')}"
+    subprocess.run([sys.executable, "migrar.py", "--url", migrada], check=True, capture_output=True)
+
+    casos = {
+        "base vacía, esquema al iniciar": lambda i: (
+            f"sqlite:///{os.path.join(directorio, f'vacia-{i}.db')}", "1"
+        ),
+        "base migrada, esquema al iniciar": lambda i: (migrada, "1"),
+        "base migrada, LIBRERIA_CREAR_ESQUEMA=0": lambda i: (migrada, "0"),
+    }
+    print(f"{'caso':<40} " + " ".join(f"{fase:>17}" for fase in FASES))
+    for nombre, caso in casos.items():
+        mediciones = [medir(*caso(i)) for i in range(args.repeticiones)]
+        medianas = [statistics.median(m[fase] for m in mediciones) for fase in FASES]
+        print(f"{nombre:<40} " + " ".join(f"{t * 1000:>14.1f} ms" for t in medianas))
+
+if __name__ == "__main__":
+    main()
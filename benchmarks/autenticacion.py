@@ -0,0 +1,140 @@
+"""Logins por segundo y latencia de las peticiones autenticadas.
+
+1. Logins concurrentes con bcrypt en el pool de hilos vs en el propio event
+   loop; mientras tanto una sonda pide GET / cada 10 ms y mide cuánto tarda en
+   ser atendida (un loop bloqueado por bcrypt la hace esperar).
+2. GET /auth/me con el mismo token, con la caché de tokens y usuarios
+   activada y desactivada (sin caché: validar el JWT y un SELECT por petición).
+
+Uso: python -m benchmarks.autenticacion [--usuarios N] [--logins N] [--concurrencia C]
+                                        [--rondas R] [--peticiones N]
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import bcrypt
+import httpx
+
+import auth
+import models
+from benchmarks.datos import crear_base_temporal
+from benchmarks.medicion import percentil
+from database import obtener_db
+from main import app
+
+PASSWORD = "password-de-prueba"
+
+def sembrar_usuarios(SessionLocal, total, rondas):
+    # Todos comparten el hash: calcularlo una vez por usuario no mide nada útil
+    hashed = bcrypt.hashpw(PASSWORD.encode(), bcrypt.gensalt(rounds=rondas)).decode()
+    db = SessionLocal()
+    try:
+        db.add_all(
+            models.User(email=f"usuario{i}@ejemplo.com", hashed_password=hashed, full_name=f"Usuario {i}")
+            for i in range(total)
+        )
+        db.commit()
+    finally:
+        db.close()
+
+async def sondear(cliente, detener, demoras):
+    """GET / cada 10 ms mientras duren los logins"""
+    while not detener.is_set():
+        inicio = time.perf_counter()
+        await cliente.get("/")
+        demoras.append(time.perf_counter() - inicio)
+        await asyncio.sleep(0.01)
+
+async def medir_logins(cliente, total, concurrencia, usuarios):
+    latencias = []
+    demoras = []
+    semaforo = asyncio.Semaphore(concurrencia)
+    detener = asyncio.Event()
+
+    async def uno(i):
+        datos = {"username": f"usuario{i % usuarios}@ejemplo.com", "password": PASSWORD}
+        async with semaforo:
+            inicio = time.perf_counter()
+            respuesta = await cliente.post("/auth/login", data=datos)
+            latencias.append(time.perf_counter() - inicio)
+            respuesta.raise_for_status()
+
+    sonda = asyncio.create_task(sondear(cliente, detener, demoras))
+    inicio = time.perf_counter()
+    await asyncio.gather(*(uno(i) for i in range(total)))
+    duracion = time.perf_counter() - inicio
+    detener.set()
+    await sonda
+    return total / duracion, latencias, demoras
+
+async def medir_autenticadas(cliente, total, token):
+    cabeceras = {"Authorization": f"Bearer {token}"}
+    latencias = []
+    for _ in range(total):
+        inicio = time.perf_counter()
+        respuesta = await cliente.get("/auth/me", headers=cabeceras)
+        latencias.append(time.perf_counter() - inicio)
+        respuesta.raise_for_status()
+    return latencias
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--usuarios", type=int, default=100)
+    parser.add_argument("--logins", type=int, default=64)
+    parser.add_argument("--concurrencia", type=int, default=16)
+    parser.add_argument("--rondas", type=int, default=auth.BCRYPT_RONDAS)
+    parser.add_argument("--peticiones", type=int, default=2_000)
+    args = parser.parse_args()
+
+    engine, SessionLocal = crear_base_temporal()
+    sembrar_usuarios(SessionLocal, args.usuarios, args.rondas)
+
+    def sesion():
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[obtener_db] = sesion
+    en_pool = auth._en_pool
+
+    async def en_el_loop(funcion, *args):
+        return funcion(*args)
+
+    async def medir_todo():
+        transporte = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transporte, base_url="http://bench", timeout=600) as cliente:
+            print(f"bcrypt {args.rondas} rondas, {auth.BCRYPT_HILOS} hilos, "
+                  f"{args.logins} logins con concurrencia {args.concurrencia}")
+            print(f"{'bcrypt':>8} {'logins/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'sonda p50':>10} {'sonda max':>10}")
+            for nombre, ejecutor in (("loop", en_el_loop), ("pool", en_pool)):
+                auth._en_pool = ejecutor
+                await medir_logins(cliente, 2, 2, args.usuarios)  # calentamiento (hash ficticio, conexiones)
+                rps, latencias, demoras = await medir_logins(cliente, args.logins, args.concurrencia, args.usuarios)
+                print(f"{nombre:>8} {rps:>9.1f} {statistics.median(latencias) * 1000:>8.1f} "
+                      f"{percentil(latencias, 0.99) * 1000:>8.1f} {statistics.median(demoras) * 1000:>10.1f} "
+                      f"{max(demoras) * 1000:>10.1f}")
+            auth._en_pool = en_pool
+
+            token = auth.create_access_token({"sub": "usuario0@ejemplo.com"})
+            print(f"\nGET /auth/me, {args.peticiones} peticiones")
+            print(f"{'caché':>8} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8}")
+            for habilitada in (False, True):
+                auth.AUTH_CACHE_HABILITADA = habilitada
+                auth.limpiar_caches()
+                await medir_autenticadas(cliente, 50, token)
+                latencias = await medir_autenticadas(cliente, args.peticiones, token)
+                print(f"{'sí' if habilitada else 'no':>8} {len(latencias) / sum(latencias):>9.1f} "
+                      f"{statistics.median(latencias) * 1000:>8.3f} {percentil(latencias, 0.99) * 1000:>8.3f}")
+
+    try:
+        asyncio.run(medir_todo())
+    finally:
+        app.dependency_overrides.clear()
+        engine.dispose()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,354 @@
+"""Suite de carga: recorre todas las rutas de la API sobre catálogos sintéticos.
+
+Siembra catálogos con Faker, dispara cada escenario en proceso (ASGI) y/o
+contra un servidor HTTP local (uvicorn) con la concurrencia indicada y
+reporta peticiones/s, latencia p50/p95/p99, consultas SQL por petición
+(leídas de /metrics) y pico de memoria residente. Los resultados se guardan
+en JSON y se pueden comparar contra una corrida anterior.
+
+Uso:
+    python -m benchmarks.carga [--tamanos 1000 100000 1000000] [--modos inproceso http]
+                               [--peticiones N] [--concurrencia C] [--salida resultados.json]
+                               [--base anterior.json] [--tolerancia 0.15]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import re
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import httpx
+
+from benchmarks.datos import crear_base_temporal, sembrar, vocabulario_realista
+from benchmarks.medicion import percentil, reiniciar_rss_pico, rss_pico_mb
+
+TAMANOS = [1_000, 100_000, 1_000_000]
+MODOS = ["inproceso", "http"]
+TAMANO_LOTE_BULK = 100
+# Tope de peticiones de los escenarios que recorren el catálogo entero: con un
+# millón de libros cada exportación tarda segundos
+MAXIMO_PETICIONES = {"exportar_libros": 10, "exportar_autores": 10}
+SEMILLA = 42
+USUARIO_CARGA = {"email": "carga@ejemplo.com", "password": "contraseña-de-carga", "full_name": "Carga"}
+
+class Contexto:
+    """Datos del catálogo sembrado que los escenarios usan para armar peticiones"""
+
+    def __init__(self, total_libros):
+        self.total_libros = total_libros
+        self.total_autores = max(1, total_libros // 10)
+        self.palabras = sorted({
+            palabra.lower()
+            for titulo in vocabulario_realista(SEMILLA)["titulos"]
+            for palabra in titulo.split() if len(palabra) > 4
+        })
+        # Los completa `preparar_sesion`: token de USUARIO_CARGA y una tarea suya
+        self.cabeceras = {}
+        self.tarea = None
+
+    def autor(self, i):
+        return 1 + (i * 7919) % self.total_autores
+
+    def libro(self, i):
+        return (i * 104729) % self.total_libros
+
+    def palabra(self, i):
+        return self.palabras[i % len(self.palabras)]
+
+class Formulario(dict):
+    """Cuerpo que se envía como application/x-www-form-urlencoded (p. ej. /auth/login)"""
+
+def libro_nuevo(ctx, i):
+    return {"titulo": f"Carga {i}", "precio": 10 + i % 90, "paginas": 100 + i % 500,
+            "autor_id": ctx.autor(i)}
+
+# (nombre, método, función (ctx, i) -> (url, cuerpo)); las escrituras van al final
+ESCENARIOS = [
+    ("raiz", "GET", lambda ctx, i: ("/", None)),
+    ("autores_pagina", "GET", lambda ctx, i: (f"/autores/?limit=50&after={ctx.autor(i)}", None)),
+    ("autor_con_libros", "GET", lambda ctx, i: (f"/autores/{ctx.autor(i)}", None)),
+    ("autores_estadisticas", "GET",
+     lambda ctx, i: (f"/autores/?include=stats&limit=50&after={ctx.autor(i)}", None)),
+    ("ranking_libros", "GET", lambda ctx, i: (f"/autores/ranking?por=libros&limit={1 + i % 50}", None)),
+    ("ranking_precio", "GET", lambda ctx, i: (f"/autores/ranking?por=precio&limit={1 + i % 50}", None)),
+    ("libros_pagina", "GET", lambda ctx, i: (f"/libros/?limit=50&after={ctx.libro(i)}", None)),
+    ("libros_pagina_rapido", "GET",
+     lambda ctx, i: (f"/libros/?limit=50&after={ctx.libro(i)}&rapido=true", None)),
+    ("buscar_titulo", "GET", lambda ctx, i: (f"/libros/buscar/?titulo={ctx.palabra(i)}&limit=20", None)),
+    ("buscar_rango_precio", "GET",
+     lambda ctx, i: (f"/libros/buscar/?precio_min={10 + i % 100}&precio_max={20 + i % 100}"
+                     f"&orden=precio&limit=20", None)),
+    ("buscar_autor_id", "GET", lambda ctx, i: (f"/libros/buscar/?autor_id={ctx.autor(i)}", None)),
+    ("histograma_cubetas", "GET", lambda ctx, i: (f"/libros/precios/histograma?cubetas={1 + i % 20}", None)),
+    ("histograma_limites", "GET",
+     lambda ctx, i: (f"/libros/precios/histograma?limites={10 + i % 40}&limites={50 + i % 40}", None)),
+    ("percentiles_precio", "GET",
+     lambda ctx, i: (f"/libros/precios/percentiles?p=50&p=90&p={i % 100}", None)),
+    ("estadisticas", "GET", lambda ctx, i: ("/estadisticas/", None)),
+    ("estadisticas_sql", "GET", lambda ctx, i: ("/estadisticas/?fuente=sql", None)),
+    # /cambios/stream queda afuera: no termina, no tiene latencia ni peticiones/s que medir
+    ("cambios_pagina", "GET",
+     lambda ctx, i: (f"/cambios?since={ctx.libro(i) + ctx.autor(i)}&limit=100", None)),
+    ("exportar_libros", "GET", lambda ctx, i: (f"/export/libros?formato={('csv', 'ndjson')[i % 2]}", None)),
+    ("exportar_autores", "GET", lambda ctx, i: (f"/export/autores?formato={('csv', 'ndjson')[i % 2]}", None)),
+    ("auth_me", "GET", lambda ctx, i: ("/auth/me", None)),
+    ("tareas_pagina", "GET", lambda ctx, i: ("/tasks/?limit=50", None)),
+    ("tarea", "GET", lambda ctx, i: (f"/tasks/{ctx.tarea}", None)),
+    ("cache_metricas", "GET", lambda ctx, i: ("/cache/metricas", None)),
+    ("metricas", "GET", lambda ctx, i: ("/metrics", None)),
+    ("login", "POST", lambda ctx, i: ("/auth/login", Formulario(
+        username=USUARIO_CARGA["email"], password=USUARIO_CARGA["password"]
+    ))),
+    ("registrar_usuario", "POST", lambda ctx, i: ("/auth/register", {
+        **USUARIO_CARGA, "email": f"carga{i}@ejemplo.com"
+    })),
+    ("crear_tarea", "POST",
+     lambda ctx, i: ("/tasks/", {"title": f"Tarea {i}", "description": "Carga", "priority": "medium"})),
+    ("actualizar_tarea", "PUT", lambda ctx, i: (f"/tasks/{ctx.tarea}", {"title": f"Tarea {i}"})),
+    ("crear_autor", "POST",
+     lambda ctx, i: ("/autores/", {"nombre": f"Autor carga {i}", "nacionalidad": "Chilena"})),
+    ("crear_libro", "POST", lambda ctx, i: ("/libros/", libro_nuevo(ctx, i))),
+    ("autores_bulk", "POST", lambda ctx, i: ("/autores/bulk", [
+        {"nombre": f"Autor bulk {i}-{j}", "nacionalidad": "Peruana"} for j in range(TAMANO_LOTE_BULK)
+    ])),
+    ("libros_bulk", "POST", lambda ctx, i: ("/libros/bulk", [
+        libro_nuevo(ctx, i * TAMANO_LOTE_BULK + j) for j in range(TAMANO_LOTE_BULK)
+    ])),
+]
+
+PATRON_PETICIONES = re.compile(r'^libreria_peticiones_total\{metodo="[^"]*",ruta="([^"]*)",estado="[^"]*"\} (\S+)$', re.MULTILINE)
+PATRON_CONSULTAS = re.compile(r'^libreria_sql_consultas_total\{ruta="([^"]*)"\} (\S+)$', re.MULTILINE)
+
+async def contadores(cliente):
+    """(peticiones, consultas SQL) acumuladas en /metrics, sin contar el propio /metrics"""
+    texto = (await cliente.get("/metrics")).text
+    return tuple(
+        sum(float(valor) for ruta, valor in patron.findall(texto) if ruta != "/metrics")
+        for patron in (PATRON_PETICIONES, PATRON_CONSULTAS)
+    )
+
+async def consultas_por_peticion(cliente, antes, esperadas):
+    # El middleware registra la petición después de enviar la respuesta: con un
+    # servidor real el último contador puede llegar unos milisegundos tarde
+    for _ in range(50):
+        peticiones, consultas = await contadores(cliente)
+        if peticiones - antes[0] >= esperadas:
+            break
+        await asyncio.sleep(0.01)
+    if peticiones == antes[0]:
+        return 0.0
+    return round((consultas - antes[1]) / (peticiones - antes[0]), 2)
+
+async def correr_escenario(cliente, ctx, escenario, total, concurrencia):
+    nombre, metodo, armar = escenario
+    latencias = []
+    errores = 0
+    semaforo = asyncio.Semaphore(concurrencia)
+
+    async def una(i):
+        nonlocal errores
+        url, cuerpo = armar(ctx, i)
+        contenido = {"data": cuerpo} if isinstance(cuerpo, Formulario) else {"json": cuerpo}
+        async with semaforo:
+            inicio = time.perf_counter()
+            respuesta = await cliente.request(metodo, url, headers=ctx.cabeceras, **contenido)
+            latencias.append(time.perf_counter() - inicio)
+        if respuesta.status_code >= 400:
+            errores += 1
+
+    antes = await contadores(cliente)
+    inicio = time.perf_counter()
+    await asyncio.gather(*(una(i) for i in range(total)))
+    duracion = time.perf_counter() - inicio
+
+    return {
+        "escenario": nombre,
+        "peticiones": total,
+        "concurrencia": concurrencia,
+        "errores": errores,
+        "peticiones_por_segundo": round(total / duracion, 1),
+        "p50_ms": round(percentil(latencias, 0.50) * 1000, 3),
+        "p95_ms": round(percentil(latencias, 0.95) * 1000, 3),
+        "p99_ms": round(percentil(latencias, 0.99) * 1000, 3),
+        "consultas_por_peticion": await consultas_por_peticion(
+            cliente, antes, 0 if nombre == "metricas" else total
+        ),
+    }
+
+async def preparar_sesion(cliente, ctx):
+    """Registra USUARIO_CARGA, inicia sesión y crea una tarea para los escenarios autenticados"""
+    await cliente.post("/auth/register", json=USUARIO_CARGA)
+    respuesta = await cliente.post("/auth/login", data={
+        "username": USUARIO_CARGA["email"], "password": USUARIO_CARGA["password"]
+    })
+    respuesta.raise_for_status()
+    ctx.cabeceras = {"Authorization": f"Bearer {respuesta.json()['access_token']}"}
+    respuesta = await cliente.post("/tasks/", headers=ctx.cabeceras, json={
+        "title": "Tarea de carga", "description": "Carga", "priority": "low"
+    })
+    respuesta.raise_for_status()
+    ctx.tarea = respuesta.json()["id"]
+
+async def correr_escenarios(cliente, ctx, args, leer_rss):
+    await preparar_sesion(cliente, ctx)
+    resultados = []
+    for escenario in ESCENARIOS:
+        total = min(args.peticiones, MAXIMO_PETICIONES.get(escenario[0], args.peticiones))
+        resultado = await correr_escenario(cliente, ctx, escenario, total, args.concurrencia)
+        resultado["rss_pico_mb"] = leer_rss()
+        resultados.append(resultado)
+        print(f"  {resultado['escenario']:<22} {resultado['peticiones_por_segundo']:>9.1f} req/s "
+              f"p50 {resultado['p50_ms']:>8.2f} p95 {resultado['p95_ms']:>8.2f} "
+              f"p99 {resultado['p99_ms']:>8.2f} ms  {resultado['consultas_por_peticion']:>5.2f} SQL/req "
+              f"errores {resultado['errores']}")
+    return resultados
+
+def en_proceso(url_bd, ctx, args):
+    """La app se ejecuta en este proceso a través de httpx.ASGITransport"""
+    from sqlalchemy.orm import sessionmaker
+
+    import cache
+    from database import crear_engine, get_db
+    from main import app
+
+    engine = crear_engine(url_bd)
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    def sesion():
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    async def correr():
+        transporte = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transporte, base_url="http://carga") as cliente:
+            return await correr_escenarios(cliente, ctx, args, rss_pico_mb)
+
+    app.dependency_overrides[get_db] = sesion
+    cache.respuestas.limpiar()
+    reiniciar_rss_pico()
+    try:
+        return asyncio.run(correr())
+    finally:
+        app.dependency_overrides.clear()
+        engine.dispose()
+
+def puerto_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def por_http(url_bd, ctx, args):
+    """La app corre en un proceso uvicorn aparte; se mide su memoria desde /proc"""
+    puerto = puerto_libre()
+    entorno = dict(os.environ, LIBRERIA_DATABASE_URL=url_bd)
+    servidor = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(puerto), "--log-level", "warning"],
+        env=entorno
+    )
+    base = f"http://127.0.0.1:{puerto}"
+    try:
+        for _ in range(200):
+            try:
+                httpx.get(base + "/")
+                break
+            except httpx.TransportError:
+                time.sleep(0.05)
+        else:
+            raise RuntimeError("el servidor uvicorn no respondió")
+
+        async def correr():
+            limites = httpx.Limits(max_connections=args.concurrencia)
+            async with httpx.AsyncClient(base_url=base, limits=limites, timeout=60) as cliente:
+                return await correr_escenarios(cliente, ctx, args, lambda: rss_pico_mb(servidor.pid))
+
+        return asyncio.run(correr())
+    finally:
+        servidor.terminate()
+        servidor.wait()
+
+def version_git():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def comparar(resultados, base, tolerancia):
+    """Imprime las diferencias contra la corrida base y devuelve cuántas son regresiones"""
+    anteriores = {(r["tamano"], r["modo"], r["escenario"]): r for r in base["resultados"]}
+    regresiones = 0
+    print(f"\nComparación contra {base['metadatos'].get('commit')} (tolerancia {tolerancia:.0%})")
+    for actual in resultados:
+        anterior = anteriores.get((actual["tamano"], actual["modo"], actual["escenario"]))
+        if anterior is None:
+            continue
+        rps = actual["peticiones_por_segundo"] / anterior["peticiones_por_segundo"] - 1
+        p95 = actual["p95_ms"] / anterior["p95_ms"] - 1 if anterior["p95_ms"] else 0
+        consultas = actual["consultas_por_peticion"] - anterior["consultas_por_peticion"]
+        # En rutas cacheadas las fallas concurrentes mueven algunas centésimas
+        # el promedio de SQL; media consulta más por petición ya es un cambio real
+        regresion = rps < -tolerancia or p95 > tolerancia or consultas > 0.5
+        regresiones += regresion
+        print(f"  {actual['tamano']:>8} {actual['modo']:<9} {actual['escenario']:<22} "
+              f"req/s {rps:+7.1%}  p95 {p95:+7.1%}  SQL/req {consultas:+.2f}"
+              + ("  REGRESIÓN" if regresion else ""))
+    return regresiones
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tamanos", type=int, nargs="+", default=TAMANOS)
+    parser.add_argument("--modos", nargs="+", choices=MODOS, default=MODOS)
+    parser.add_argument("--peticiones", type=int, default=200, help="Peticiones por escenario (las exportaciones, hasta MAXIMO_PETICIONES)")
+    parser.add_argument("--concurrencia", type=int, default=10)
+    parser.add_argument("--salida", default="benchmarks/resultados.json")
+    parser.add_argument("--base", help="Resultados JSON de una corrida anterior para comparar")
+    parser.add_argument("--tolerancia", type=float, default=0.15,
+                        help="Variación relativa aceptada antes de marcar una regresión")
+    args = parser.parse_args()
+
+    ejecutores = {"inproceso": en_proceso, "http": por_http}
+    resultados = []
+    for tamano in args.tamanos:
+        for modo in args.modos:
+            # Cada modo parte de un catálogo recién sembrado: las escrituras lo modifican
+            engine, _ = crear_base_temporal()
+            inicio = time.perf_counter()
+            sembrar(engine, tamano, semilla=SEMILLA, realista=True)
+            url_bd = engine.url.render_as_string(hide_password=False)
+            engine.dispose()
+            print(f"{tamano} libros, modo {modo} (sembrado en {time.perf_counter() - inicio:.1f} s)")
+            for resultado in ejecutores[modo](url_bd, Contexto(tamano), args):
+                resultados.append({"tamano": tamano, "modo": modo, **resultado})
+
+    informe = {
+        "metadatos": {
+            "fecha": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": version_git(),
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "peticiones": args.peticiones,
+            "concurrencia": args.concurrencia,
+        },
+        "resultados": resultados,
+    }
+    with open(args.salida, "w", encoding="utf-8") as archivo:
+        json.dump(informe, archivo, indent=2, ensure_ascii=False)
+    print(f"\nResultados guardados en {args.salida}")
+
+    if args.base:
+        with open(args.base, encoding="utf-8") as archivo:
+            if comparar(resultados, json.load(archivo), args.tolerancia):
+                sys.exit(1)
+
+if __name__ == "__main__":
+    main()
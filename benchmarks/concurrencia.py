@@ -0,0 +1,77 @@
+"""Peticiones/s y latencia p50/p99 de los handlers con Session (threadpool) vs AsyncSession.
+
+Uso: python -m benchmarks.concurrencia [--libros N] [--peticiones N] [--concurrencia C ...]
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+from benchmarks.datos import crear_base_temporal, sembrar
+from benchmarks.medicion import percentil
+from database import crear_async_engine, get_db
+from main import app
+
+RUTAS = ["/autores/{id}", "/libros/?limit=20&after={id}", "/libros/buscar/?autor_id={id}", "/estadisticas/"]
+
+async def disparar(total, concurrencia, max_id):
+    transporte = httpx.ASGITransport(app=app)
+    latencias = []
+    semaforo = asyncio.Semaphore(concurrencia)
+
+    async with httpx.AsyncClient(transport=transporte, base_url="http://bench") as cliente:
+        async def una(i):
+            ruta = RUTAS[i % len(RUTAS)].format(id=1 + (i * 7919) % max_id)
+            async with semaforo:
+                inicio = time.perf_counter()
+                respuesta = await cliente.get(ruta)
+                latencias.append(time.perf_counter() - inicio)
+                respuesta.raise_for_status()
+
+        inicio = time.perf_counter()
+        await asyncio.gather(*(una(i) for i in range(total)))
+        duracion = time.perf_counter() - inicio
+    return total / duracion, latencias
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--libros", type=int, default=10_000)
+    parser.add_argument("--peticiones", type=int, default=2_000)
+    parser.add_argument("--concurrencia", type=int, nargs="+", default=[1, 10, 50, 200])
+    args = parser.parse_args()
+
+    engine, SessionLocal = crear_base_temporal()
+    sembrar(engine, args.libros)
+    max_id = max(1, args.libros // 10)
+    async_engine, AsyncSessionLocal = crear_async_engine(
+        str(engine.url).replace("sqlite://", "sqlite+aiosqlite://", 1)
+    )
+
+    def sesion_sync():
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    async def sesion_async():
+        async with AsyncSessionLocal() as db:
+            yield db
+
+    async def medir_todo():
+        print(f"{'modo':>6} {'conc':>5} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8}")
+        for modo, dependencia in (("sync", sesion_sync), ("async", sesion_async)):
+            app.dependency_overrides[get_db] = dependencia
+            for concurrencia in args.concurrencia:
+                rps, latencias = await disparar(args.peticiones, concurrencia, max_id)
+                print(f"{modo:>6} {concurrencia:>5} {rps:>9.1f} "
+                      f"{statistics.median(latencias) * 1000:>8.2f} {percentil(latencias, 0.99) * 1000:>8.2f}")
+        app.dependency_overrides.clear()
+        await async_engine.dispose()
+
+    asyncio.run(medir_todo())
+
+if __name__ == "__main__":
+    main()
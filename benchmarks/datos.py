@@ -0,0 +1,65 @@
+"""Generación de catálogos sintéticos para los benchmarks"""
+import os
+import random
+import tempfile
+
+from sqlalchemy import insert
+from sqlalchemy.orm import sessionmaker
+
+import models
+from database import Base, crear_engine
+
+TAMANO_LOTE = 10_000
+
+def crear_base_temporal(nombre="benchmark.db"):
+    """Engine y fábrica de sesiones sobre un archivo SQLite nuevo en un directorio temporal"""
+    ruta = os.path.join(tempfile.mkdtemp(prefix="libreria-"), nombre)
+    engine = crear_engine(f"sqlite:///{ruta}")
+    Base.metadata.create_all(bind=engine)
+    return engine, sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def vocabulario_realista(semilla, tamano=5_000):
+    """Títulos, nombres y nacionalidades generados con Faker (con tildes y eñes).
+
+    Se genera un conjunto acotado y luego se muestrea: llamar a Faker por fila
+    haría que sembrar un millón de libros tarde minutos.
+    """
+    from faker import Faker
+
+    fake = Faker("es_ES")
+    fake.seed_instance(semilla)
+    return {
+        "titulos": [fake.sentence(nb_words=4).rstrip(".") for _ in range(tamano)],
+        "nombres": [fake.name() for _ in range(tamano)],
+        "nacionalidades": [fake.country() for _ in range(200)],
+    }
+
+def sembrar(engine, total_libros, libros_por_autor=10, semilla=42, realista=False):
+    """Inserta `total_libros` libros repartidos entre autores con executemany por lotes.
+
+    Con `realista` los textos salen de Faker en lugar de "Libro N"/"Autor N".
+    """
+    aleatorio = random.Random(semilla)
+    total_autores = max(1, total_libros // libros_por_autor)
+    vocabulario = vocabulario_realista(semilla) if realista else None
+
+    def elegir(clave, sintetico):
+        return aleatorio.choice(vocabulario[clave]) if vocabulario else sintetico
+
+    with engine.begin() as conn:
+        for inicio in range(0, total_autores, TAMANO_LOTE):
+            conn.execute(insert(models.Autor), [
+                {"id": i + 1, "nombre": elegir("nombres", f"Autor {i}"),
+                 "nacionalidad": elegir("nacionalidades", "Colombiana")}
+                for i in range(inicio, min(inicio + TAMANO_LOTE, total_autores))
+            ])
+        for inicio in range(0, total_libros, TAMANO_LOTE):
+            conn.execute(insert(models.Libro), [
+                {
+                    "titulo": elegir("titulos", f"Libro {i}"),
+                    "precio": round(aleatorio.uniform(5, 150), 2),
+                    "paginas": aleatorio.randint(50, 1200),
+                    "autor_id": aleatorio.randint(1, total_autores),
+                }
+                for i in range(inicio, min(inicio + TAMANO_LOTE, total_libros))
+            ])
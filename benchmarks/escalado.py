@@ -0,0 +1,122 @@
+"""Escalado de peticiones/s con serve.py de 1 a N workers.
+
+Siembra un catálogo, levanta `serve.py --workers W` para cada W y lo carga con
+una mezcla de lecturas (caché de respuestas desactivada para medir el trabajo
+real) desde uno o más procesos cliente.
+
+Uso: python -m benchmarks.escalado [--libros N] [--workers 1 2 4 ...] [--peticiones N]
+                                   [--concurrencia C] [--procesos-cliente K]
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+from benchmarks.carga import ESCENARIOS, Contexto, puerto_libre
+from benchmarks.datos import crear_base_temporal, sembrar
+from benchmarks.medicion import percentil
+
+LECTURAS = ["libros_pagina", "autor_con_libros", "buscar_autor_id", "buscar_rango_precio", "libros_pagina_rapido"]
+
+def workers_por_defecto():
+    cpus = os.cpu_count() or 1
+    cantidades = [1]
+    while cantidades[-1] * 2 <= cpus:
+        cantidades.append(cantidades[-1] * 2)
+    if cantidades[-1] != cpus:
+        cantidades.append(cpus)
+    return cantidades
+
+def disparar(base, total_libros, inicio, total, concurrencia):
+    """Proceso cliente: `total` lecturas con `concurrencia` en vuelo; devuelve las latencias"""
+    ctx = Contexto(total_libros)
+    escenarios = [escenario for escenario in ESCENARIOS if escenario[0] in LECTURAS]
+
+    async def correr():
+        latencias = []
+        semaforo = asyncio.Semaphore(concurrencia)
+        limites = httpx.Limits(max_connections=concurrencia)
+        async with httpx.AsyncClient(base_url=base, limits=limites, timeout=60) as cliente:
+            async def una(i):
+                _, metodo, armar = escenarios[i % len(escenarios)]
+                url, _ = armar(ctx, i)
+                async with semaforo:
+                    comienzo = time.perf_counter()
+                    respuesta = await cliente.request(metodo, url)
+                    latencias.append(time.perf_counter() - comienzo)
+                respuesta.raise_for_status()
+
+            await asyncio.gather(*(una(i) for i in range(inicio, inicio + total)))
+        return latencias
+
+    return asyncio.run(correr())
+
+def esperar_servidor(base, servidor):
+    for _ in range(300):
+        if servidor.poll() is not None:
+            raise RuntimeError("serve.py terminó antes de estar listo")
+        try:
+            httpx.get(base + "/")
+            return
+        except httpx.TransportError:
+            time.sleep(0.05)
+    raise RuntimeError("serve.py no respondió")
+
+def medir(url_bd, workers, args):
+    puerto = puerto_libre()
+    entorno = dict(os.environ, LIBRERIA_DATABASE_URL=url_bd, LIBRERIA_CACHE="0")
+    servidor = subprocess.Popen(
+        [sys.executable, "serve.py", "--workers", str(workers), "--puerto", str(puerto),
+         "--sin-migrar", "--log-level", "warning"],
+        env=entorno
+    )
+    base = f"http://127.0.0.1:{puerto}"
+    try:
+        esperar_servidor(base, servidor)
+        disparar(base, args.libros, 0, 100, args.concurrencia)  # calentamiento
+
+        por_cliente = args.peticiones // args.procesos_cliente
+        trabajos = [
+            (base, args.libros, i * por_cliente, por_cliente, args.concurrencia)
+            for i in range(args.procesos_cliente)
+        ]
+        with multiprocessing.get_context("spawn").Pool(args.procesos_cliente) as pool:
+            inicio = time.perf_counter()
+            resultados = pool.starmap(disparar, trabajos)
+            duracion = time.perf_counter() - inicio
+        latencias = [latencia for parcial in resultados for latencia in parcial]
+        return len(latencias) / duracion, latencias
+    finally:
+        servidor.terminate()
+        servidor.wait()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--libros", type=int, default=100_000)
+    parser.add_argument("--workers", type=int, nargs="+", default=workers_por_defecto())
+    parser.add_argument("--peticiones", type=int, default=4_000)
+    parser.add_argument("--concurrencia", type=int, default=32, help="Peticiones en vuelo por proceso cliente")
+    parser.add_argument("--procesos-cliente", type=int, default=1)
+    args = parser.parse_args()
+
+    engine, _ = crear_base_temporal()
+    sembrar(engine, args.libros, realista=True)
+    url_bd = engine.url.render_as_string(hide_password=False)
+    engine.dispose()
+
+    print(f"CPUs: {os.cpu_count()}  libros: {args.libros}  clientes: {args.procesos_cliente}")
+    print(f"{'workers':>8} {'req/s':>9} {'escalado':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    referencia = None
+    for workers in args.workers:
+        rps, latencias = medir(url_bd, workers, args)
+        referencia = referencia or rps
+        print(f"{workers:>8} {rps:>9.1f} {rps / referencia:>8.2f}x "
+              f"{percentil(latencias, 0.50) * 1000:>8.2f} {percentil(latencias, 0.99) * 1000:>8.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""Compara las estrategias de /estadisticas/ sobre catálogos de distinto tamaño.
+
+Uso: python -m benchmarks.estadisticas [tamaño ...]   (por defecto 10000 100000 1000000)
+"""
+import sys
+import time
+
+import crud
+import models
+from benchmarks.datos import crear_base_temporal, sembrar
+
+TAMANOS = [10_000, 100_000, 1_000_000]
+REPETICIONES = 5
+
+def estadisticas_en_python(db):
+    """Implementación original: hidrata todos los libros para calcular los precios"""
+    total_libros = db.query(models.Libro).count()
+    total_autores = db.query(models.Autor).count()
+    precios = [libro.precio for libro in db.query(models.Libro).all()]
+    return total_libros, total_autores, sum(precios) / len(precios), max(precios), min(precios)
+
+ESTRATEGIAS = {
+    "python": estadisticas_en_python,
+    "sql": crud.calcular_estadisticas,
+    "materializada": crud.leer_estadisticas_materializadas,
+}
+
+def medir(SessionLocal, funcion):
+    tiempos = []
+    for _ in range(REPETICIONES):
+        db = SessionLocal()
+        try:
+            inicio = time.perf_counter()
+            funcion(db)
+            tiempos.append(time.perf_counter() - inicio)
+        finally:
+            db.close()
+    return min(tiempos)
+
+def main(tamanos):
+    print(f"{'libros':>10} " + " ".join(f"{nombre:>15}" for nombre in ESTRATEGIAS))
+    for tamano in tamanos:
+        engine, SessionLocal = crear_base_temporal()
+        sembrar(engine, tamano)
+        tiempos = [medir(SessionLocal, funcion) for funcion in ESTRATEGIAS.values()]
+        print(f"{tamano:>10} " + " ".join(f"{t * 1000:>12.2f} ms" for t in tiempos))
+        engine.dispose()
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or TAMANOS)
@@ -0,0 +1,77 @@
+"""Throughput y memoria de GET /export/libros en cada formato.
+
+Levanta uvicorn sobre una base con `tamaño` libros y descarga la exportación
+completa en CSV, NDJSON y, si pyarrow está instalado, Arrow IPC y Parquet,
+sin compresión. Reporta filas/s, MB/s, tiempo al primer byte, tamaño total y
+el pico de memoria residente del servidor durante la descarga: con el cursor
+por lotes debe quedar parejo entre tamaños.
+
+Uso: python -m benchmarks.exportacion [tamaño ...]   (por defecto 100000 1000000)
+"""
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+import exportacion
+from benchmarks.carga import puerto_libre
+from benchmarks.datos import crear_base_temporal, sembrar
+from benchmarks.escalado import esperar_servidor
+from benchmarks.medicion import reiniciar_rss_pico, rss_pico_mb
+
+TAMANOS = [100_000, 1_000_000]
+FORMATOS = ["csv", "ndjson"] + (list(exportacion.FORMATOS_ARROW) if exportacion.pa is not None else [])
+
+def descargar(base, formato):
+    """(segundos, segundos al primer byte, bytes) de una exportación completa"""
+    inicio = time.perf_counter()
+    primer_byte = None
+    total = 0
+    with httpx.stream("GET", f"{base}/export/libros?formato={formato}",
+                      headers={"Accept-Encoding": "identity"}, timeout=600) as respuesta:
+        respuesta.raise_for_status()
+        for parte in respuesta.iter_raw():
+            if primer_byte is None:
+                primer_byte = time.perf_counter() - inicio
+            total += len(parte)
+    return time.perf_counter() - inicio, primer_byte, total
+
+def medir(url_bd, tamano):
+    puerto = puerto_libre()
+    # Sin mmap las páginas leídas del archivo no cuentan como memoria del
+    # proceso: el RSS refleja lo que la exportación retiene (más la caché de SQLite)
+    entorno = dict(os.environ, LIBRERIA_DATABASE_URL=url_bd, LIBRERIA_SQLITE_MMAP_SIZE="0")
+    servidor = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(puerto), "--log-level", "warning"],
+        env=entorno
+    )
+    base = f"http://127.0.0.1:{puerto}"
+    try:
+        esperar_servidor(base, servidor)
+        reposo = rss_pico_mb(servidor.pid)
+        for formato in FORMATOS:
+            descargar(base, formato)  # calentamiento (caché de páginas de SQLite, imports)
+            reiniciar_rss_pico(servidor.pid)
+            segundos, primer_byte, total = descargar(base, formato)
+            print(f"{tamano:>9} {formato:>8} {tamano / segundos:>11,.0f} {total / segundos / 2**20:>7.1f} "
+                  f"{primer_byte * 1000:>8.1f} {total / 2**20:>8.1f} {rss_pico_mb(servidor.pid):>9} {reposo:>9}")
+    finally:
+        servidor.terminate()
+        servidor.wait()
+
+def main():
+    tamanos = [int(argumento) for argumento in sys.argv[1:]] or TAMANOS
+    print(f"lote {exportacion.EXPORT_LOTE} filas")
+    print(f"{'libros':>9} {'formato':>8} {'filas/s':>11} {'MB/s':>7} {'1er B ms':>8} "
+          f"{'MB':>8} {'RSS pico':>9} {'RSS base':>9}")
+    for tamano in tamanos:
+        engine, _ = crear_base_temporal()
+        sembrar(engine, tamano, realista=True)
+        url_bd = engine.url.render_as_string(hide_password=False)
+        engine.dispose()
+        medir(url_bd, tamano)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Bytes enviados y tiempo de codificación de GET /libros/ en cada formato.
+
+Combina JSON o MessagePack, forma anidada o normalizada (`autores` por id) y
+sin compresión, gzip o brotli. El tiempo incluye serializar y comprimir las
+filas ya leídas (la consulta es la misma en todos los casos).
+
+Uso: python -m benchmarks.formatos [tamaño ...]   (por defecto 1000 10000 100000)
+"""
+import sys
+import time
+
+import compresion
+import crud
+import serializacion
+from benchmarks.datos import crear_base_temporal, sembrar
+
+TAMANOS = [1_000, 10_000, 100_000]
+REPETICIONES = 5
+
+CODIFICADORES = {"json": serializacion.codificar_json}
+if serializacion.msgpack is not None:
+    CODIFICADORES["msgpack"] = serializacion.codificar_msgpack
+
+COMPRESIONES = ["-", "gzip"] + (["br"] if compresion.brotli is not None else [])
+
+def leer_filas(SessionLocal):
+    proyeccion = serializacion.LIBRO_CON_AUTOR
+    db = SessionLocal()
+    try:
+        return proyeccion.filas(proyeccion.aplicar(crud.consulta_libros(db)))
+    finally:
+        db.close()
+
+def medir(libros, codificar, normalizada, codificacion):
+    tiempos = []
+    for _ in range(REPETICIONES):
+        copia = [dict(libro) for libro in libros]  # separar_autores modifica las filas
+        inicio = time.perf_counter()
+        contenido = serializacion.separar_autores(copia) if normalizada else copia
+        cuerpo = codificar(contenido)
+        if codificacion != "-":
+            cuerpo = compresion.comprimir(cuerpo, codificacion)
+        tiempos.append(time.perf_counter() - inicio)
+    return len(cuerpo), min(tiempos)
+
+def main(tamanos):
+    print(f"gzip nivel {compresion.NIVEL_GZIP}, brotli calidad {compresion.CALIDAD_BROTLI}")
+    for tamano in tamanos:
+        engine, SessionLocal = crear_base_temporal()
+        sembrar(engine, tamano, realista=True)
+        libros = leer_filas(SessionLocal)
+        engine.dispose()
+
+        print(f"\n{tamano} libros")
+        print(f"{'formato':>10} {'forma':>12} {'compresión':>10} {'bytes':>12} {'vs json':>8} {'ms':>9}")
+        referencia = None
+        for nombre, codificar in CODIFICADORES.items():
+            for normalizada in (False, True):
+                for codificacion in COMPRESIONES:
+                    tamano_cuerpo, tiempo = medir(libros, codificar, normalizada, codificacion)
+                    referencia = referencia or tamano_cuerpo
+                    print(f"{nombre:>10} {'normalizada' if normalizada else 'anidada':>12} {codificacion:>10} "
+                          f"{tamano_cuerpo:>12,} {tamano_cuerpo / referencia:>7.0%} {tiempo * 1000:>9.1f}")
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or TAMANOS)
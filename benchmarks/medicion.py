@@ -0,0 +1,34 @@
+"""Utilidades de medición compartidas por los benchmarks"""
+import os
+import resource
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p))]
+
+def _estado_proceso(pid, campo):
+    """Valor en kB de un campo de /proc/<pid>/status (solo Linux), o None"""
+    try:
+        with open(f"/proc/{pid}/status") as archivo:
+            for linea in archivo:
+                if linea.startswith(campo + ":"):
+                    return int(linea.split()[1])
+    except OSError:
+        pass
+    return None
+
+def reiniciar_rss_pico(pid="self"):
+    """Reinicia el pico de memoria residente (VmHWM) si el kernel lo permite"""
+    try:
+        with open(f"/proc/{pid}/clear_refs", "w") as archivo:
+            archivo.write("5")
+    except OSError:
+        pass
+
+def rss_pico_mb(pid="self"):
+    """Pico de memoria residente del proceso en MiB"""
+    kb = _estado_proceso(pid, "VmHWM")
+    if kb is None and pid in ("self", os.getpid()):
+        # ru_maxrss está en kB en Linux: es el pico de toda la vida del proceso
+        kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return None if kb is None else round(kb / 1024, 1)
@@ -0,0 +1,63 @@
+"""Costo por fila de GET /libros/: modelos Pydantic por fila vs. columnas planas + orjson.
+
+Uso: python -m benchmarks.serializacion [tamaño ...]   (por defecto 1000 10000 100000)
+"""
+import sys
+import time
+from typing import List
+
+from pydantic import TypeAdapter
+
+import crud
+import schemas
+import serializacion
+from benchmarks.datos import crear_base_temporal, sembrar
+
+TAMANOS = [1_000, 10_000, 100_000]
+REPETICIONES = 5
+
+ADAPTADOR = TypeAdapter(List[schemas.LibroConAutor])
+
+def ruta_orm(db):
+    """Camino actual: objetos ORM con joinedload, validados y serializados por Pydantic"""
+    libros = crud.consulta_libros(db).all()
+    return ADAPTADOR.dump_json(ADAPTADOR.validate_python(libros, from_attributes=True))
+
+def ruta_rapida(db):
+    proyeccion = serializacion.LIBRO_CON_AUTOR
+    return serializacion.codificar_json(proyeccion.filas(proyeccion.aplicar(crud.consulta_libros(db))))
+
+RUTAS = {"orm+pydantic": ruta_orm, "columnas+json": ruta_rapida}
+
+def medir(SessionLocal, funcion):
+    tiempos = []
+    for _ in range(REPETICIONES):
+        db = SessionLocal()
+        try:
+            inicio = time.perf_counter()
+            cuerpo = funcion(db)
+            tiempos.append(time.perf_counter() - inicio)
+        finally:
+            db.close()
+    return min(tiempos), cuerpo
+
+def main(tamanos):
+    codificador = "orjson" if serializacion.orjson is not None else "json"
+    print(f"codificador: {codificador}")
+    print(f"{'libros':>10} " + " ".join(f"{nombre:>22}" for nombre in RUTAS) + f" {'aceleración':>12}")
+    for tamano in tamanos:
+        engine, SessionLocal = crear_base_temporal()
+        sembrar(engine, tamano)
+        resultados = [medir(SessionLocal, funcion) for funcion in RUTAS.values()]
+        cuerpos = {cuerpo for _, cuerpo in resultados}
+        assert len(cuerpos) == 1, "las rutas producen cuerpos distintos"
+        tiempos = [tiempo for tiempo, _ in resultados]
+        print(
+            f"{tamano:>10} "
+            + " ".join(f"{t * 1000:>9.1f} ms {t / tamano * 1e6:>6.2f} µs/f" for t in tiempos)
+            + f" {tiempos[0] / tiempos[1]:>11.1f}x"
+        )
+        engine.dispose()
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or TAMANOS)
@@ -0,0 +1,312 @@
+"""Caché de respuestas de lectura con invalidación por etiquetas y ETag"""
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from functools import lru_cache
+from typing import Any
+
+from fastapi import Request, Response
+from pydantic import TypeAdapter
+
+CACHE_HABILITADA = os.getenv("LIBRERIA_CACHE", "1").lower() in ("1", "true", "si")
+CACHE_TTL = float(os.getenv("LIBRERIA_CACHE_TTL", "60"))
+CACHE_MAX_ENTRADAS = int(os.getenv("LIBRERIA_CACHE_MAX_ENTRADAS", "1024"))
+COALESCER_HABILITADO = os.getenv("LIBRERIA_COALESCER", "1").lower() in ("1", "true", "si")
+
+
+class BackendCache:
+    """Interfaz mínima que debe cumplir un almacén (LRU en proceso, Redis, ...).
+
+    Cada entrada se guarda con un conjunto de etiquetas; invalidar una
+    etiqueta elimina todas las entradas que la tienen.
+    """
+
+    def obtener(self, clave: str):
+        raise NotImplementedError
+
+    def guardar(self, clave: str, valor, etiquetas, ttl: float):
+        raise NotImplementedError
+
+    def invalidar(self, etiquetas) -> int:
+        raise NotImplementedError
+
+    def limpiar(self):
+        raise NotImplementedError
+
+    def __len__(self):
+        raise NotImplementedError
+
+
+class CacheLRU(BackendCache):
+    """Caché en memoria acotada por número de entradas y con expiración por TTL"""
+
+    def __init__(self, max_entradas: int = CACHE_MAX_ENTRADAS, reloj=time.monotonic):
+        self.max_entradas = max_entradas
+        self.reloj = reloj
+        self.expulsiones = 0
+        self._entradas = OrderedDict()  # clave -> (expira, valor, etiquetas)
+        self._por_etiqueta = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def obtener(self, clave):
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                return None
+            if entrada[0] <= self.reloj():
+                self._quitar(clave)
+                return None
+            self._entradas.move_to_end(clave)
+            return entrada[1]
+
+    def guardar(self, clave, valor, etiquetas, ttl):
+        with self._lock:
+            if clave in self._entradas:
+                self._quitar(clave)
+            self._entradas[clave] = (self.reloj() + ttl, valor, frozenset(etiquetas))
+            for etiqueta in etiquetas:
+                self._por_etiqueta[etiqueta].add(clave)
+            while len(self._entradas) > self.max_entradas:
+                self._quitar(next(iter(self._entradas)))
+                self.expulsiones += 1
+
+    def invalidar(self, etiquetas):
+        with self._lock:
+            claves = set()
+            for etiqueta in etiquetas:
+                claves |= self._por_etiqueta.pop(etiqueta, set())
+            for clave in claves:
+                self._quitar(clave)
+            return len(claves)
+
+    def limpiar(self):
+        with self._lock:
+            self._entradas.clear()
+            self._por_etiqueta.clear()
+
+    def _quitar(self, clave):
+        _, _, etiquetas = self._entradas.pop(clave)
+        for etiqueta in etiquetas:
+            claves = self._por_etiqueta.get(etiqueta)
+            if claves is not None:
+                claves.discard(clave)
+                if not claves:
+                    del self._por_etiqueta[etiqueta]
+
+    def __len__(self):
+        return len(self._entradas)
+
+
+class CacheRespuestas:
+    """Cuerpos JSON ya serializados y su ETag, con contadores de aciertos y fallos"""
+
+    def __init__(self, backend: BackendCache, ttl: float = CACHE_TTL, habilitada: bool = CACHE_HABILITADA):
+        self.backend = backend
+        self.ttl = ttl
+        self.habilitada = habilitada
+        self.aciertos = 0
+        self.fallos = 0
+        self.invalidaciones = 0
+        # Cambia en cada invalidación: una respuesta calculada antes de una
+        # escritura concurrente no se guarda
+        self.version = 0
+
+    def obtener(self, clave):
+        entrada = self.backend.obtener(clave) if self.habilitada else None
+        if entrada is None:
+            self.fallos += 1
+        else:
+            self.aciertos += 1
+        return entrada
+
+    def guardar(self, clave, entrada, etiquetas, version=None):
+        if self.habilitada and (version is None or version == self.version):
+            self.backend.guardar(clave, entrada, etiquetas, self.ttl)
+
+    def invalidar(self, *etiquetas):
+        self.version += 1
+        self.invalidaciones += self.backend.invalidar(etiquetas)
+
+    def limpiar(self):
+        self.backend.limpiar()
+        self.aciertos = self.fallos = self.invalidaciones = 0
+
+    def metricas(self):
+        return {
+            "habilitada": self.habilitada,
+            "entradas": len(self.backend),
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "invalidaciones": self.invalidaciones,
+            "expulsiones": getattr(self.backend, "expulsiones", 0),
+        }
+
+
+class Coalescedor:
+    """Single-flight: peticiones idénticas concurrentes comparten una sola ejecución.
+
+    La primera petición con una clave (la líder) lanza `producir()` como
+    tarea; las que llegan mientras sigue en vuelo esperan esa misma tarea y
+    reciben su resultado (o su excepción). Si una de las que esperan se
+    cancela, la tarea sigue para las demás. `producir` usa la sesión de la
+    líder, que se cierra apenas esta sale: si se cancela la líder, la tarea se
+    cancela cuando nadie más la espera y, en cualquier caso, la líder no sale
+    hasta que la tarea termine.
+    """
+
+    def __init__(self, habilitado: bool = COALESCER_HABILITADO):
+        self.habilitado = habilitado
+        self.ejecuciones = 0
+        self.compartidas = 0
+        self._en_vuelo = {}
+        self._seguidoras = {}  # tarea -> peticiones no líderes que la esperan
+
+    async def compartir(self, clave, producir):
+        if not self.habilitado:
+            return await producir()
+        tarea = self._en_vuelo.get(clave)
+        if tarea is None:
+            tarea = asyncio.ensure_future(producir())
+            self._en_vuelo[clave] = tarea
+            tarea.add_done_callback(lambda _: self._terminar(clave, tarea))
+            self.ejecuciones += 1
+            try:
+                return await asyncio.shield(tarea)
+            except asyncio.CancelledError:
+                await self._soltar(clave, tarea)
+                raise
+
+        self.compartidas += 1
+        self._seguidoras[tarea] = self._seguidoras.get(tarea, 0) + 1
+        try:
+            return await asyncio.shield(tarea)
+        finally:
+            self._seguidoras[tarea] -= 1
+            if not self._seguidoras[tarea]:
+                del self._seguidoras[tarea]
+
+    async def _soltar(self, clave, tarea):
+        """La líder se canceló: sin seguidoras cancela la tarea, y espera a que termine"""
+        if not self._seguidoras.get(tarea):
+            if self._en_vuelo.get(clave) is tarea:
+                del self._en_vuelo[clave]  # Nadie se suma a una ejecución cancelada
+            tarea.cancel()
+        # Una función sync en el threadpool no se interrumpe: sigue usando la
+        # sesión hasta volver, aunque se vuelva a cancelar la petición
+        while not tarea.done():
+            try:
+                await asyncio.wait([tarea])
+            except asyncio.CancelledError:
+                pass
+
+    def _terminar(self, clave, tarea):
+        if self._en_vuelo.get(clave) is tarea:
+            del self._en_vuelo[clave]
+        if not tarea.cancelled():
+            tarea.exception()  # ya se propagó a quienes esperaban; evita el aviso de asyncio
+
+    def __len__(self):
+        return len(self._en_vuelo)
+
+    def metricas(self):
+        return {
+            "habilitado": self.habilitado,
+            "en_vuelo": len(self),
+            "ejecuciones": self.ejecuciones,
+            "compartidas": self.compartidas,
+        }
+
+
+respuestas = CacheRespuestas(CacheLRU())
+coalescedor = Coalescedor()
+
+# Etiquetas usadas por las rutas cacheadas y por las escrituras que las invalidan
+ETIQUETA_AUTORES = "autores"
+ETIQUETA_ESTADISTICAS = "estadisticas"
+
+def etiqueta_autor(autor_id) -> str:
+    return f"autor:{autor_id}"
+
+
+def clave_de(request: Request) -> str:
+    """Ruta más parámetros de consulta ordenados, para que ?a=1&b=2 y ?b=2&a=1 coincidan"""
+    parametros = "&".join(f"{k}={v}" for k, v in sorted(request.query_params.multi_items()))
+    return f"{request.url.path}?{parametros}"
+
+@lru_cache(maxsize=None)
+def _adaptador(modelo):
+    return TypeAdapter(modelo)
+
+def calcular_etag(cuerpo: bytes) -> str:
+    return '"' + hashlib.blake2b(cuerpo, digest_size=16).hexdigest() + '"'
+
+def _coincide_etag(request: Request, etag: str) -> bool:
+    cabecera = request.headers.get("if-none-match")
+    if not cabecera:
+        return False
+    candidatos = {valor.strip().removeprefix("W/") for valor in cabecera.split(",")}
+    return "*" in candidatos or etag in candidatos
+
+async def _serializar(response: Response, producir, modelo):
+    """(cuerpo, cabeceras) de `await producir()`; los bytes ya serializados pasan tal cual"""
+    cuerpo = await producir()
+    if not isinstance(cuerpo, bytes):
+        adaptador = _adaptador(modelo)
+        cuerpo = adaptador.dump_json(adaptador.validate_python(cuerpo, from_attributes=True))
+    return cuerpo, dict(response.headers)
+
+def _lectura_primaria(request: Request) -> bool:
+    # database.get_db_lectura la marca cuando el cliente acaba de escribir: debe
+    # ver sus cambios, no lo que una réplica atrasada dejó en la caché
+    return getattr(request.state, "lectura_primaria", False)
+
+def _clave_en_vuelo(clave, primaria=False):
+    # Con la versión: una petición posterior a una escritura no se suma a una
+    # ejecución que empezó antes de ella
+    return clave, respuestas.version, primaria
+
+async def respuesta_cacheada(request: Request, response: Response, etiquetas, producir, modelo=Any,
+                             calcular_clave=clave_de) -> Response:
+    """Devuelve la respuesta cacheada o la genera con `await producir()` y la guarda.
+
+    El contenido se valida con `modelo` (el response_model de la ruta) para
+    que el cuerpo sea el mismo que produciría FastAPI; las cabeceras que el
+    handler puso en `response` se guardan junto al cuerpo. Si `producir`
+    devuelve bytes ya serializados (ruta rápida) se guardan tal cual.
+    Los fallos concurrentes con la misma `calcular_clave(request)` comparten una sola
+    ejecución. Una lectura desviada a la primaria tras una escritura no usa
+    lo cacheado (sí guarda lo que lee). Responde 304 si el cliente ya tiene la versión actual (If-None-Match).
+    """
+    clave = calcular_clave(request)
+    primaria = _lectura_primaria(request)
+    entrada = None if primaria else respuestas.obtener(clave)
+    if entrada is None:
+        async def generar():
+            version = respuestas.version
+            cuerpo, cabeceras = await _serializar(response, producir, modelo)
+            cabeceras["ETag"] = calcular_etag(cuerpo)
+            respuestas.guardar(clave, (cuerpo, cabeceras), etiquetas, version)
+            return cuerpo, cabeceras
+
+        entrada = await coalescedor.compartir(_clave_en_vuelo(clave, primaria), generar)
+
+    cuerpo, cabeceras = entrada
+    if _coincide_etag(request, cabeceras["ETag"]):
+        return Response(status_code=304, headers={"ETag": cabeceras["ETag"]})
+    return Response(cuerpo, media_type="application/json", headers=cabeceras)
+
+async def respuesta_coalescida(request: Request, response: Response, producir, modelo=Any,
+                               calcular_clave=clave_de) -> Response:
+    """Como `respuesta_cacheada` pero sin guardar: solo agrupa las peticiones en vuelo.
+
+    Para lecturas cuyo resultado no conviene retener (p. ej. búsquedas con
+    filtros arbitrarios) pero que llegan repetidas en ráfagas.
+    """
+    cuerpo, cabeceras = await coalescedor.compartir(
+        _clave_en_vuelo(calcular_clave(request), _lectura_primaria(request)),
+        lambda: _serializar(response, producir, modelo)
+    )
+    return Response(cuerpo, media_type="application/json", headers=cabeceras)
@@ -0,0 +1,51 @@
+"""Avisos de cambios en el catálogo para el stream SSE de GET /cambios/stream.
+
+Los handlers que crean autores o libros llaman a `avisos.avisar()` después de
+confirmar; los streams abiertos en este proceso despiertan y leen los cambios
+nuevos. Las escrituras de otros workers (o de fuera de la API) no avisan: los
+streams las encuentran al volver a consultar cada SSE_SONDEO segundos.
+"""
+import asyncio
+import os
+
+SSE_SONDEO = float(os.getenv("LIBRERIA_SSE_SONDEO", "5"))
+TIPO_SSE = "text/event-stream"
+LATIDO = b": latido\n\n"  # Comentario SSE: mantiene viva la conexión en proxies
+
+
+class Avisos:
+    """Versión que crece con cada aviso y los streams que esperan el siguiente"""
+
+    def __init__(self):
+        self.version = 0
+        self._esperando = set()
+
+    def avisar(self):
+        self.version += 1
+        for futuro in self._esperando:
+            if not futuro.done():
+                futuro.set_result(None)
+
+    async def esperar(self, vista: int, tiempo: float = None) -> bool:
+        """True si hubo un aviso después de `vista` (aunque fuera antes de llamar); False al
+        vencer `tiempo` (SSE_SONDEO si no se indica)"""
+        if tiempo is None:
+            tiempo = SSE_SONDEO
+        if self.version != vista:
+            return True
+        futuro = asyncio.get_running_loop().create_future()
+        self._esperando.add(futuro)
+        try:
+            await asyncio.wait_for(futuro, tiempo)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self._esperando.discard(futuro)
+
+
+avisos = Avisos()
+
+def evento_sse(tipo: str, identificador: int, datos: bytes) -> bytes:
+    """Un evento SSE; `identificador` vuelve como Last-Event-ID al reconectar"""
+    return f"id: {identificador}\nevent: {tipo}\ndata: ".encode() + datos + b"\n\n"
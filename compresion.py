@@ -0,0 +1,187 @@
+"""Compresión gzip/brotli de respuestas negociada con Accept-Encoding"""
+import gzip
+import os
+import zlib
+
+from starlette.concurrency import run_in_threadpool
+
+try:
+    import brotli
+except ImportError:  # Dependencia opcional: sin ella solo se ofrece gzip
+    brotli = None
+
+COMPRESION_HABILITADA = os.getenv("LIBRERIA_COMPRESION", "1").lower() in ("1", "true", "si")
+# Cuerpos más chicos que esto se envían tal cual: comprimirlos no ahorra nada
+COMPRESION_MINIMO = int(os.getenv("LIBRERIA_COMPRESION_MINIMO", "1024"))
+# Niveles medios: 9 (gzip) u 11 (brotli) cuestan varias veces más por poco ahorro
+# (python -m benchmarks.formatos)
+NIVEL_GZIP = int(os.getenv("LIBRERIA_NIVEL_GZIP", "4"))
+CALIDAD_BROTLI = int(os.getenv("LIBRERIA_CALIDAD_BROTLI", "4"))
+# Desde este tamaño se comprime en el threadpool para no bloquear el event loop
+COMPRESION_EN_HILO = 256 * 1024
+
+TIPOS_COMPRIMIBLES = ("application/json", "application/x-ndjson", "application/msgpack", "text/")
+
+
+def elegir_codificacion(accept_encoding: str):
+    """'br', 'gzip' o None según la cabecera Accept-Encoding (respeta q=0)"""
+    aceptadas = {}
+    for parte in accept_encoding.split(","):
+        nombre, _, parametros = parte.strip().partition(";")
+        calidad = 1.0
+        parametros = parametros.strip()
+        if parametros.startswith("q="):
+            try:
+                calidad = float(parametros[2:])
+            except ValueError:
+                calidad = 0.0
+        aceptadas[nombre.strip().lower()] = calidad
+
+    def aceptada(nombre):
+        return aceptadas.get(nombre, aceptadas.get("*", 0.0)) > 0
+
+    if brotli is not None and aceptada("br"):
+        return "br"
+    if aceptada("gzip"):
+        return "gzip"
+    return None
+
+
+class Compresor:
+    """Compresión incremental con la misma interfaz para gzip y brotli.
+
+    Cada trozo se vacía del compresor al agregarlo: el cliente puede
+    descomprimirlo apenas llega, sin esperar a que se complete un bloque.
+    """
+
+    def __init__(self, codificacion):
+        if codificacion == "br":
+            self._compresor = brotli.Compressor(quality=CALIDAD_BROTLI)
+            self._agregar = self._compresor.process
+            self._vaciar = self._compresor.flush
+            self._terminar = self._compresor.finish
+        else:
+            # wbits 31: formato gzip (cabecera y CRC) en lugar de zlib
+            self._compresor = zlib.compressobj(NIVEL_GZIP, zlib.DEFLATED, 31)
+            self._agregar = self._compresor.compress
+            self._vaciar = lambda: self._compresor.flush(zlib.Z_SYNC_FLUSH)
+            self._terminar = self._compresor.flush
+
+    def agregar(self, datos: bytes) -> bytes:
+        return self._agregar(datos) + self._vaciar()
+
+    def terminar(self) -> bytes:
+        return self._terminar()
+
+
+def comprimir(datos: bytes, codificacion: str) -> bytes:
+    if codificacion == "br":
+        return brotli.compress(datos, quality=CALIDAD_BROTLI)
+    return gzip.compress(datos, compresslevel=NIVEL_GZIP, mtime=0)
+
+
+class MiddlewareCompresion:
+    """Middleware ASGI que comprime los cuerpos de al menos `minimo` bytes.
+
+    Las respuestas de un solo mensaje se comprimen de una vez; las de
+    streaming (NDJSON) trozo a trozo, sin acumularlas. Un ETag fuerte pasa a
+    débil porque el cuerpo enviado ya no es byte a byte el original. Toda
+    respuesta de un tipo comprimible lleva `Vary: Accept-Encoding`, también
+    cuando se envía sin comprimir: así un proxy no le sirve a un cliente la
+    copia guardada para otro que aceptaba otra codificación.
+    """
+
+    def __init__(self, app, minimo: int = COMPRESION_MINIMO):
+        self.app = app
+        self.minimo = minimo
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        cabeceras = dict(scope["headers"])
+        codificacion = elegir_codificacion(cabeceras.get(b"accept-encoding", b"").decode("latin-1"))
+        inicio = None
+        compresor = None
+
+        async def enviar(mensaje):
+            nonlocal inicio, compresor
+            if mensaje["type"] == "http.response.start":
+                inicio = mensaje  # Se envía junto con el primer cuerpo
+                return
+            if mensaje["type"] != "http.response.body":
+                return await send(mensaje)
+
+            cuerpo = mensaje.get("body", b"")
+            mas = mensaje.get("more_body", False)
+            if inicio is not None:
+                iniciar, inicio = inicio, None
+                if not self._tipo_comprimible(iniciar):
+                    await send(iniciar)
+                    return await send(mensaje)
+                if codificacion is None or not self._comprimible(iniciar, cuerpo, mas):
+                    await send({**iniciar, "headers": agregar_vary(list(iniciar["headers"]))})
+                    return await send(mensaje)
+                iniciar = self._cabeceras_comprimidas(iniciar, codificacion)
+                if not mas:
+                    if len(cuerpo) >= COMPRESION_EN_HILO:
+                        cuerpo = await run_in_threadpool(comprimir, cuerpo, codificacion)
+                    else:
+                        cuerpo = comprimir(cuerpo, codificacion)
+                    iniciar["headers"].append((b"content-length", str(len(cuerpo)).encode()))
+                    await send(iniciar)
+                    return await send({"type": "http.response.body", "body": cuerpo})
+                await send(iniciar)
+                compresor = Compresor(codificacion)
+
+            if compresor is None:
+                return await send(mensaje)
+            comprimido = compresor.agregar(cuerpo)
+            if not mas:
+                comprimido += compresor.terminar()
+            await send({"type": "http.response.body", "body": comprimido, "more_body": mas})
+
+        await self.app(scope, receive, enviar)
+
+    @staticmethod
+    def _tipo_comprimible(inicio):
+        cabeceras = dict(inicio["headers"])
+        if b"content-encoding" in cabeceras:
+            return False
+        tipo = cabeceras.get(b"content-type", b"").decode("latin-1")
+        # SSE: eventos chicos que deben llegar al instante; algunos proxies retienen
+        # las respuestas comprimidas hasta juntar un bloque
+        return tipo.startswith(TIPOS_COMPRIMIBLES) and not tipo.startswith("text/event-stream")
+
+    def _comprimible(self, inicio, cuerpo, mas):
+        if inicio["status"] in (204, 304):
+            return False
+        # El largo total de un streaming no se conoce: se comprime siempre
+        return mas or len(cuerpo) >= self.minimo
+
+    @staticmethod
+    def _cabeceras_comprimidas(inicio, codificacion):
+        cabeceras = []
+        for nombre, valor in inicio["headers"]:
+            if nombre == b"content-length":
+                continue
+            if nombre == b"etag" and not valor.startswith(b"W/"):
+                valor = b"W/" + valor
+            cabeceras.append((nombre, valor))
+        cabeceras.append((b"content-encoding", codificacion.encode()))
+        return {**inicio, "headers": agregar_vary(cabeceras)}
+
+
+def agregar_vary(cabeceras: list) -> list:
+    """Suma Accept-Encoding a la cabecera Vary (o la crea)"""
+    for i, (nombre, valor) in enumerate(cabeceras):
+        if nombre == b"vary":
+            if b"accept-encoding" not in valor.lower() and valor != b"*":
+                cabeceras[i] = (nombre, valor + b", Accept-Encoding")
+            return cabeceras
+    cabeceras.append((b"vary", b"Accept-Encoding"))
+    return cabeceras
+
+
+def instalar(app):
+    if COMPRESION_HABILITADA:
+        app.add_middleware(MiddlewareCompresion)
@@ -1,35 +1,129 @@
+import os
+
 import pytest
 from unittest.mock import Mock, patch
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+# La app crea sus tablas al importarse: apuntarla a una base en memoria evita
+# escribir en libros.db y que los workers de pytest-xdist compitan por el archivo
+os.environ["LIBRERIA_DATABASE_URL"] = "sqlite://"
+os.environ["LIBRERIA_SECRET_KEY"] = "clave-de-pruebas-no-usar-fuera-de-la-suite"
 
 from main import app
 from database import Base, get_db
-from models import User, Task
-from auth import create_access_token
+import admision
+import auth
+import cache
+
+# Configuración de base de datos de prueba: SQLite en memoria, una por proceso
+# (cada worker de pytest-xdist es un proceso y tiene la suya)
+SQLALCHEMY_DATABASE_URL = "sqlite://"
+
+@pytest.fixture(scope="session")
+def engine():
+    """Engine compartido por toda la sesión; las tablas se crean una sola vez"""
+    motor = create_engine(
+        SQLALCHEMY_DATABASE_URL,
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+
+    # pysqlite abre y cierra transacciones por su cuenta, lo que rompe los
+    # SAVEPOINT; se desactiva y SQLAlchemy emite el BEGIN
+    @event.listens_for(motor, "connect")
+    def sin_transacciones_implicitas(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
 
-# Configuración de base de datos de prueba
-SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
+    @event.listens_for(motor, "begin")
+    def iniciar_transaccion(conn):
+        conn.exec_driver_sql("BEGIN")
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    # Los SAVEPOINT que aíslan cada prueba van directo al driver: así no se
+    # cuentan en las pruebas de consultas por petición ni en /metrics
+    def sin_eventos(plantilla):
+        def ejecutar(conexion, nombre):
+            conexion.connection.dbapi_connection.execute(plantilla.format(nombre))
+        return ejecutar
+
+    motor.dialect.do_savepoint = sin_eventos("SAVEPOINT {}")
+    motor.dialect.do_release_savepoint = sin_eventos("RELEASE SAVEPOINT {}")
+    motor.dialect.do_rollback_to_savepoint = sin_eventos("ROLLBACK TO SAVEPOINT {}")
+
+    Base.metadata.create_all(bind=motor)
+    yield motor
+    Base.metadata.drop_all(bind=motor)
+    motor.dispose()
 
 @pytest.fixture(scope="function")
-def db_session():
-    # Crear las tablas
-    Base.metadata.create_all(bind=engine)
-    
-    # Crear una nueva sesión para la prueba
-    db = TestingSessionLocal()
+def db_session(engine):
+    """Sesión dentro de una transacción que se revierte al terminar la prueba.
+
+    Los commit() de la app solo liberan un SAVEPOINT, así que la base queda
+    intacta para la siguiente prueba sin recrear las tablas.
+    """
+    conexion = engine.connect()
+    transaccion = conexion.begin()
+    db = Session(bind=conexion, autoflush=False, join_transaction_mode="create_savepoint")
     try:
         yield db
     finally:
         db.close()
-        # Limpiar las tablas después de la prueba
-        Base.metadata.drop_all(bind=engine)
+        transaccion.rollback()
+        conexion.close()
+
+@pytest.fixture
+def consultas(engine):
+    """Registra cada sentencia SQL ejecutada mientras dura la prueba"""
+    sentencias = []
+
+    def registrar(conn, cursor, statement, parameters, context, executemany):
+        sentencias.append(statement)
+
+    event.listen(engine, "before_cursor_execute", registrar)
+    yield sentencias
+    event.remove(engine, "before_cursor_execute", registrar)
+
+@pytest.fixture
+def poblar():
+    """poblar(db, cantidad): `cantidad` autores con un libro cada uno, en orden de id"""
+    import models
+
+    def _poblar(db, cantidad):
+        for i in range(cantidad):
+            autor = models.Autor(nombre=f"Autor {i}", nacionalidad="Colombiana")
+            db.add(autor)
+            db.add(models.Libro(titulo=f"Libro {i}", precio=10.0 + i, paginas=100, autor=autor))
+        db.commit()
+        db.expunge_all()
+    return _poblar
+
+@pytest.fixture
+def crear_catalogo_busqueda():
+    """crear_catalogo_busqueda(db): dos autores y cuatro libros con tildes y palabras repetidas"""
+    import models
+
+    def _crear_catalogo_busqueda(db):
+        allende = models.Autor(nombre="Isabel Allende", nacionalidad="Chilena")
+        marquez = models.Autor(nombre="Gabriel García Márquez", nacionalidad="Colombiana")
+        db.add_all([
+            models.Libro(titulo="La Casa de los Espíritus", precio=25.99, paginas=450, autor=allende),
+            models.Libro(titulo="Paula", precio=18.5, paginas=330, autor=allende),
+            models.Libro(titulo="Cien años de soledad", precio=30.0, paginas=470, autor=marquez),
+            models.Libro(titulo="Espíritus, espíritus y más espíritus", precio=12.0, paginas=90, autor=marquez),
+        ])
+        db.commit()
+    return _crear_catalogo_busqueda
+
+@pytest.fixture
+def plan_de_consulta():
+    """plan_de_consulta(db, consulta): pasos de EXPLAIN QUERY PLAN de una consulta ORM"""
+    def _plan_de_consulta(db, consulta):
+        sql = str(consulta.statement.compile(db.get_bind(), compile_kwargs={"literal_binds": True}))
+        return [fila[3] for fila in db.execute(text("EXPLAIN QUERY PLAN " + sql))]
+    return _plan_de_consulta
 
 @pytest.fixture(scope="function")
 def client(db_session):
@@ -41,15 +135,20 @@ def client(db_session):
             pass
     
     app.dependency_overrides[get_db] = override_get_db
+    cache.respuestas.limpiar()
+    auth.limpiar_caches()
+    admision.presupuestos.clear()
     with TestClient(app) as test_client:
         yield test_client
     app.dependency_overrides.clear()
 
 @pytest.fixture
 def test_user(db_session):
+    from models import User
     user = User(
         email="test@example.com",
-        hashed_password="$2b$12$EixZaYVK1fsbw1ZfbX3OXePaWxn96p36WQoeG6Lruj3vjPGga31lW",  # "testpassword"
+        # "testpassword" con 4 rondas: verificarlo no demora cada prueba de login
+        hashed_password="$2b$04$2jUi5nxB3AK7Rz38f2r0KOYzQzjsoPwi6WUfbHjHOr/zlCiJxB2Du",
         full_name="Test User"
     )
     db_session.add(user)
@@ -59,14 +158,16 @@ def test_user(db_session):
 
 @pytest.fixture
 def auth_headers(test_user):
+    from auth import create_access_token
     token = create_access_token({"sub": test_user.email})
     return {"Authorization": f"Bearer {token}"}
 
 @pytest.fixture
 def second_user(db_session):
+    from models import User
     user = User(
         email="user2@example.com",
-        hashed_password="$2b$12$EixZaYVK1fsbw1ZfbX3OXePaWxn96p36WQoeG6Lruj3vjPGga31lW",
+        hashed_password="$2b$04$2jUi5nxB3AK7Rz38f2r0KOYzQzjsoPwi6WUfbHjHOr/zlCiJxB2Du",
         full_name="Second User"
     )
     db_session.add(user)
@@ -76,11 +177,14 @@ def second_user(db_session):
 
 @pytest.fixture
 def second_user_headers(second_user):
+    from auth import create_access_token
     token = create_access_token({"sub": second_user.email})
     return {"Authorization": f"Bearer {token}"}
 
 @pytest.fixture
 def task_factory(db_session, test_user):
+    from models import Task
+
     def _task_factory(**kwargs):
         task_data = {
             "title": "Test Task",
@@ -1,22 +1,398 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import or_
+import math
+import re
+
+from sqlalchemy import or_, func, select, insert, false, text, table, column
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, joinedload, selectinload, undefer_group
 import models
 
+def consulta_libros(db: Session):
+    """Consulta base de libros con su autor cargado en la misma sentencia (evita N+1)"""
+    return db.query(models.Libro).options(joinedload(models.Libro.autor))
+
+def consulta_autores(db: Session):
+    return db.query(models.Autor)
+
+def consulta_autores_con_estadisticas(db: Session):
+    """Autores con sus columnas de agregados (diferidas por defecto) en la misma sentencia"""
+    return db.query(models.Autor).options(undefer_group("estadisticas"))
+
+def paginar(consulta, columna_id, after: int = None, limit: int = None):
+    """Paginación por cursor (keyset): registros con id mayor a `after`, ordenados por id"""
+    if after is not None:
+        consulta = consulta.filter(columna_id > after)
+    consulta = consulta.order_by(columna_id)
+    if limit is not None:
+        consulta = consulta.limit(limit)
+    return consulta
+
+def crear_autor(db: Session, autor):
+    db_autor = models.Autor(**autor.model_dump())
+    db.add(db_autor)
+    db.commit()
+    db.refresh(db_autor)
+    return db_autor
+
+def crear_libro(db: Session, libro):
+    """Crear un libro; devuelve None si el autor no existe"""
+    autor = db.query(models.Autor).filter(models.Autor.id == libro.autor_id).first()
+    if autor is None:
+        return None
+
+    db_libro = models.Libro(**libro.model_dump())
+    db.add(db_libro)
+    db.commit()
+    db.refresh(db_libro)
+    db_libro.autor  # Cargar el autor dentro de la sesión para la respuesta
+    return db_libro
+
+def obtener_autor_con_libros(db: Session, autor_id: int):
+    """Obtener un autor con sus libros cargados en una sola consulta adicional"""
+    return db.query(models.Autor).options(
+        selectinload(models.Autor.libros)
+    ).filter(models.Autor.id == autor_id).first()
+
+def obtener_autor_proyectado(db: Session, autor_id: int, proyeccion):
+    """Autor como dict con solo las columnas de `proyeccion`; sus libros, si se piden, en una consulta aparte"""
+    fila = proyeccion.aplicar(db.query(models.Autor).filter(models.Autor.id == autor_id)).first()
+    if fila is None:
+        return None
+    autor = proyeccion.a_dict(fila)
+    libros = proyeccion.colecciones.get("libros")
+    if libros is not None:
+        consulta = db.query(models.Libro).filter(models.Libro.autor_id == autor_id).order_by(models.Libro.id)
+        autor["libros"] = libros.filas(libros.aplicar(consulta))
+    return autor
+
+def expresion_busqueda(texto: str, columna: str):
+    """Traduce el texto del usuario a una consulta FTS5 de prefijos sobre una columna"""
+    terminos = re.findall(r"\w+", texto)
+    if not terminos:
+        return None
+    return f"{columna} : (" + " ".join(f'"{termino}"*' for termino in terminos) + ")"
+
+def _usa_indice_busqueda(db: Session):
+    return db.get_bind().dialect.name == "sqlite"
+
+def _unir_indice_busqueda(consulta, expresion: str):
+    """Une la consulta con las coincidencias del índice FTS5 y devuelve su relevancia (bm25)"""
+    indice = table(models.BUSQUEDA_TABLA, column("rowid"), column("rank"))
+    coincidencias = select(
+        indice.c.rowid.label("id"),
+        indice.c.rank.label("relevancia")
+    ).where(
+        text(f"{models.BUSQUEDA_TABLA} MATCH :expresion").bindparams(expresion=expresion)
+    ).subquery("coincidencias")
+
+    consulta = consulta.join(coincidencias, coincidencias.c.id == models.Libro.id)
+    return consulta, coincidencias.c.relevancia
+
+# Criterios de GET /autores/ranking: columnas de agregados indexadas, sin GROUP BY sobre libros
+ORDENES_RANKING = {
+    "libros": models.Autor.total_libros,
+    "precio": models.Autor.precio_promedio,
+}
+
+def consulta_ranking_autores(db: Session, por: str = "libros", limit: int = 10):
+    """Top-N de autores por cantidad de libros o precio promedio, leído en orden del índice"""
+    columna = ORDENES_RANKING[por]
+    return consulta_autores_con_estadisticas(db).filter(
+        columna.isnot(None)
+    ).order_by(columna.desc(), models.Autor.id.desc()).limit(limit)
+
+def ranking_autores(db: Session, por: str = "libros", limit: int = 10):
+    return consulta_ranking_autores(db, por, limit).all()
+
+
+# Criterios de orden admitidos por la búsqueda (el id se agrega siempre como desempate)
+ORDENES_LIBROS = {
+    "id": None,
+    "precio": models.Libro.precio,
+    "-precio": models.Libro.precio.desc(),
+    "paginas": models.Libro.paginas,
+    "-paginas": models.Libro.paginas.desc(),
+    "titulo": models.Libro.titulo,
+}
+
+def consulta_busqueda_libros(
+    db: Session,
+    titulo: str = None,
+    autor: str = None,
+    autor_id: int = None,
+    precio_min: float = None,
+    precio_max: float = None,
+    paginas_min: int = None,
+    paginas_max: int = None,
+    orden: str = "relevancia"
+):
+    """Combina todos los filtros de búsqueda en una sola consulta SQL"""
+    consulta = consulta_libros(db)
+    relevancia = None
+
+    if _usa_indice_busqueda(db):
+        expresiones = [
+            expresion_busqueda(texto, columna)
+            for texto, columna in ((titulo, "titulo"), (autor, "autor")) if texto
+        ]
+        if None in expresiones:
+            return consulta.filter(false())
+        if expresiones:
+            consulta, relevancia = _unir_indice_busqueda(consulta, " AND ".join(expresiones))
+    else:
+        if titulo:
+            consulta = consulta.filter(models.Libro.titulo.contains(titulo))
+        if autor:
+            consulta = consulta.filter(models.Libro.autor.has(models.Autor.nombre.contains(autor)))
+
+    if autor_id is not None:
+        consulta = consulta.filter(models.Libro.autor_id == autor_id)
+    if precio_min is not None:
+        consulta = consulta.filter(models.Libro.precio >= precio_min)
+    if precio_max is not None:
+        consulta = consulta.filter(models.Libro.precio <= precio_max)
+    if paginas_min is not None:
+        consulta = consulta.filter(models.Libro.paginas >= paginas_min)
+    if paginas_max is not None:
+        consulta = consulta.filter(models.Libro.paginas <= paginas_max)
+
+    if orden == "relevancia":
+        if relevancia is not None:
+            consulta = consulta.order_by(relevancia)
+    elif ORDENES_LIBROS[orden] is not None:
+        consulta = consulta.order_by(ORDENES_LIBROS[orden])
+    return consulta
+
+def consulta_libros_por_titulo(db: Session, busqueda: str):
+    return consulta_busqueda_libros(db, titulo=busqueda)
+
 def buscar_libros_por_titulo(db: Session, busqueda: str):
     """Buscar libros por título"""
-    return db.query(models.Libro).filter(
-        models.Libro.titulo.contains(busqueda)
-    ).all()
+    return consulta_libros_por_titulo(db, busqueda).all()
+
+def consulta_libros_por_autor(db: Session, nombre_autor: str):
+    return consulta_busqueda_libros(db, autor=nombre_autor)
 
 def buscar_libros_por_autor(db: Session, nombre_autor: str):
     """Buscar libros por nombre del autor"""
-    return db.query(models.Libro).join(models.Autor).filter(
-        models.Autor.nombre.contains(nombre_autor)
-    ).all()
+    return consulta_libros_por_autor(db, nombre_autor).all()
+
+def consulta_libros_por_precio(db: Session, precio_min: float, precio_max: float):
+    return consulta_busqueda_libros(db, precio_min=precio_min, precio_max=precio_max)
 
 def obtener_libros_por_precio(db: Session, precio_min: float, precio_max: float):
     """Obtener libros en rango de precio"""
-    return db.query(models.Libro).filter(
-        models.Libro.precio >= precio_min,
-        models.Libro.precio <= precio_max
-    ).all()
\ No newline at end of file
+    return consulta_libros_por_precio(db, precio_min, precio_max).all()
+
+def _formatear_estadisticas(total_libros, total_autores, suma_precios, precio_max, precio_min):
+    if total_libros > 0:
+        precio_promedio = suma_precios / total_libros
+    else:
+        precio_promedio = precio_max = precio_min = 0
+
+    return {
+        "total_libros": total_libros,
+        "total_autores": total_autores,
+        "precio_promedio": round(precio_promedio, 2),
+        "precio_mas_alto": precio_max,
+        "precio_mas_bajo": precio_min
+    }
+
+def calcular_estadisticas(db: Session):
+    """Estadísticas calculadas con una única consulta de agregación en SQL"""
+    total_autores = select(func.count(models.Autor.id)).scalar_subquery()
+    total_libros, suma_precios, precio_max, precio_min, autores = db.query(
+        func.count(models.Libro.id),
+        func.coalesce(func.sum(models.Libro.precio), 0),
+        func.max(models.Libro.precio),
+        func.min(models.Libro.precio),
+        total_autores
+    ).one()
+    return _formatear_estadisticas(total_libros, autores, suma_precios, precio_max, precio_min)
+
+def leer_estadisticas_materializadas(db: Session):
+    """Estadísticas leídas en O(1) de la fila mantenida por triggers (None si no existe)"""
+    fila = db.get(models.EstadisticasLibreria, 1)
+    if fila is None:
+        return None
+    return _formatear_estadisticas(
+        fila.total_libros, fila.total_autores, fila.suma_precios, fila.precio_max, fila.precio_min
+    )
+
+# Distribución de precios: todo se resuelve en SQL sobre ix_libros_precio
+# (índice cubriente), sin traer libros a Python
+def rango_precios(db: Session):
+    """(mínimo, máximo) de precio; cada extremo es una lectura del índice"""
+    return db.query(
+        select(func.min(models.Libro.precio)).scalar_subquery(),
+        select(func.max(models.Libro.precio)).scalar_subquery()
+    ).one()
+
+def limites_equidistantes(minimo: float, maximo: float, cubetas: int):
+    """Límites internos de `cubetas` intervalos del mismo ancho entre mínimo y máximo"""
+    ancho = (maximo - minimo) / cubetas
+    return sorted({round(minimo + ancho * i, 2) for i in range(1, cubetas)} - {minimo, maximo})
+
+def consulta_por_cubeta(db: Session, limites: list):
+    """Un COUNT por intervalo, cada uno sobre un rango del índice (más rápido que
+    un GROUP BY sobre un CASE, que evalúa todas las filas y ordena)"""
+    precio = models.Libro.precio
+    extremos = [None] + list(limites) + [None]
+    conteos = []
+    for desde, hasta in zip(extremos, extremos[1:]):
+        condiciones = [precio.isnot(None)]
+        if desde is not None:
+            condiciones.append(precio >= desde)
+        if hasta is not None:
+            condiciones.append(precio < hasta)
+        conteos.append(select(func.count()).select_from(models.Libro).where(*condiciones).scalar_subquery())
+    return db.query(*conteos)
+
+def contar_por_cubeta(db: Session, limites: list):
+    """Libros por intervalo [limite_i, limite_i+1); el primero y el último son abiertos"""
+    return list(consulta_por_cubeta(db, limites).one())
+
+def histograma_precios(db: Session, limites: list = None, cubetas: int = 10):
+    """Histograma con los límites dados, o con `cubetas` intervalos entre el precio mínimo y el máximo"""
+    desde = hasta = None
+    if limites is None:
+        desde, hasta = rango_precios(db)
+        if desde is None:
+            return {"cubetas": [], "total": 0}
+        limites = limites_equidistantes(desde, hasta, cubetas)
+
+    conteos = contar_por_cubeta(db, limites)
+    extremos = [desde] + limites + [hasta]
+    return {
+        "cubetas": [
+            {"desde": extremos[i], "hasta": extremos[i + 1], "total": total}
+            for i, total in enumerate(conteos)
+        ],
+        "total": sum(conteos)
+    }
+
+def percentiles_precio(db: Session, percentiles: list):
+    """Percentiles con interpolación lineal (como statistics.quantiles(method="inclusive")).
+
+    Cada percentil lee dos filas del índice con LIMIT/OFFSET.
+    """
+    precio = models.Libro.precio
+    total = db.query(func.count(precio)).scalar()
+    resultado = []
+    for percentil in percentiles:
+        valor = None
+        if total:
+            posicion = percentil / 100 * (total - 1)
+            inferior = math.floor(posicion)
+            valores = [fila[0] for fila in db.query(precio).filter(precio.isnot(None))
+                       .order_by(precio).offset(inferior).limit(2)]
+            valor = valores[0]
+            if len(valores) == 2:
+                valor += (valores[1] - valores[0]) * (posicion - inferior)
+        resultado.append({"percentil": percentil, "precio": valor})
+    return {"total": total, "percentiles": resultado}
+
+def insertar_autores(db: Session, autores: list):
+    """Inserta un lote de autores validados con un solo executemany (no rechaza ninguno)"""
+    db.execute(insert(models.Autor), [autor.model_dump() for autor in autores])
+    return []
+
+def insertar_libros(db: Session, libros: list):
+    """Inserta un lote de libros validados; devuelve las posiciones rechazadas por autor inexistente"""
+    ids = {libro.autor_id for libro in libros if libro.autor_id is not None}
+    existentes = set(db.scalars(select(models.Autor.id).where(models.Autor.id.in_(ids))))
+
+    rechazados = [i for i, libro in enumerate(libros) if libro.autor_id not in existentes]
+    validos = [libro.model_dump() for libro in libros if libro.autor_id in existentes]
+    if validos:
+        db.execute(insert(models.Libro), validos)
+    return rechazados
+
+# CAMBIOS: altas y modificaciones en orden de secuencia (ix_*_secuencia)
+def consulta_cambios(db: Session, modelo, desde: int):
+    return (
+        db.query(modelo)
+        .options(undefer_group("cambios"))
+        .filter(modelo.secuencia > desde)
+        .order_by(modelo.secuencia)
+    )
+
+def cambios_desde(db: Session, desde: int, limite: int):
+    """(filas, hay_mas): los primeros `limite` autores y libros con secuencia mayor a `desde`.
+
+    Cada tabla aporta a lo sumo limite + 1 filas por su índice; se mezclan por
+    secuencia y lo que sobra indica que hay otra página.
+    """
+    filas = [
+        *consulta_cambios(db, models.Autor, desde).limit(limite + 1),
+        *consulta_cambios(db, models.Libro, desde).limit(limite + 1),
+    ]
+    filas.sort(key=lambda fila: fila.secuencia)
+    return filas[:limite], len(filas) > limite
+
+
+# EXPORTACIÓN: columnas planas en orden de id; el autor viene en la misma sentencia
+def sentencia_exportar_libros():
+    return (
+        select(
+            models.Libro.id, models.Libro.titulo, models.Libro.precio, models.Libro.paginas,
+            models.Libro.autor_id,
+            models.Autor.nombre.label("autor_nombre"),
+            models.Autor.nacionalidad.label("autor_nacionalidad"),
+        )
+        .outerjoin(models.Autor, models.Libro.autor_id == models.Autor.id)
+        .order_by(models.Libro.id)
+    )
+
+def sentencia_exportar_autores():
+    """Autores con sus agregados materializados (sin recorrer sus libros)"""
+    return select(
+        models.Autor.id, models.Autor.nombre, models.Autor.nacionalidad, models.Autor.total_libros,
+        models.Autor.precio_min, models.Autor.precio_max, models.Autor.precio_promedio,
+    ).order_by(models.Autor.id)
+
+# USUARIOS Y TAREAS
+def obtener_usuario_por_email(db: Session, email: str):
+    return db.query(models.User).filter(models.User.email == email.lower()).first()
+
+def crear_usuario(db: Session, usuario, hashed_password: str):
+    """Crear un usuario con la contraseña ya hasheada; devuelve None si el email ya existe"""
+    db_usuario = models.User(
+        email=usuario.email, full_name=usuario.full_name, hashed_password=hashed_password
+    )
+    db.add(db_usuario)
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        return None
+    db.refresh(db_usuario)
+    return db_usuario
+
+def consulta_tareas(db: Session, user_id: int):
+    return db.query(models.Task).filter(models.Task.user_id == user_id)
+
+def obtener_tarea(db: Session, task_id: int, user_id: int):
+    """La tarea solo si pertenece al usuario: las ajenas se tratan como inexistentes"""
+    return consulta_tareas(db, user_id).filter(models.Task.id == task_id).first()
+
+def crear_tarea(db: Session, tarea, user_id: int):
+    db_tarea = models.Task(**tarea.model_dump(), user_id=user_id)
+    db.add(db_tarea)
+    db.commit()
+    db.refresh(db_tarea)
+    return db_tarea
+
+def actualizar_tarea(db: Session, task_id: int, user_id: int, cambios):
+    db_tarea = obtener_tarea(db, task_id, user_id)
+    if db_tarea is None:
+        return None
+    for campo, valor in cambios.model_dump(exclude_unset=True).items():
+        setattr(db_tarea, campo, valor)
+    db.commit()
+    db.refresh(db_tarea)
+    return db_tarea
+
+def eliminar_tarea(db: Session, task_id: int, user_id: int) -> bool:
+    eliminadas = consulta_tareas(db, user_id).filter(models.Task.id == task_id).delete()
+    db.commit()
+    return eliminadas > 0
@@ -1,14 +1,84 @@
-from sqlalchemy import create_engine
+import itertools
+import math
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+
+from fastapi import Depends, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./libros.db"
+# Configuración por variables de entorno
+SQLALCHEMY_DATABASE_URL = os.getenv("LIBRERIA_DATABASE_URL", "sqlite:///./libros.db")
+POOL_SIZE = int(os.getenv("LIBRERIA_DB_POOL_SIZE", "5"))
+MAX_OVERFLOW = int(os.getenv("LIBRERIA_DB_MAX_OVERFLOW", "10"))
+POOL_RECYCLE = int(os.getenv("LIBRERIA_DB_POOL_RECYCLE", "-1"))
+POOL_PRE_PING = os.getenv("LIBRERIA_DB_POOL_PRE_PING", "0").lower() in ("1", "true", "si")
+
+# Crear tablas, índices y triggers al iniciar la app (lifespan). En producción
+# se puede desactivar y correr `python migrar.py` una vez antes del despliegue
+CREAR_ESQUEMA = os.getenv("LIBRERIA_CREAR_ESQUEMA", "1").lower() in ("1", "true", "si")
+
+# PRAGMAs aplicados a cada conexión SQLite nueva
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("LIBRERIA_SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("LIBRERIA_SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": int(os.getenv("LIBRERIA_SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "cache_size": int(os.getenv("LIBRERIA_SQLITE_CACHE_SIZE", "-64000")),  # negativo = KiB
+    "mmap_size": int(os.getenv("LIBRERIA_SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+}
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, 
-    connect_args={"check_same_thread": False}
+# Réplicas de solo lectura (URLs separadas por coma). Las lecturas se reparten
+# entre ellas con round_robin o menos_conexiones; durante LEER_ESCRITURAS_SEGUNDOS
+# después de una escritura, las lecturas de ese cliente van a la primaria
+REPLICAS_URLS = [url.strip() for url in os.getenv("LIBRERIA_DATABASE_REPLICAS", "").split(",") if url.strip()]
+SELECCION_REPLICAS = os.getenv("LIBRERIA_REPLICAS_SELECCION", "round_robin")
+LEER_ESCRITURAS_SEGUNDOS = float(os.getenv("LIBRERIA_LEER_ESCRITURAS_SEGUNDOS", "5"))
+COOKIE_ESCRITURA = "libreria_escritura"
+
+# Modo async: los handlers usan AsyncSession (aiosqlite en local)
+MODO_ASYNC = os.getenv("LIBRERIA_DB_ASYNC", "0").lower() in ("1", "true", "si")
+ASYNC_DATABASE_URL = os.getenv(
+    "LIBRERIA_ASYNC_DATABASE_URL",
+    SQLALCHEMY_DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://", 1)
 )
 
+def opciones_engine(url):
+    """Argumentos de create_engine según el tipo de base de datos y la configuración"""
+    url = make_url(url)
+    opciones = {"pool_pre_ping": POOL_PRE_PING, "pool_recycle": POOL_RECYCLE}
+    if url.get_backend_name() == "sqlite":
+        opciones["connect_args"] = {"check_same_thread": False}
+        # Las bases en memoria usan un pool de una sola conexión sin tamaño configurable
+        if url.database in (None, "", ":memory:"):
+            return opciones
+    opciones["pool_size"] = POOL_SIZE
+    opciones["max_overflow"] = MAX_OVERFLOW
+    return opciones
+
+def aplicar_pragmas_sqlite(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        for pragma, valor in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {pragma}={valor}")
+    finally:
+        cursor.close()
+
+def configurar_engine(motor):
+    """Registra los PRAGMAs de SQLite en un engine sync (o en el sync_engine de uno async)"""
+    if motor.dialect.name == "sqlite":
+        event.listen(motor, "connect", aplicar_pragmas_sqlite)
+    return motor
+
+def crear_engine(url=SQLALCHEMY_DATABASE_URL, **opciones):
+    return configurar_engine(create_engine(url, **{**opciones_engine(url), **opciones}))
+
+engine = crear_engine()
+
 Base = declarative_base()
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -18,4 +88,179 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+# El engine async se crea solo si se usa, para no exigir el driver en modo sync
+async_engine = None
+AsyncSessionLocal = None
+
+def crear_async_engine(url=ASYNC_DATABASE_URL):
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    motor = create_async_engine(url, **opciones_engine(url))
+    configurar_engine(motor.sync_engine)
+    # Sin expirar al confirmar: los objetos se serializan fuera de la sesión
+    return motor, async_sessionmaker(motor, autoflush=False, expire_on_commit=False)
+
+async def get_async_db():
+    global async_engine, AsyncSessionLocal
+    if AsyncSessionLocal is None:
+        async_engine, AsyncSessionLocal = crear_async_engine()
+    async with AsyncSessionLocal() as db:
+        yield db
+
+# Sesión sync (threadpool) o AsyncSession según LIBRERIA_DB_ASYNC; los
+# handlers son los mismos y ejecutan el trabajo de BD con `ejecutar`
+obtener_db = get_async_db if MODO_ASYNC else get_db
+
+
+class Replicas:
+    """Engines de las réplicas y la elección de una para cada lectura.
+
+    `round_robin` las recorre en orden; `menos_conexiones` elige la que tiene
+    menos sesiones abiertas en este proceso (empates en orden de round robin).
+    Los engines async se crean recién cuando se usan, como el de la primaria.
+    """
+
+    def __init__(self, urls, seleccion: str = SELECCION_REPLICAS):
+        if seleccion not in ("round_robin", "menos_conexiones"):
+            raise ValueError(f"Selección de réplicas desconocida: {seleccion}")
+        self.urls = list(urls)
+        self.seleccion = seleccion
+        self.engines = [crear_engine(url) for url in self.urls]
+        self.sesiones = [sessionmaker(autocommit=False, autoflush=False, bind=motor) for motor in self.engines]
+        self.async_engines = [None] * len(self.urls)
+        self.async_sesiones = [None] * len(self.urls)
+        self.abiertas = [0] * len(self.urls)
+        self.lecturas = [0] * len(self.urls)
+        self.lecturas_primaria = 0  # Desviadas a la primaria por leer las propias escrituras
+        self._turno = itertools.count()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.urls)
+
+    def elegir(self) -> int:
+        """Índice de la réplica para una sesión nueva; devolverlo con `liberar`"""
+        with self._lock:
+            inicio = next(self._turno) % len(self.urls)
+            indice = inicio
+            if self.seleccion == "menos_conexiones":
+                orden = [(inicio + i) % len(self.urls) for i in range(len(self.urls))]
+                indice = min(orden, key=self.abiertas.__getitem__)
+            self.abiertas[indice] += 1
+            self.lecturas[indice] += 1
+            return indice
+
+    def liberar(self, indice: int):
+        with self._lock:
+            self.abiertas[indice] -= 1
+
+    def contar_lectura_primaria(self):
+        """Cuenta una lectura desviada a la primaria"""
+        with self._lock:
+            self.lecturas_primaria += 1
+
+    def sesion_async(self, indice: int):
+        if self.async_sesiones[indice] is None:
+            url = self.urls[indice].replace("sqlite://", "sqlite+aiosqlite://", 1)
+            self.async_engines[indice], self.async_sesiones[indice] = crear_async_engine(url)
+        return self.async_sesiones[indice]()
+
+    def descartar_conexiones(self):
+        for motor in self.engines:
+            motor.dispose(close=False)
+        for motor in self.async_engines:
+            if motor is not None:
+                motor.sync_engine.dispose(close=False)
+
+    def metricas(self) -> dict:
+        with self._lock:
+            return {
+                "seleccion": self.seleccion,
+                "replicas": [
+                    {"url": make_url(url).render_as_string(hide_password=True), "abiertas": abiertas,
+                     "lecturas": lecturas}
+                    for url, abiertas, lecturas in zip(self.urls, self.abiertas, self.lecturas)
+                ],
+                "lecturas_primaria": self.lecturas_primaria,
+            }
+
+replicas = Replicas(REPLICAS_URLS)
+
+def marcar_escritura(response: Response):
+    """Cookie con el instante hasta el que este cliente lee de la primaria"""
+    if len(replicas) and LEER_ESCRITURAS_SEGUNDOS > 0:
+        hasta = time.time() + LEER_ESCRITURAS_SEGUNDOS
+        response.set_cookie(COOKIE_ESCRITURA, f"{hasta:.3f}", max_age=math.ceil(LEER_ESCRITURAS_SEGUNDOS),
+                            httponly=True, samesite="lax")
+
+def leer_de_primaria(request: Request) -> bool:
+    try:
+        return float(request.cookies.get(COOKIE_ESCRITURA, 0)) > time.time()
+    except ValueError:
+        return False
+
+async def get_db_escritura(response: Response, db=Depends(obtener_db)):
+    """Sesión de la primaria para handlers que escriben; abre la ventana de leer lo escrito"""
+    marcar_escritura(response)
+    yield db
+
+@asynccontextmanager
+async def sesion_lectura(request: Request, primaria):
+    """Sesión de una réplica para leer, o `primaria` según las reglas de get_db_lectura"""
+    if not len(replicas):
+        yield primaria
+        return
+    if leer_de_primaria(request):
+        replicas.contar_lectura_primaria()
+        request.state.lectura_primaria = True  # La caché de respuestas no le sirve datos de réplicas
+        yield primaria
+        return
+
+    indice = replicas.elegir()
+    try:
+        if MODO_ASYNC:
+            async with replicas.sesion_async(indice) as db:
+                yield db
+        else:
+            db = replicas.sesiones[indice]()
+            try:
+                yield db
+            finally:
+                await run_in_threadpool(db.close)
+    finally:
+        replicas.liberar(indice)
+
+async def get_db_lectura(request: Request, primaria=Depends(obtener_db)):
+    """Sesión de una réplica para handlers de solo lectura.
+
+    Sin réplicas, o dentro de la ventana posterior a una escritura del mismo
+    cliente, es la sesión de la primaria (crearla no abre conexión hasta usarla).
+    """
+    async with sesion_lectura(request, primaria) as db:
+        yield db
+
+def descartar_conexiones_heredadas():
+    """Tras un fork, el hijo abandona (sin cerrar) las conexiones del pool del padre.
+
+    Cerrarlas afectaría al padre, que las sigue usando; cada proceso abre las suyas.
+    """
+    engine.dispose(close=False)
+    if async_engine is not None:
+        async_engine.sync_engine.dispose(close=False)
+    replicas.descartar_conexiones()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=descartar_conexiones_heredadas)
+
+async def ejecutar(db, funcion, *args):
+    """Ejecuta funcion(sesion_sync, *args) sin bloquear el event loop.
+
+    Con una AsyncSession se usa run_sync (E/S async del driver); con una
+    Session normal la función corre en el threadpool. Así los helpers de
+    crud.py sirven igual en ambos modos.
+    """
+    if hasattr(db, "run_sync"):
+        return await db.run_sync(funcion, *args)
+    return await run_in_threadpool(funcion, db, *args)
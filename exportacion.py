@@ -0,0 +1,182 @@
+"""Exportación masiva en streaming: CSV, NDJSON, Arrow IPC y Parquet.
+
+La consulta es una sola sentencia de columnas planas (el autor de cada libro
+llega por JOIN) leída con un cursor del servidor en lotes de EXPORT_LOTE
+filas. Cada lote se codifica y se envía antes de leer el siguiente, así la
+memoria no crece con el tamaño de la tabla. Toda la exportación corre en una
+misma transacción: es una foto consistente aunque haya escrituras mientras tanto.
+
+Arrow y Parquet necesitan pyarrow (dependencia opcional); sin él responden 406.
+"""
+import csv
+import io
+import os
+
+from starlette.concurrency import run_in_threadpool
+
+import serializacion
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Dependencia opcional: sin ella ?formato=arrow|parquet responde 406
+    pa = pq = None
+
+EXPORT_LOTE = int(os.getenv("LIBRERIA_EXPORT_LOTE", "10000"))
+FORMATOS_ARROW = ("arrow", "parquet")
+
+
+def columnas_de(sentencia):
+    """[(nombre, tipo Python)] de las columnas que devuelve una sentencia select"""
+    return [(columna.name, columna.type.python_type) for columna in sentencia.selected_columns]
+
+
+class Csv:
+    tipo = "text/csv; charset=utf-8"
+    extension = "csv"
+
+    def __init__(self, columnas):
+        self._bufer = io.StringIO()
+        self._escritor = csv.writer(self._bufer)
+        self._escritor.writerow(nombre for nombre, _ in columnas)
+
+    def _vaciar(self) -> bytes:
+        datos = self._bufer.getvalue().encode("utf-8")
+        self._bufer.seek(0)
+        self._bufer.truncate()
+        return datos
+
+    def inicio(self) -> bytes:
+        return self._vaciar()
+
+    def lote(self, filas) -> bytes:
+        self._escritor.writerows(filas)
+        return self._vaciar()
+
+    def fin(self) -> bytes:
+        return b""
+
+
+class Ndjson:
+    tipo = "application/x-ndjson"
+    extension = "ndjson"
+
+    def __init__(self, columnas):
+        self._nombres = [nombre for nombre, _ in columnas]
+
+    def inicio(self) -> bytes:
+        return b""
+
+    def lote(self, filas) -> bytes:
+        nombres = self._nombres
+        return b"".join(serializacion.codificar_json(dict(zip(nombres, fila))) + b"\n" for fila in filas)
+
+    def fin(self) -> bytes:
+        return b""
+
+
+class _Acumulador:
+    """Destino de escritura de pyarrow: guarda lo escrito hasta que se vacía"""
+    closed = False
+
+    def __init__(self):
+        self._partes = []
+
+    def write(self, datos):
+        self._partes.append(bytes(datos))
+        return len(datos)
+
+    def flush(self):
+        pass
+
+    def vaciar(self) -> bytes:
+        datos = b"".join(self._partes)
+        self._partes.clear()
+        return datos
+
+
+class _Columnar:
+    """Base de Arrow y Parquet: cada lote es un RecordBatch escrito en cuanto llega"""
+
+    def __init__(self, columnas):
+        tipos = {int: pa.int64(), float: pa.float64(), str: pa.string(), bool: pa.bool_()}
+        self._esquema = pa.schema([(nombre, tipos[tipo]) for nombre, tipo in columnas])
+        self._destino = _Acumulador()
+        self._escritor = self._abrir(pa.PythonFile(self._destino, mode="w"), self._esquema)
+
+    def inicio(self) -> bytes:
+        return self._destino.vaciar()
+
+    def lote(self, filas) -> bytes:
+        valores = list(zip(*filas))
+        lote = pa.RecordBatch.from_arrays(
+            [pa.array(columna, type=campo.type) for columna, campo in zip(valores, self._esquema)],
+            schema=self._esquema,
+        )
+        self._escritor.write_batch(lote)
+        return self._destino.vaciar()
+
+    def fin(self) -> bytes:
+        self._escritor.close()
+        return self._destino.vaciar()
+
+
+class Arrow(_Columnar):
+    # Formato de stream IPC: esquema, lotes y marca de fin; se lee sin saber el total
+    tipo = "application/vnd.apache.arrow.stream"
+    extension = "arrows"
+
+    @staticmethod
+    def _abrir(destino, esquema):
+        return pa.ipc.new_stream(destino, esquema)
+
+
+class Parquet(_Columnar):
+    # Un row group por lote; el pie con los metadatos se escribe al final
+    tipo = "application/vnd.apache.parquet"
+    extension = "parquet"
+
+    @staticmethod
+    def _abrir(destino, esquema):
+        return pq.ParquetWriter(destino, esquema)
+
+
+FORMATOS = {"csv": Csv, "ndjson": Ndjson, "arrow": Arrow, "parquet": Parquet}
+
+def disponible(formato: str) -> bool:
+    return formato not in FORMATOS_ARROW or pa is not None
+
+def generar(db, sentencia, formato: str, lote: int = EXPORT_LOTE):
+    """Iterador de bytes con la exportación: síncrono con una Session, asíncrono con una AsyncSession"""
+    codificador = FORMATOS[formato](columnas_de(sentencia))
+    sentencia = sentencia.execution_options(yield_per=lote)
+
+    if hasattr(db, "stream_scalars"):
+        async def bytes_async():
+            yield codificador.inicio()
+            resultado = await db.stream(sentencia)
+            try:
+                async for filas in resultado.partitions():
+                    # Codificar un lote es CPU: fuera del event loop
+                    yield await run_in_threadpool(codificador.lote, filas)
+            finally:
+                await resultado.close()
+            yield codificador.fin()
+        return _sin_vacios_async(bytes_async())
+
+    # StreamingResponse pide cada lote desde el threadpool
+    def bytes_sync():
+        yield codificador.inicio()
+        resultado = db.execute(sentencia)
+        try:
+            for filas in resultado.partitions():
+                yield codificador.lote(filas)
+        finally:
+            resultado.close()
+        yield codificador.fin()
+    return (datos for datos in bytes_sync() if datos)
+
+async def _sin_vacios_async(partes):
+    async for datos in partes:
+        if datos:
+            yield datos
@@ -1,102 +1,791 @@
-from fastapi import FastAPI, Depends, HTTPException, Query, status
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Union
+import json
+import math
 
+import admision
+import auth
 import models
 import schemas
 import crud
-from database import engine, get_db
+import cache
+import cambios
+import compresion
+import exportacion
+import metricas
+import serializacion
+from database import (
+    engine, obtener_db, get_db_lectura, get_db_escritura, sesion_lectura, ejecutar, replicas, CREAR_ESQUEMA
+)
 
-# Crear tablas en la base de datos
-models.Base.metadata.create_all(bind=engine)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Crear tablas en la base de datos al iniciar (no al importar el módulo)
+    if CREAR_ESQUEMA:
+        models.Base.metadata.create_all(bind=engine)
+    yield
 
 app = FastAPI(
     title="API de Librería",
     description="API para gestión de autores y libros",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+# Rutas con presupuesto de admisión chico: costosas sin paginar o por diseño (bcrypt)
+RUTAS_PESADAS = {
+    ("GET", "/autores/"), ("GET", "/autores/ranking"), ("POST", "/autores/bulk"),
+    ("GET", "/libros/"), ("GET", "/libros/buscar/"), ("POST", "/libros/bulk"),
+    ("GET", "/libros/precios/histograma"), ("GET", "/libros/precios/percentiles"),
+    ("GET", "/estadisticas/"), ("GET", "/export/libros"), ("GET", "/export/autores"),
+    ("POST", "/auth/register"), ("POST", "/auth/login"),
+}
+
+compresion.instalar(app)
+# El stream de cambios no termina: dentro de un presupuesto ocuparía su lugar para siempre
+admision.instalar(app, pesadas=RUTAS_PESADAS, exentas={"/metrics", "/cambios/stream"})
+metricas.instrumentar(app)
+
+# Paginación y streaming de listados
+LIMITE_MAXIMO = 1000
+TAMANO_LOTE_STREAMING = 500
+CABECERA_CURSOR = "X-Siguiente-Cursor"
+TIPO_MSGPACK = "application/msgpack"
+
+# Distribución de precios: cada cubeta es una subconsulta y cada percentil una lectura del índice
+MAXIMO_CUBETAS = 100
+MAXIMO_PERCENTILES = 20
+
+def parametros_campos(
+    fields: str = Query(None, description="Campos separados por coma, p. ej. id,titulo,autor.nombre")
+):
+    """Lista de campos pedidos o None si se quieren todos"""
+    if fields is None:
+        return None
+    campos = [campo.strip() for campo in fields.split(",") if campo.strip()]
+    if not campos:
+        raise HTTPException(status_code=400, detail="'fields' no puede estar vacío")
+    return campos
+
+def parametros_paginacion(
+    limit: int = Query(None, ge=1, le=LIMITE_MAXIMO, description="Máximo de registros por página"),
+    after: int = Query(None, description="Cursor: devolver registros con id mayor a este"),
+    formato: str = Query("json", pattern="^(json|ndjson|msgpack)$",
+                         description="json, ndjson (streaming) o msgpack (MessagePack)"),
+    rapido: bool = Query(False, description="Serializar columnas planas sin construir modelos por fila"),
+    campos: list = Depends(parametros_campos)
+):
+    if formato == "msgpack" and serializacion.msgpack is None:
+        raise HTTPException(status_code=406, detail="MessagePack no está disponible en este servidor")
+    return {"limit": limit, "after": after, "formato": formato, "rapido": rapido, "campos": campos}
+
+def parametros_paginacion_tareas(
+    limit: int = Query(None, ge=1, le=LIMITE_MAXIMO, description="Máximo de registros por página"),
+    after: int = Query(None, description="Cursor: devolver registros con id mayor a este"),
+    formato: str = Query("json", pattern="^(json|ndjson)$", description="json o ndjson (streaming)")
+):
+    """Las tareas no tienen proyección: sin msgpack, fields= ni rapido"""
+    return {"limit": limit, "after": after, "formato": formato}
+
+def parametros_paginacion_libros(
+    paginacion: dict = Depends(parametros_paginacion),
+    forma: str = Query("anidada", pattern="^(anidada|normalizada)$",
+                       description="anidada (autor dentro de cada libro) o normalizada (mapa 'autores' por id)")
+):
+    if forma == "normalizada":
+        if paginacion["formato"] == "ndjson":
+            raise HTTPException(status_code=400, detail="La forma normalizada no aplica a ndjson")
+        if paginacion["campos"] is not None and "autor_id" not in paginacion["campos"]:
+            # Los libros referencian a su autor por id
+            paginacion = {**paginacion, "campos": paginacion["campos"] + ["autor_id"]}
+    return {**paginacion, "forma": forma}
+
+def proyeccion_de(proyeccion, campos):
+    """La proyección completa o, con ?fields=, una con solo esas columnas y su esquema generado"""
+    if campos is None:
+        return proyeccion
+    try:
+        return proyeccion.restringir(campos)
+    except ValueError as error:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Campo desconocido: {error}. Disponibles: {', '.join(proyeccion.disponibles())}"
+        )
+
+def proyectada(paginacion: dict) -> bool:
+    """Si el listado se arma desde columnas (dicts) en lugar de entidades ORM"""
+    return (
+        paginacion["campos"] is not None
+        or paginacion["formato"] == "msgpack"
+        or paginacion.get("forma") == "normalizada"
+        or (paginacion["rapido"] and paginacion["formato"] == "json")
+    )
+
+def cuerpo_proyectado(paginacion: dict, proyeccion, filas):
+    """Filas de una proyección listas para codificar_json.
+
+    Con ?fields= y sin `rapido` pasan por el esquema generado para esos campos.
+    """
+    if paginacion["campos"] is not None and not paginacion["rapido"]:
+        return serializacion.normalizar(List[proyeccion.esquema], filas)
+    return filas
+
+def responder_ndjson(db, construir, esquema, proyeccion=None):
+    """Envía una fila por línea a medida que se leen de la base de datos.
+
+    Con `proyeccion` la consulta trae columnas y cada línea se arma desde ellas.
+    """
+    if proyeccion is None:
+        def linea(fila):
+            return esquema.model_validate(fila).model_dump_json() + "\n"
+    else:
+        def linea(fila):
+            return serializacion.codificar_json(proyeccion.a_dict(fila)) + b"\n"
+
+    if hasattr(db, "stream_scalars"):
+        async def generar():
+            sentencia = await db.run_sync(lambda sesion: construir(sesion).statement)
+            sentencia = sentencia.execution_options(yield_per=TAMANO_LOTE_STREAMING)
+            if proyeccion is None:
+                filas = await db.stream_scalars(sentencia)
+            else:
+                filas = await db.stream(sentencia)
+            async for fila in filas:
+                yield linea(fila)
+    else:
+        def generar():
+            for fila in construir(db).yield_per(TAMANO_LOTE_STREAMING):
+                yield linea(fila)
+    return StreamingResponse(generar(), media_type="application/x-ndjson")
+
+def marcar_siguiente_pagina(response: Response, resultados, limit, id_de=lambda fila: fila.id):
+    # Si la página viene llena puede haber más registros después del último id
+    if limit is not None and len(resultados) == limit:
+        response.headers[CABECERA_CURSOR] = str(id_de(resultados[-1]))
+
+async def listar(db, response: Response, paginacion: dict, esquema, columna_id, construir,
+                 proyeccion=None, **filtros):
+    """Ejecuta `construir(sesion, **filtros)` paginada, como lista o como flujo NDJSON.
+
+    Con `rapido` o `fields` (y una `proyeccion` del esquema) solo se seleccionan
+    las columnas de la proyección y se devuelven dicts armados desde ellas,
+    listos para `serializacion.codificar_json`.
+    """
+    proyectar = proyeccion is not None and proyectada(paginacion)
+
+    def consulta(sesion):
+        consulta = construir(sesion, **filtros)
+        if proyectar:
+            # Antes de paginar: el LEFT JOIN no puede agregarse después del LIMIT
+            consulta = proyeccion.aplicar(consulta)
+        return crud.paginar(consulta, columna_id, paginacion["after"], paginacion["limit"])
+
+    if paginacion["formato"] == "ndjson":
+        return responder_ndjson(db, consulta, esquema, proyeccion if proyectar else None)
+
+    if proyectar:
+        filas = await ejecutar(db, lambda sesion: consulta(sesion).all())
+        marcar_siguiente_pagina(response, filas, paginacion["limit"], proyeccion.id_de)
+        return [proyeccion.a_dict(fila) for fila in filas]
+    resultados = await ejecutar(db, lambda sesion: consulta(sesion).all())
+    marcar_siguiente_pagina(response, resultados, paginacion["limit"])
+    return resultados
+
+def codificar(response: Response, paginacion: dict, contenido) -> bytes:
+    """`contenido` en el formato pedido; con msgpack también fija el Content-Type en `response`"""
+    if paginacion["formato"] == "msgpack":
+        response.headers["Content-Type"] = TIPO_MSGPACK
+        return serializacion.codificar_msgpack(contenido)
+    return serializacion.codificar_json(contenido)
+
+def responder(response: Response, paginacion: dict, contenido):
+    """Respuesta ya serializada; conserva las cabeceras puestas en `response`"""
+    return Response(
+        codificar(response, paginacion, contenido), media_type="application/json",
+        headers=dict(response.headers)
+    )
+
+# Carga masiva: arreglos JSON o flujos NDJSON procesados por lotes
+TAMANO_LOTE_CARGA = 1000
+TIPOS_NDJSON = ("application/x-ndjson", "application/jsonl", "application/ndjson")
+
+def parametros_carga(
+    lote: int = Query(TAMANO_LOTE_CARGA, ge=1, le=10000, description="Filas por executemany")
+):
+    return lote
+
+async def leer_filas(request: Request):
+    """Devuelve las filas del cuerpo; en NDJSON se leen a medida que llegan"""
+    if request.headers.get("content-type", "").split(";")[0].strip() in TIPOS_NDJSON:
+        resto = b""
+        async for trozo in request.stream():
+            resto += trozo
+            *lineas, resto = resto.split(b"\n")
+            for linea in lineas:
+                if linea.strip():
+                    yield linea
+        if resto.strip():
+            yield resto
+        return
+
+    try:
+        filas = json.loads(await request.body())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="El cuerpo no es JSON válido")
+    if not isinstance(filas, list):
+        raise HTTPException(status_code=400, detail="Se esperaba un arreglo JSON o NDJSON")
+    for fila in filas:
+        yield fila
+
+def describir_error(error):
+    if isinstance(error, json.JSONDecodeError):
+        return "JSON inválido"
+    if hasattr(error, "errors"):
+        return "; ".join(
+            f"{'.'.join(str(parte) for parte in detalle['loc'])}: {detalle['msg']}"
+            for detalle in error.errors()
+        )
+    return "Se esperaba un objeto JSON"
+
+async def cargar_por_lotes(request: Request, db: Session, esquema, insertar, lote: int, etiquetas_de):
+    """Valida cada fila con `esquema` e inserta los lotes válidos en una sola transacción.
+
+    Al confirmar se invalidan en la caché las etiquetas `etiquetas_de(fila)` de las filas cargadas.
+    """
+    insertados = 0
+    errores = []
+    pendientes = []
+    indices = []
+    etiquetas = set()
+
+    async def vaciar():
+        nonlocal insertados
+        rechazados = await ejecutar(db, insertar, pendientes)
+        for posicion in rechazados:
+            errores.append({"indice": indices[posicion], "detalle": "Autor no encontrado"})
+        insertados += len(pendientes) - len(rechazados)
+        for fila in pendientes:
+            etiquetas.update(etiquetas_de(fila))
+        pendientes.clear()
+        indices.clear()
+
+    indice = 0
+    async for fila in leer_filas(request):
+        try:
+            if isinstance(fila, bytes):
+                fila = json.loads(fila)
+            pendientes.append(esquema(**fila))
+            indices.append(indice)
+        except (ValueError, TypeError) as error:
+            errores.append({"indice": indice, "detalle": describir_error(error)})
+        indice += 1
+        if len(pendientes) >= lote:
+            await vaciar()
+    if pendientes:
+        await vaciar()
+
+    await ejecutar(db, Session.commit)
+    if insertados:
+        cache.respuestas.invalidar(*etiquetas)
+        cambios.avisos.avisar()
+    return {"insertados": insertados, "errores": errores}
+
+def etiquetas_autor_nuevo(autor):
+    return [cache.ETIQUETA_AUTORES, cache.ETIQUETA_ESTADISTICAS]
+
+def etiquetas_libro_nuevo(libro):
+    return [cache.etiqueta_autor(libro.autor_id), cache.ETIQUETA_ESTADISTICAS]
+
 # AUTORES
 @app.post("/autores/", response_model=schemas.Autor, status_code=status.HTTP_201_CREATED)
-def crear_autor(autor: schemas.AutorCreate, db: Session = Depends(get_db)):
-    db_autor = models.Autor(**autor.dict())
-    db.add(db_autor)
-    db.commit()
-    db.refresh(db_autor)
+async def crear_autor(autor: schemas.AutorCreate, db: Session = Depends(get_db_escritura)):
+    db_autor = await ejecutar(db, crud.crear_autor, autor)
+    cache.respuestas.invalidar(*etiquetas_autor_nuevo(db_autor))
+    cambios.avisos.avisar()
     return db_autor
 
-@app.get("/autores/", response_model=List[schemas.Autor])
-def listar_autores(db: Session = Depends(get_db)):
-    return db.query(models.Autor).all()
+@app.post("/autores/bulk", response_model=schemas.ResultadoCarga)
+async def crear_autores_masivo(
+    request: Request,
+    lote: int = Depends(parametros_carga),
+    db: Session = Depends(get_db_escritura)
+):
+    """Carga masiva de autores desde un arreglo JSON o NDJSON"""
+    return await cargar_por_lotes(
+        request, db, schemas.AutorCreate, crud.insertar_autores, lote, etiquetas_autor_nuevo
+    )
+
+@app.get("/autores/", response_model=Union[List[schemas.Autor], List[schemas.AutorConEstadisticas]])
+async def listar_autores(
+    request: Request,
+    response: Response,
+    include: str = Query(None, pattern="^stats$",
+                         description="stats: agregar cantidad de libros y rango de precios"),
+    paginacion: dict = Depends(parametros_paginacion),
+    db: Session = Depends(get_db_lectura)
+):
+    if include == "stats":
+        esquema, proyeccion = schemas.AutorConEstadisticas, serializacion.AUTOR_CON_ESTADISTICAS
+        construir = crud.consulta_autores_con_estadisticas
+        # Los agregados cambian con cada libro nuevo, igual que /estadisticas/
+        etiquetas = [cache.ETIQUETA_AUTORES, cache.ETIQUETA_ESTADISTICAS]
+    else:
+        esquema, proyeccion = schemas.Autor, serializacion.AUTOR
+        construir = crud.consulta_autores
+        etiquetas = [cache.ETIQUETA_AUTORES]
+    proyeccion = proyeccion_de(proyeccion, paginacion["campos"])
+
+    async def producir():
+        autores = await listar(
+            db, response, paginacion, esquema, models.Autor.id, construir,
+            proyeccion=proyeccion
+        )
+        if proyectada(paginacion):
+            return codificar(response, paginacion, cuerpo_proyectado(paginacion, proyeccion, autores))
+        return autores
+
+    if paginacion["formato"] == "ndjson":
+        return await producir()
+    return await cache.respuesta_cacheada(request, response, etiquetas, producir, List[esquema])
+
+@app.get("/autores/ranking", response_model=List[schemas.AutorConEstadisticas])
+async def ranking_autores(
+    request: Request,
+    response: Response,
+    por: str = Query("libros", pattern="^(libros|precio)$",
+                     description="libros (cantidad) o precio (promedio)"),
+    limit: int = Query(10, ge=1, le=LIMITE_MAXIMO, description="Cantidad de autores"),
+    db: Session = Depends(get_db_lectura)
+):
+    """Autores con más libros o mayor precio promedio, servidos desde un índice"""
+    async def producir():
+        return await ejecutar(db, crud.ranking_autores, por, limit)
+
+    return await cache.respuesta_cacheada(
+        request, response, [cache.ETIQUETA_ESTADISTICAS], producir,
+        List[schemas.AutorConEstadisticas]
+    )
 
 @app.get("/autores/{autor_id}", response_model=schemas.AutorConLibros)
-def obtener_autor_con_libros(autor_id: int, db: Session = Depends(get_db)):
-    autor = db.query(models.Autor).filter(models.Autor.id == autor_id).first()
-    if autor is None:
-        raise HTTPException(status_code=404, detail="Autor no encontrado")
-    return autor
+async def obtener_autor_con_libros(
+    autor_id: int,
+    request: Request,
+    response: Response,
+    campos: list = Depends(parametros_campos),
+    db: Session = Depends(get_db_lectura)
+):
+    """Con ?fields= (p. ej. nombre,libros.titulo) solo se leen esas columnas"""
+    proyeccion = proyeccion_de(serializacion.AUTOR_CON_LIBROS, campos)
+
+    async def producir():
+        if campos is None:
+            autor = await ejecutar(db, crud.obtener_autor_con_libros, autor_id)
+        else:
+            autor = await ejecutar(db, crud.obtener_autor_proyectado, autor_id, proyeccion)
+        if autor is None:
+            raise HTTPException(status_code=404, detail="Autor no encontrado")
+        if campos is not None:
+            return serializacion.codificar_json(serializacion.normalizar(proyeccion.esquema, autor))
+        return autor
+
+    return await cache.respuesta_cacheada(
+        request, response, [cache.etiqueta_autor(autor_id)], producir, schemas.AutorConLibros
+    )
 
 # LIBROS
 @app.post("/libros/", response_model=schemas.LibroConAutor, status_code=status.HTTP_201_CREATED)
-def crear_libro(libro: schemas.LibroCreate, db: Session = Depends(get_db)):
-    # Verificar que el autor existe
-    autor = db.query(models.Autor).filter(models.Autor.id == libro.autor_id).first()
-    if autor is None:
+async def crear_libro(libro: schemas.LibroCreate, db: Session = Depends(get_db_escritura)):
+    db_libro = await ejecutar(db, crud.crear_libro, libro)
+    if db_libro is None:
         raise HTTPException(status_code=404, detail="Autor no encontrado")
-    
-    db_libro = models.Libro(**libro.dict())
-    db.add(db_libro)
-    db.commit()
-    db.refresh(db_libro)
+    cache.respuestas.invalidar(*etiquetas_libro_nuevo(db_libro))
+    cambios.avisos.avisar()
     return db_libro
 
+@app.post("/libros/bulk", response_model=schemas.ResultadoCarga)
+async def crear_libros_masivo(
+    request: Request,
+    lote: int = Depends(parametros_carga),
+    db: Session = Depends(get_db_escritura)
+):
+    """Carga masiva de libros; el autor de cada lote se verifica con una sola consulta"""
+    return await cargar_por_lotes(
+        request, db, schemas.LibroCreate, crud.insertar_libros, lote, etiquetas_libro_nuevo
+    )
+
 @app.get("/libros/", response_model=List[schemas.LibroConAutor])
-def listar_libros_con_autor(db: Session = Depends(get_db)):
-    return db.query(models.Libro).all()
+async def listar_libros_con_autor(
+    response: Response,
+    paginacion: dict = Depends(parametros_paginacion_libros),
+    db: Session = Depends(get_db_lectura)
+):
+    """Con ?fields=id,titulo solo se leen esas columnas y sin autor no hay JOIN.
+
+    Con forma=normalizada la respuesta es {"libros": [...], "autores": {id: autor}}:
+    cada autor se envía una sola vez aunque tenga muchos libros en la página.
+    """
+    proyeccion = proyeccion_de(serializacion.LIBRO_CON_AUTOR, paginacion["campos"])
+    libros = await listar(
+        db, response, paginacion, schemas.LibroConAutor, models.Libro.id, crud.consulta_libros,
+        proyeccion=proyeccion
+    )
+    if paginacion["formato"] == "ndjson" or not proyectada(paginacion):
+        return libros
+    libros = cuerpo_proyectado(paginacion, proyeccion, libros)
+    if paginacion["forma"] == "normalizada":
+        return responder(response, paginacion, serializacion.separar_autores(libros))
+    return responder(response, paginacion, libros)
 
-@app.get("/libros/buscar/")
-def buscar_libros(
+@app.get("/libros/buscar/", response_model=schemas.BusquedaLibros)
+async def buscar_libros(
+    request: Request,
+    response: Response,
     titulo: str = Query(None, description="Buscar por título"),
     autor: str = Query(None, description="Buscar por autor"),
+    autor_id: int = Query(None, description="Libros de un autor"),
     precio_min: float = Query(None, description="Precio mínimo"),
     precio_max: float = Query(None, description="Precio máximo"),
-    db: Session = Depends(get_db)
-):
-    if titulo:
-        libros = crud.buscar_libros_por_titulo(db, titulo)
-    elif autor:
-        libros = crud.buscar_libros_por_autor(db, autor)
-    elif precio_min is not None and precio_max is not None:
-        libros = crud.obtener_libros_por_precio(db, precio_min, precio_max)
-    else:
-        libros = db.query(models.Libro).all()
+    paginas_min: int = Query(None, description="Número mínimo de páginas"),
+    paginas_max: int = Query(None, description="Número máximo de páginas"),
+    orden: str = Query(None, pattern="^(relevancia|id|-?precio|-?paginas|titulo)$",
+                       description="relevancia (por defecto al buscar texto), id, precio, paginas o titulo; '-' invierte"),
+    paginacion: dict = Depends(parametros_paginacion_libros),
+    db: Session = Depends(get_db_lectura)
+):
+    """Todos los filtros se pueden combinar y se resuelven en una única consulta"""
+    if orden is None:
+        orden = "relevancia" if titulo or autor else "id"
+    if orden != "id" and paginacion["after"] is not None:
+        raise HTTPException(status_code=400, detail="El cursor 'after' solo aplica con orden=id")
+    proyeccion = proyeccion_de(serializacion.LIBRO_CON_AUTOR, paginacion["campos"])
+
+    def buscar():
+        return listar(
+            db, response, paginacion, schemas.LibroConAutor, models.Libro.id,
+            crud.consulta_busqueda_libros,
+            proyeccion=proyeccion,
+            titulo=titulo,
+            autor=autor,
+            autor_id=autor_id,
+            precio_min=precio_min,
+            precio_max=precio_max,
+            paginas_min=paginas_min,
+            paginas_max=paginas_max,
+            orden=orden
+        )
+
+    if paginacion["formato"] == "ndjson":
+        return await buscar()
 
-    return {
-        "libros": libros,
-        "total": len(libros)
-    }
+    async def producir():
+        libros = await buscar()
+        if not proyectada(paginacion):
+            return {"libros": libros, "total": len(libros)}
+        libros = cuerpo_proyectado(paginacion, proyeccion, libros)
+        if paginacion["forma"] == "normalizada":
+            resultado = serializacion.separar_autores(libros)
+        else:
+            resultado = {"libros": libros}
+        resultado["total"] = len(libros)
+        return codificar(response, paginacion, resultado)
+
+    # Las ráfagas de búsquedas idénticas comparten una sola consulta
+    return await cache.respuesta_coalescida(request, response, producir, schemas.BusquedaLibros)
+
+@app.get("/libros/precios/histograma", response_model=schemas.HistogramaPrecios)
+async def histograma_precios(
+    request: Request,
+    response: Response,
+    limites: List[float] = Query(None, description="Límites de las cubetas en orden creciente (repetible)"),
+    cubetas: int = Query(10, ge=1, le=MAXIMO_CUBETAS, description="Cubetas del mismo ancho si no se dan límites"),
+    db: Session = Depends(get_db_lectura)
+):
+    """Cantidad de libros por rango de precio, calculada en SQL"""
+    if limites is not None:
+        if len(limites) >= MAXIMO_CUBETAS:
+            raise HTTPException(status_code=400,
+                                detail=f"A lo sumo {MAXIMO_CUBETAS - 1} límites ({MAXIMO_CUBETAS} cubetas)")
+        if not all(math.isfinite(limite) for limite in limites):
+            raise HTTPException(status_code=400, detail="Los límites deben ser números finitos")
+        if any(a >= b for a, b in zip(limites, limites[1:])):
+            raise HTTPException(status_code=400, detail="Los límites deben ser estrictamente crecientes")
+
+    async def producir():
+        return await ejecutar(db, crud.histograma_precios, limites, cubetas)
+
+    return await cache.respuesta_cacheada(
+        request, response, [cache.ETIQUETA_ESTADISTICAS], producir, schemas.HistogramaPrecios
+    )
+
+@app.get("/libros/precios/percentiles", response_model=schemas.PercentilesPrecio)
+async def percentiles_precio(
+    request: Request,
+    response: Response,
+    p: List[float] = Query([50, 90], description="Percentiles entre 0 y 100 (repetible)"),
+    db: Session = Depends(get_db_lectura)
+):
+    """Mediana, p90, etc. del precio sin cargar los libros"""
+    p = list(dict.fromkeys(p))  # Cada percentil repetido costaría otra lectura del índice
+    if len(p) > MAXIMO_PERCENTILES:
+        raise HTTPException(status_code=400, detail=f"A lo sumo {MAXIMO_PERCENTILES} percentiles distintos")
+    if any(not 0 <= percentil <= 100 for percentil in p):
+        raise HTTPException(status_code=400, detail="Los percentiles deben estar entre 0 y 100")
+
+    async def producir():
+        return await ejecutar(db, crud.percentiles_precio, p)
+
+    return await cache.respuesta_cacheada(
+        request, response, [cache.ETIQUETA_ESTADISTICAS], producir, schemas.PercentilesPrecio
+    )
 
 @app.get("/estadisticas/")
-def estadisticas_libros(db: Session = Depends(get_db)):
+async def estadisticas_libros(
+    request: Request,
+    response: Response,
+    fuente: str = Query("materializada", pattern="^(materializada|sql)$",
+                        description="materializada (O(1)) o sql (agregación exacta)"),
+    db: Session = Depends(get_db_lectura)
+):
     """Estadísticas básicas de la librería"""
-    total_libros = db.query(models.Libro).count()
-    total_autores = db.query(models.Autor).count()
-
-    if total_libros > 0:
-        precios = [libro.precio for libro in db.query(models.Libro).all()]
-        precio_promedio = sum(precios) / len(precios)
-        precio_max = max(precios)
-        precio_min = min(precios)
+    async def producir():
+        if fuente == "materializada":
+            estadisticas = await ejecutar(db, crud.leer_estadisticas_materializadas)
+            if estadisticas is not None:
+                return estadisticas
+        return await ejecutar(db, crud.calcular_estadisticas)
+
+    return await cache.respuesta_cacheada(
+        request, response, [cache.ETIQUETA_ESTADISTICAS], producir
+    )
+
+# CAMBIOS
+def cambio_como_evento(fila) -> bytes:
+    """Evento SSE `autor` o `libro` con la fila tal como la devuelve GET /cambios"""
+    if isinstance(fila, models.Autor):
+        tipo, esquema = "autor", schemas.AutorCambio
     else:
-        precio_promedio = precio_max = precio_min = 0
-
-    return {
-        "total_libros": total_libros,
-        "total_autores": total_autores,
-        "precio_promedio": round(precio_promedio, 2),
-        "precio_mas_alto": precio_max,
-        "precio_mas_bajo": precio_min
-    }
+        tipo, esquema = "libro", schemas.LibroCambio
+    return cambios.evento_sse(tipo, fila.secuencia, esquema.model_validate(fila).model_dump_json().encode())
+
+def pagina_cambios(db: Session, desde: int, limite: int) -> schemas.PaginaCambios:
+    filas, hay_mas = crud.cambios_desde(db, desde, limite)
+    return schemas.PaginaCambios(
+        autores=[schemas.AutorCambio.model_validate(fila) for fila in filas if isinstance(fila, models.Autor)],
+        libros=[schemas.LibroCambio.model_validate(fila) for fila in filas if isinstance(fila, models.Libro)],
+        siguiente=filas[-1].secuencia if filas else desde,
+        hay_mas=hay_mas,
+    )
+
+@app.get("/cambios", response_model=schemas.PaginaCambios)
+async def listar_cambios(
+    request: Request,
+    response: Response,
+    since: int = Query(0, ge=0, description="Última secuencia ya recibida (0: todo el catálogo)"),
+    limit: int = Query(TAMANO_LOTE_STREAMING, ge=1, le=LIMITE_MAXIMO),
+    db: Session = Depends(get_db_lectura)
+):
+    """Autores y libros creados o modificados después de `since`, en orden de secuencia.
+
+    Se piden páginas con since=`siguiente` hasta que `hay_mas` sea false; guardando
+    el último `siguiente`, la próxima sincronización trae solo lo nuevo.
+    """
+    return await cache.respuesta_coalescida(
+        request, response, lambda: ejecutar(db, pagina_cambios, since, limit), schemas.PaginaCambios
+    )
+
+@app.get("/cambios/stream")
+async def stream_cambios(
+    request: Request,
+    since: int = Query(0, ge=0, description="Última secuencia ya recibida (0: todo el catálogo)"),
+    primaria: Session = Depends(obtener_db)
+):
+    """Server-Sent Events: un evento `autor` o `libro` por cambio desde `since` (o desde
+    Last-Event-ID al reconectar) y después los nuevos a medida que se confirman"""
+    ultimo = request.headers.get("last-event-id", "")
+    desde = int(ultimo) if ultimo.isdigit() else since
+
+    def leer(sesion, desde):
+        try:
+            filas, hay_mas = crud.cambios_desde(sesion, desde, TAMANO_LOTE_STREAMING)
+            return [cambio_como_evento(fila) for fila in filas], hay_mas, filas[-1].secuencia if filas else desde
+        finally:
+            # Suelta la conexión entre lecturas; en WAL una transacción abierta
+            # seguiría viendo la base como estaba al empezar
+            sesion.rollback()
+
+    async def generar():
+        nonlocal desde
+        while True:
+            vista = cambios.avisos.version
+            # Una sesión por lectura: mientras espera avisos no retiene la réplica
+            async with sesion_lectura(request, primaria) as db:
+                eventos, hay_mas, desde = await ejecutar(db, leer, desde)
+            for evento in eventos:
+                yield evento
+            if not hay_mas and not await cambios.avisos.esperar(vista):
+                yield cambios.LATIDO
+
+    return StreamingResponse(generar(), media_type=cambios.TIPO_SSE, headers={"Cache-Control": "no-cache"})
+
+# EXPORTACIÓN
+def parametros_exportacion(
+    formato: str = Query("csv", pattern="^(csv|ndjson|arrow|parquet)$",
+                         description="csv, ndjson, arrow (Arrow IPC stream) o parquet")
+):
+    if not exportacion.disponible(formato):
+        raise HTTPException(status_code=406, detail="Arrow y Parquet no están disponibles en este servidor")
+    return formato
+
+def responder_exportacion(db, sentencia, formato: str, nombre: str):
+    codificador = exportacion.FORMATOS[formato]
+    return StreamingResponse(
+        exportacion.generar(db, sentencia, formato),
+        media_type=codificador.tipo,
+        headers={"Content-Disposition": f'attachment; filename="{nombre}.{codificador.extension}"'},
+    )
+
+@app.get("/export/libros")
+async def exportar_libros(formato: str = Depends(parametros_exportacion), db: Session = Depends(get_db_lectura)):
+    """Todos los libros con el nombre y la nacionalidad de su autor, en streaming"""
+    return responder_exportacion(db, crud.sentencia_exportar_libros(), formato, "libros")
+
+@app.get("/export/autores")
+async def exportar_autores(formato: str = Depends(parametros_exportacion), db: Session = Depends(get_db_lectura)):
+    """Todos los autores con sus agregados de precio, en streaming"""
+    return responder_exportacion(db, crud.sentencia_exportar_autores(), formato, "autores")
+
+# AUTENTICACIÓN
+@app.post("/auth/register", response_model=schemas.User, status_code=status.HTTP_201_CREATED)
+async def registrar_usuario(usuario: schemas.UserCreate, db: Session = Depends(get_db_escritura)):
+    if await ejecutar(db, crud.obtener_usuario_por_email, usuario.email) is not None:
+        raise HTTPException(status_code=400, detail="Email already registered")
+    hashed_password = await auth.get_password_hash(usuario.password)
+    db_usuario = await ejecutar(db, crud.crear_usuario, usuario, hashed_password)
+    if db_usuario is None:  # Otro registro con el mismo email ganó la carrera
+        raise HTTPException(status_code=400, detail="Email already registered")
+    return db_usuario
+
+@app.post("/auth/login", response_model=schemas.Token)
+async def login(form: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(obtener_db)):
+    """Formulario OAuth2 (username = email); bcrypt corre fuera del event loop"""
+    usuario = await ejecutar(db, crud.obtener_usuario_por_email, form.username)
+    valida = await auth.verify_password(form.password, usuario.hashed_password if usuario else None)
+    if not valida or not usuario.is_active:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Incorrect username or password",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return {"access_token": auth.create_access_token({"sub": usuario.email}), "token_type": "bearer"}
+
+@app.get("/auth/me", response_model=schemas.User)
+async def usuario_actual(usuario: schemas.User = Depends(auth.get_current_user)):
+    return usuario
+
+# TAREAS (cada usuario solo ve y modifica las suyas)
+@app.post("/tasks/", response_model=schemas.Task, status_code=status.HTTP_201_CREATED)
+async def crear_tarea(
+    tarea: schemas.TaskCreate,
+    usuario: schemas.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db_escritura)
+):
+    return await ejecutar(db, crud.crear_tarea, tarea, usuario.id)
+
+@app.get("/tasks/", response_model=List[schemas.Task])
+async def listar_tareas(
+    response: Response,
+    paginacion: dict = Depends(parametros_paginacion_tareas),
+    usuario: schemas.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db_lectura)
+):
+    return await listar(db, response, paginacion, schemas.Task, models.Task.id, crud.consulta_tareas,
+                        user_id=usuario.id)
+
+@app.get("/tasks/{task_id}", response_model=schemas.Task)
+async def obtener_tarea(
+    task_id: int,
+    usuario: schemas.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db_lectura)
+):
+    tarea = await ejecutar(db, crud.obtener_tarea, task_id, usuario.id)
+    if tarea is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    return tarea
+
+@app.put("/tasks/{task_id}", response_model=schemas.Task)
+async def actualizar_tarea(
+    task_id: int,
+    cambios: schemas.TaskUpdate,
+    usuario: schemas.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db_escritura)
+):
+    tarea = await ejecutar(db, crud.actualizar_tarea, task_id, usuario.id, cambios)
+    if tarea is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    return tarea
+
+@app.delete("/tasks/{task_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def eliminar_tarea(
+    task_id: int,
+    usuario: schemas.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db_escritura)
+):
+    if not await ejecutar(db, crud.eliminar_tarea, task_id, usuario.id):
+        raise HTTPException(status_code=404, detail="Task not found")
+    # Sin Response propia: así conserva la cookie que puso get_db_escritura
+
+@app.get("/cache/metricas")
+def metricas_cache():
+    """Aciertos, fallos e invalidaciones de la caché de respuestas y peticiones agrupadas"""
+    return {**cache.respuestas.metricas(), "coalescidas": cache.coalescedor.metricas()}
+
+@app.get("/admision/metricas")
+def metricas_admision():
+    """Peticiones en curso, en cola, admitidas y rechazadas por ruta"""
+    return admision.metricas()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metricas_prometheus():
+    """Métricas por ruta y de la caché en formato de texto de Prometheus"""
+    estado_cache = cache.respuestas.metricas()
+    adicionales = [
+        (f"libreria_cache_{nombre}_total", "counter", f"Caché de respuestas: {nombre}", estado_cache[nombre])
+        for nombre in ("aciertos", "fallos", "invalidaciones", "expulsiones")
+    ]
+    adicionales.append(("libreria_cache_entradas", "gauge", "Entradas en la caché de respuestas",
+                        estado_cache["entradas"]))
+    estado_coalescedor = cache.coalescedor.metricas()
+    adicionales += [
+        ("libreria_coalescidas_ejecuciones_total", "counter", "Lecturas ejecutadas por una petición líder",
+         estado_coalescedor["ejecuciones"]),
+        ("libreria_coalescidas_compartidas_total", "counter", "Peticiones que reutilizaron una ejecución en vuelo",
+         estado_coalescedor["compartidas"]),
+    ]
+    adicionales += [
+        (nombre, tipo, ayuda, admision.series(campo))
+        for nombre, tipo, ayuda, campo in (
+            ("libreria_admision_en_curso", "gauge", "Peticiones admitidas en ejecución", "en_curso"),
+            ("libreria_admision_en_cola", "gauge", "Peticiones esperando un lugar", "en_cola"),
+            ("libreria_admision_rechazadas_cola_total", "counter", "Rechazadas por cola llena", "rechazadas_cola"),
+            ("libreria_admision_rechazadas_espera_total", "counter", "Rechazadas por esperar demasiado en la cola",
+             "rechazadas_espera"),
+        )
+    ]
+    estado_replicas = replicas.metricas()
+    adicionales += [
+        ("libreria_replica_lecturas_total", "counter", "Sesiones de lectura abiertas en cada réplica",
+         [({"replica": str(i)}, replica["lecturas"]) for i, replica in enumerate(estado_replicas["replicas"])]),
+        ("libreria_replica_sesiones_abiertas", "gauge", "Sesiones de lectura en uso por réplica",
+         [({"replica": str(i)}, replica["abiertas"]) for i, replica in enumerate(estado_replicas["replicas"])]),
+        ("libreria_lecturas_primaria_total", "counter", "Lecturas enviadas a la primaria tras una escritura",
+         estado_replicas["lecturas_primaria"]),
+    ]
+    return metricas.registro.exportar(adicionales)
 
 @app.get("/")
 def root():
@@ -0,0 +1,204 @@
+"""Métricas por ruta (latencia, consultas SQL, tiempo SQL y filas) en formato Prometheus"""
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+METRICAS_HABILITADAS = os.getenv("LIBRERIA_METRICAS", "1").lower() in ("1", "true", "si")
+# Consultas más lentas que este umbral se registran como advertencia (0 = desactivado)
+SQL_LENTO_SEGUNDOS = float(os.getenv("LIBRERIA_SQL_LENTO_MS", "0")) / 1000
+
+LIMITES_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+logger = logging.getLogger("libreria.sql")
+
+
+class MedicionPeticion:
+    """Acumulados de SQL de una sola petición"""
+    __slots__ = ("consultas", "tiempo_sql", "filas")
+
+    def __init__(self):
+        self.consultas = 0
+        self.tiempo_sql = 0.0
+        self.filas = 0
+
+# Se copia al threadpool junto con el contexto, así los hooks del engine
+# suman en la medición de la petición que los originó
+_peticion_actual: ContextVar = ContextVar("medicion_peticion", default=None)
+
+
+class RegistroMetricas:
+    def __init__(self, limites=LIMITES_LATENCIA):
+        self.limites = limites
+        self._lock = threading.Lock()
+        self.limpiar()
+
+    def limpiar(self):
+        self.peticiones = defaultdict(int)          # (metodo, ruta, estado)
+        self.cubetas = defaultdict(lambda: [0] * (len(self.limites) + 1))  # (metodo, ruta)
+        self.duracion_total = defaultdict(float)    # (metodo, ruta)
+        self.consultas = defaultdict(int)           # ruta
+        self.tiempo_sql = defaultdict(float)        # ruta
+        self.filas = defaultdict(int)               # ruta
+
+    def observar(self, metodo, ruta, estado, duracion, medicion: MedicionPeticion):
+        with self._lock:
+            self.peticiones[(metodo, ruta, estado)] += 1
+            self.cubetas[(metodo, ruta)][bisect_left(self.limites, duracion)] += 1
+            self.duracion_total[(metodo, ruta)] += duracion
+            self.consultas[ruta] += medicion.consultas
+            self.tiempo_sql[ruta] += medicion.tiempo_sql
+            self.filas[ruta] += medicion.filas
+
+    def exportar(self, adicionales=()):
+        """Texto en formato de exposición de Prometheus.
+
+        `adicionales` son tuplas (nombre, tipo, ayuda, valor); `valor` es un
+        número o una lista de pares (etiquetas, número) para series con etiquetas.
+        """
+        lineas = []
+
+        def encabezado(nombre, tipo, ayuda):
+            lineas.append(f"# HELP {nombre} {ayuda}")
+            lineas.append(f"# TYPE {nombre} {tipo}")
+
+        with self._lock:
+            encabezado("libreria_peticiones_total", "counter", "Peticiones HTTP atendidas")
+            for (metodo, ruta, estado), total in sorted(self.peticiones.items()):
+                lineas.append(
+                    f"libreria_peticiones_total{_etiquetas(metodo=metodo, ruta=ruta, estado=estado)} {total}"
+                )
+
+            nombre = "libreria_peticion_duracion_segundos"
+            encabezado(nombre, "histogram", "Latencia de las peticiones por ruta")
+            for (metodo, ruta), cubetas in sorted(self.cubetas.items()):
+                acumulado = 0
+                for limite, cantidad in zip(self.limites + (float("inf"),), cubetas):
+                    acumulado += cantidad
+                    le = "+Inf" if limite == float("inf") else repr(limite)
+                    lineas.append(f"{nombre}_bucket{_etiquetas(metodo=metodo, ruta=ruta, le=le)} {acumulado}")
+                lineas.append(f"{nombre}_sum{_etiquetas(metodo=metodo, ruta=ruta)} {self.duracion_total[(metodo, ruta)]}")
+                lineas.append(f"{nombre}_count{_etiquetas(metodo=metodo, ruta=ruta)} {acumulado}")
+
+            for nombre, ayuda, valores in (
+                ("libreria_sql_consultas_total", "Sentencias SQL ejecutadas por ruta", self.consultas),
+                ("libreria_sql_segundos_total", "Tiempo total en SQL por ruta", self.tiempo_sql),
+                ("libreria_sql_filas_total", "Filas devueltas o afectadas por ruta", self.filas),
+            ):
+                encabezado(nombre, "counter", ayuda)
+                for ruta, valor in sorted(valores.items()):
+                    lineas.append(f"{nombre}{_etiquetas(ruta=ruta)} {valor}")
+
+        for nombre, tipo, ayuda, valor in adicionales:
+            encabezado(nombre, tipo, ayuda)
+            if isinstance(valor, list):
+                lineas.extend(f"{nombre}{_etiquetas(**etiquetas)} {numero}" for etiquetas, numero in valor)
+            else:
+                lineas.append(f"{nombre} {valor}")
+        return "\n".join(lineas) + "\n"
+
+def _etiquetas(**valores):
+    def escapar(valor):
+        return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{clave}="{escapar(valor)}"' for clave, valor in valores.items()) + "}"
+
+registro = RegistroMetricas()
+
+
+class MiddlewareMetricas:
+    """Middleware ASGI: mide cada petición hasta enviar el último byte (incluye streaming)"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        medicion = MedicionPeticion()
+        token = _peticion_actual.set(medicion)
+        estado = 500
+
+        async def enviar(mensaje):
+            nonlocal estado
+            if mensaje["type"] == "http.response.start":
+                estado = mensaje["status"]
+            await send(mensaje)
+
+        inicio = time.perf_counter()
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            _peticion_actual.reset(token)
+            ruta = scope["route"].path if "route" in scope else "sin_ruta"
+            registro.observar(scope["method"], ruta, estado, time.perf_counter() - inicio, medicion)
+
+
+class _CursorContado:
+    """Cursor DBAPI que suma a una medición las filas que se leen de él"""
+    __slots__ = ("_cursor", "_medicion")
+
+    def __init__(self, cursor, medicion: MedicionPeticion):
+        self._cursor = cursor
+        self._medicion = medicion
+
+    def fetchone(self):
+        fila = self._cursor.fetchone()
+        if fila is not None:
+            self._medicion.filas += 1
+        return fila
+
+    def fetchmany(self, *args, **kwargs):
+        filas = self._cursor.fetchmany(*args, **kwargs)
+        self._medicion.filas += len(filas)
+        return filas
+
+    def fetchall(self):
+        filas = self._cursor.fetchall()
+        self._medicion.filas += len(filas)
+        return filas
+
+    def __getattr__(self, nombre):
+        return getattr(self._cursor, nombre)
+
+
+def _antes_de_ejecutar(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("inicio_consultas", []).append(time.perf_counter())
+
+def _despues_de_ejecutar(conn, cursor, statement, parameters, context, executemany):
+    duracion = time.perf_counter() - conn.info["inicio_consultas"].pop()
+    medicion = _peticion_actual.get()
+    if medicion is not None:
+        medicion.consultas += 1
+        medicion.tiempo_sql += duracion
+        if cursor.description is not None:
+            # El resultado se arma desde context.cursor: así se cuentan las filas
+            # devueltas por cualquier SELECT (ORM, proyecciones, Core, streaming)
+            context.cursor = _CursorContado(cursor, medicion)
+        elif cursor.rowcount > 0:
+            medicion.filas += cursor.rowcount  # Filas afectadas por escrituras
+    if SQL_LENTO_SEGUNDOS and duracion >= SQL_LENTO_SEGUNDOS:
+        logger.warning("Consulta lenta (%.1f ms): %s", duracion * 1000, statement[:500])
+
+def _error_al_ejecutar(contexto):
+    # Sin after_cursor_execute el inicio de la sentencia fallida quedaría en la pila
+    if contexto.connection is not None:
+        inicios = contexto.connection.info.get("inicio_consultas")
+        if inicios:
+            inicios.pop()
+
+def instrumentar(app):
+    """Registra el middleware y los hooks de SQLAlchemy; sin costo si está deshabilitado"""
+    if METRICAS_HABILITADAS:
+        app.add_middleware(MiddlewareMetricas)
+    if METRICAS_HABILITADAS or SQL_LENTO_SEGUNDOS:
+        # Sobre la clase Engine: cubre el engine principal, el async y los de pruebas
+        event.listen(Engine, "before_cursor_execute", _antes_de_ejecutar)
+        event.listen(Engine, "after_cursor_execute", _despues_de_ejecutar)
+        event.listen(Engine, "handle_error", _error_al_ejecutar)
@@ -0,0 +1,29 @@
+"""Crea las tablas, índices, triggers e índice de búsqueda que falten y
+actualiza las estadísticas del planificador (ANALYZE).
+
+Pensado para correr una vez antes de levantar la API con
+LIBRERIA_CREAR_ESQUEMA=0, de modo que los workers no toquen el esquema.
+
+Uso: python migrar.py [--url URL]   (por defecto LIBRERIA_DATABASE_URL)
+"""
+import argparse
+import time
+
+import models
+from database import SQLALCHEMY_DATABASE_URL, crear_engine
+
+def main():
+    parser = argparse.ArgumentParser(description="Crea o completa el esquema de la librería")
+    parser.add_argument("--url", default=SQLALCHEMY_DATABASE_URL, help="URL de SQLAlchemy")
+    args = parser.parse_args()
+
+    motor = crear_engine(args.url)
+    inicio = time.perf_counter()
+    try:
+        models.Base.metadata.create_all(bind=motor)
+    finally:
+        motor.dispose()
+    print(f"Esquema listo en {motor.url.render_as_string()} ({(time.perf_counter() - inicio) * 1000:.1f} ms)")
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,13 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey
-from sqlalchemy.orm import relationship
+from datetime import datetime, timezone
+
+from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Index, DDL, event, inspect
+from sqlalchemy.schema import CreateColumn
+from sqlalchemy.orm import deferred, relationship
 from database import Base
 
+def ahora_utc():
+    return datetime.now(timezone.utc)
+
 class Autor(Base):
     __tablename__ = "autores"
 
@@ -9,9 +15,30 @@ class Autor(Base):
     nombre = Column(String, index=True)
     nacionalidad = Column(String)
 
+    # Agregados de sus libros, mantenidos por triggers (ver ESTADISTICAS_AUTOR_DDL).
+    # Diferidos: solo se leen con undefer_group("estadisticas")
+    total_libros = deferred(Column(Integer, nullable=False, default=0, server_default="0"), group="estadisticas")
+    suma_precios = deferred(Column(Float, nullable=False, default=0, server_default="0"), group="estadisticas")
+    precio_min = deferred(Column(Float), group="estadisticas")
+    precio_max = deferred(Column(Float), group="estadisticas")
+    precio_promedio = deferred(Column(Float), group="estadisticas")
+
+    # Seguimiento de cambios (ver CAMBIOS_DDL): la secuencia la asignan los triggers.
+    # Diferidas como los agregados: solo GET /cambios las lee
+    created_at = deferred(Column(DateTime, default=ahora_utc), group="cambios")
+    updated_at = deferred(Column(DateTime, default=ahora_utc, onupdate=ahora_utc), group="cambios")
+    secuencia = deferred(Column(Integer), group="cambios")
+
     # Relación: un autor tiene muchos libros
     libros = relationship("Libro", back_populates="autor")
 
+    # Índices para GET /autores/ranking (el id desempata dentro del índice)
+    __table_args__ = (
+        Index("ix_autores_total_libros", "total_libros"),
+        Index("ix_autores_precio_promedio", "precio_promedio"),
+        Index("ix_autores_secuencia", "secuencia"),  # GET /cambios?since=
+    )
+
 class Libro(Base):
     __tablename__ = "libros"
 
@@ -22,4 +49,312 @@ class Libro(Base):
 
     # Relación con autor
     autor_id = Column(Integer, ForeignKey("autores.id"))
-    autor = relationship("Autor", back_populates="libros")
\ No newline at end of file
+    autor = relationship("Autor", back_populates="libros")
+
+    created_at = deferred(Column(DateTime, default=ahora_utc), group="cambios")
+    updated_at = deferred(Column(DateTime, default=ahora_utc, onupdate=ahora_utc), group="cambios")
+    secuencia = deferred(Column(Integer), group="cambios")
+
+    # Índices para los filtros combinables de /libros/buscar/ y para GET /cambios
+    __table_args__ = (
+        Index("ix_libros_autor_precio", "autor_id", "precio"),
+        Index("ix_libros_precio", "precio"),
+        Index("ix_libros_paginas", "paginas"),
+        Index("ix_libros_secuencia", "secuencia"),
+    )
+
+def crear_columnas_faltantes(target, connection, **kw):
+    """create_all tampoco agrega columnas nuevas a tablas existentes: se agregan
+    con ALTER TABLE y se ejecuta el recálculo registrado para la tabla"""
+    inspector = inspect(connection)
+    for tabla in target.sorted_tables:
+        existentes = {columna["name"] for columna in inspector.get_columns(tabla.name)}
+        faltantes = [columna for columna in tabla.columns if columna.name not in existentes]
+        for columna in faltantes:
+            definicion = CreateColumn(columna).compile(dialect=connection.dialect)
+            connection.exec_driver_sql(f"ALTER TABLE {tabla.name} ADD COLUMN {definicion}")
+        if faltantes:
+            for sentencia in RECALCULOS_AL_MIGRAR.get(tabla.name, []):
+                connection.exec_driver_sql(sentencia)
+
+event.listen(Base.metadata, "after_create", crear_columnas_faltantes)
+
+def crear_indices_faltantes(target, connection, **kw):
+    """create_all no agrega índices nuevos a tablas que ya existen; se crean aquí si faltan"""
+    for tabla in target.sorted_tables:
+        for indice in tabla.indexes:
+            indice.create(connection, checkfirst=True)
+
+event.listen(Base.metadata, "after_create", crear_indices_faltantes)
+
+
+class EstadisticasLibreria(Base):
+    """Fila única (id=1) con agregados de la librería mantenidos por triggers"""
+    __tablename__ = "estadisticas"
+
+    id = Column(Integer, primary_key=True)
+    total_libros = Column(Integer, nullable=False, default=0)
+    total_autores = Column(Integer, nullable=False, default=0)
+    suma_precios = Column(Float, nullable=False, default=0)
+    precio_max = Column(Float)
+    precio_min = Column(Float)
+
+class SecuenciaCambios(Base):
+    """Fila única (id=1) con la última secuencia de cambio asignada por los triggers"""
+    __tablename__ = "secuencia_cambios"
+
+    id = Column(Integer, primary_key=True)
+    valor = Column(Integer, nullable=False, default=0)
+
+class User(Base):
+    __tablename__ = "users"
+
+    id = Column(Integer, primary_key=True, index=True)
+    email = Column(String, unique=True, index=True, nullable=False)
+    hashed_password = Column(String, nullable=False)
+    full_name = Column(String, nullable=False)
+    is_active = Column(Boolean, nullable=False, default=True, server_default="1")
+    created_at = Column(DateTime, nullable=False, default=ahora_utc)
+
+    tasks = relationship("Task", back_populates="owner")
+
+class Task(Base):
+    __tablename__ = "tasks"
+
+    id = Column(Integer, primary_key=True, index=True)
+    title = Column(String, nullable=False)
+    description = Column(String)
+    priority = Column(String, nullable=False, default="medium", server_default="medium")
+    created_at = Column(DateTime, nullable=False, default=ahora_utc)
+
+    # Cada usuario solo ve sus tareas: todas las consultas filtran por user_id
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    owner = relationship("User", back_populates="tasks")
+
+
+# Triggers de SQLite que mantienen la fila de estadísticas en cada escritura,
+# sin importar si viene de la API, de una carga masiva o de la sesión directa.
+# Las altas son O(1); bajas y cambios de precio recalculan el máximo/mínimo.
+ESTADISTICAS_DDL = [
+    """INSERT OR IGNORE INTO estadisticas
+        (id, total_libros, total_autores, suma_precios, precio_max, precio_min)
+    SELECT 1,
+        (SELECT COUNT(*) FROM libros),
+        (SELECT COUNT(*) FROM autores),
+        (SELECT COALESCE(SUM(precio), 0) FROM libros),
+        (SELECT MAX(precio) FROM libros),
+        (SELECT MIN(precio) FROM libros)""",
+    """CREATE TRIGGER IF NOT EXISTS estadisticas_libro_insert AFTER INSERT ON libros
+    BEGIN
+        UPDATE estadisticas SET
+            total_libros = total_libros + 1,
+            suma_precios = suma_precios + COALESCE(NEW.precio, 0),
+            precio_max = COALESCE(MAX(precio_max, NEW.precio), precio_max, NEW.precio),
+            precio_min = COALESCE(MIN(precio_min, NEW.precio), precio_min, NEW.precio)
+        WHERE id = 1;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS estadisticas_libro_delete AFTER DELETE ON libros
+    BEGIN
+        UPDATE estadisticas SET
+            total_libros = total_libros - 1,
+            suma_precios = suma_precios - COALESCE(OLD.precio, 0),
+            precio_max = (SELECT MAX(precio) FROM libros),
+            precio_min = (SELECT MIN(precio) FROM libros)
+        WHERE id = 1;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS estadisticas_libro_precio AFTER UPDATE OF precio ON libros
+    BEGIN
+        UPDATE estadisticas SET
+            suma_precios = suma_precios - COALESCE(OLD.precio, 0) + COALESCE(NEW.precio, 0),
+            precio_max = (SELECT MAX(precio) FROM libros),
+            precio_min = (SELECT MIN(precio) FROM libros)
+        WHERE id = 1;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS estadisticas_autor_insert AFTER INSERT ON autores
+    BEGIN
+        UPDATE estadisticas SET total_autores = total_autores + 1 WHERE id = 1;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS estadisticas_autor_delete AFTER DELETE ON autores
+    BEGIN
+        UPDATE estadisticas SET total_autores = total_autores - 1 WHERE id = 1;
+    END""",
+]
+
+# Se registran sobre el metadata para que libros y autores ya existan
+for sentencia in ESTADISTICAS_DDL:
+    event.listen(Base.metadata, "after_create", DDL(sentencia).execute_if(dialect="sqlite"))
+
+
+# Agregados por autor: el alta de un libro es O(1); bajas y cambios de precio
+# o de autor recalculan solo los autores afectados usando ix_libros_autor_precio.
+def recalcular_autores(condicion=""):
+    return f"""UPDATE autores SET
+        total_libros = (SELECT COUNT(*) FROM libros WHERE libros.autor_id = autores.id),
+        suma_precios = (SELECT COALESCE(SUM(precio), 0) FROM libros WHERE libros.autor_id = autores.id),
+        precio_max = (SELECT MAX(precio) FROM libros WHERE libros.autor_id = autores.id),
+        precio_min = (SELECT MIN(precio) FROM libros WHERE libros.autor_id = autores.id),
+        precio_promedio = (SELECT SUM(precio) * 1.0 / COUNT(*) FROM libros WHERE libros.autor_id = autores.id)
+    {condicion}"""
+
+ESTADISTICAS_AUTOR_DDL = [
+    """CREATE TRIGGER IF NOT EXISTS autores_libro_insert AFTER INSERT ON libros
+    BEGIN
+        UPDATE autores SET
+            total_libros = total_libros + 1,
+            suma_precios = suma_precios + COALESCE(NEW.precio, 0),
+            precio_max = COALESCE(MAX(precio_max, NEW.precio), precio_max, NEW.precio),
+            precio_min = COALESCE(MIN(precio_min, NEW.precio), precio_min, NEW.precio),
+            precio_promedio = (suma_precios + COALESCE(NEW.precio, 0)) / (total_libros + 1)
+        WHERE id = NEW.autor_id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS autores_libro_delete AFTER DELETE ON libros
+    BEGIN
+        {recalcular_autores("WHERE id = OLD.autor_id")};
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS autores_libro_update AFTER UPDATE OF precio, autor_id ON libros
+    BEGIN
+        {recalcular_autores("WHERE id IN (OLD.autor_id, NEW.autor_id)")};
+    END""",
+]
+
+for sentencia in ESTADISTICAS_AUTOR_DDL:
+    event.listen(Base.metadata, "after_create", DDL(sentencia).execute_if(dialect="sqlite"))
+
+# Si las columnas de agregados se agregan a una base existente, se llenan una vez
+RECALCULOS_AL_MIGRAR = {
+    "autores": [recalcular_autores()],
+}
+
+
+# Secuencia de cambios para GET /cambios: cada alta o cambio de un autor o un
+# libro toma el siguiente valor del contador. SQLite admite un solo escritor a
+# la vez, así que la secuencia crece en el orden en que se confirman las
+# transacciones y un cliente puede seguir leyendo desde la última que vio.
+# Cambios en los agregados (triggers de arriba) no cuentan: no son datos del autor.
+# El mismo trigger marca updated_at: el onupdate de la ORM no cubre los UPDATE
+# masivos ni los hechos fuera de ella, y el feed informaría una hora vieja.
+COLUMNAS_CON_CAMBIOS = {
+    "autores": "nombre, nacionalidad",
+    "libros": "titulo, precio, paginas, autor_id",
+}
+# Hora UTC en el formato en que SQLAlchemy guarda los DateTime en SQLite (los %
+# van dobles porque DDL() formatea la sentencia)
+AHORA_SQL = "strftime('%%Y-%%m-%%d %%H:%%M:%%f', 'now')"
+
+def asignar_secuencia(tabla, marcas):
+    return f"""UPDATE secuencia_cambios SET valor = valor + 1 WHERE id = 1;
+        UPDATE {tabla} SET secuencia = (SELECT valor FROM secuencia_cambios WHERE id = 1), {marcas}
+        WHERE id = NEW.id;"""
+
+CAMBIOS_DDL = [
+    """INSERT OR IGNORE INTO secuencia_cambios (id, valor)
+    SELECT 1, MAX(
+        (SELECT COALESCE(MAX(secuencia), 0) FROM autores),
+        (SELECT COALESCE(MAX(secuencia), 0) FROM libros))""",
+]
+for tabla, columnas in COLUMNAS_CON_CAMBIOS.items():
+    # Se recrean en cada arranque: IF NOT EXISTS dejaría la versión anterior
+    # de los triggers en las bases que ya los tenían
+    CAMBIOS_DDL += [
+        f"DROP TRIGGER IF EXISTS {tabla}_secuencia_insert",
+        f"""CREATE TRIGGER {tabla}_secuencia_insert AFTER INSERT ON {tabla}
+    BEGIN
+        {asignar_secuencia(tabla, f"created_at = COALESCE(created_at, {AHORA_SQL}), "
+                                  f"updated_at = COALESCE(updated_at, created_at, {AHORA_SQL})")}
+    END""",
+        f"DROP TRIGGER IF EXISTS {tabla}_secuencia_update",
+        f"""CREATE TRIGGER {tabla}_secuencia_update AFTER UPDATE OF {columnas} ON {tabla}
+    BEGIN
+        {asignar_secuencia(tabla, f"updated_at = {AHORA_SQL}")}
+    END""",
+    ]
+
+for sentencia in CAMBIOS_DDL:
+    event.listen(Base.metadata, "after_create", DDL(sentencia).execute_if(dialect="sqlite"))
+
+# Filas existentes al agregar las columnas: primero los autores y después los
+# libros, en orden de id (el contador arranca desde la mayor, ver CAMBIOS_DDL)
+RECALCULOS_AL_MIGRAR["autores"].append(
+    "UPDATE autores SET secuencia = id, created_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP "
+    "WHERE secuencia IS NULL"
+)
+RECALCULOS_AL_MIGRAR["libros"] = [
+    "UPDATE libros SET secuencia = id + (SELECT COALESCE(MAX(secuencia), 0) FROM autores), "
+    "created_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP WHERE secuencia IS NULL"
+]
+
+
+# Índice de texto completo (FTS5) sobre títulos y nombres de autor. Las filas
+# usan el id del libro como rowid; remove_diacritics hace que "Espiritus"
+# coincida con "Espíritus". Se mantiene sincronizado con triggers.
+BUSQUEDA_TABLA = "libros_fts"
+
+BUSQUEDA_TRIGGERS = [
+    """CREATE TRIGGER IF NOT EXISTS libros_fts_insert AFTER INSERT ON libros
+    BEGIN
+        INSERT INTO libros_fts (rowid, titulo, autor)
+        VALUES (NEW.id, NEW.titulo, (SELECT nombre FROM autores WHERE id = NEW.autor_id));
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS libros_fts_delete AFTER DELETE ON libros
+    BEGIN
+        DELETE FROM libros_fts WHERE rowid = OLD.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS libros_fts_update AFTER UPDATE OF titulo, autor_id ON libros
+    BEGIN
+        UPDATE libros_fts SET
+            titulo = NEW.titulo,
+            autor = (SELECT nombre FROM autores WHERE id = NEW.autor_id)
+        WHERE rowid = NEW.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS libros_fts_autor_update AFTER UPDATE OF nombre ON autores
+    BEGIN
+        UPDATE libros_fts SET autor = NEW.nombre
+        WHERE rowid IN (SELECT id FROM libros WHERE autor_id = NEW.id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS libros_fts_autor_delete AFTER DELETE ON autores
+    BEGIN
+        UPDATE libros_fts SET autor = NULL
+        WHERE rowid IN (SELECT id FROM libros WHERE autor_id = OLD.id);
+    END""",
+]
+
+def crear_indice_busqueda(target, connection, **kw):
+    if connection.dialect.name != "sqlite":
+        return
+    existe = connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE name = ?", (BUSQUEDA_TABLA,)
+    ).first()
+    if not existe:
+        connection.exec_driver_sql(
+            f"CREATE VIRTUAL TABLE {BUSQUEDA_TABLA} USING fts5("
+            "titulo, autor, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+        # Indexar los libros que ya existían antes de crear el índice
+        connection.exec_driver_sql(
+            f"INSERT INTO {BUSQUEDA_TABLA} (rowid, titulo, autor) "
+            "SELECT libros.id, libros.titulo, autores.nombre "
+            "FROM libros LEFT JOIN autores ON autores.id = libros.autor_id"
+        )
+    for sentencia in BUSQUEDA_TRIGGERS:
+        connection.exec_driver_sql(sentencia)
+
+event.listen(Base.metadata, "after_create", crear_indice_busqueda)
+# La tabla virtual no forma parte del metadata: se elimina junto con las demás
+event.listen(
+    Base.metadata, "before_drop",
+    DDL(f"DROP TABLE IF EXISTS {BUSQUEDA_TABLA}").execute_if(dialect="sqlite")
+)
+
+# Estadísticas del planificador (sqlite_stat1): con ellas SQLite elige entre un
+# índice y recorrer la tabla según los datos reales. analysis_limit acota las
+# filas que ANALYZE lee por índice, así el arranque no depende del tamaño de la base
+LIMITE_ANALISIS = 1000
+
+def actualizar_estadisticas(target, connection, **kw):
+    if connection.dialect.name != "sqlite":
+        return
+    connection.exec_driver_sql(f"PRAGMA analysis_limit = {LIMITE_ANALISIS}")
+    connection.exec_driver_sql("ANALYZE")
+
+# Después de los demás: analiza también los índices recién creados
+event.listen(Base.metadata, "after_create", actualizar_estadisticas)
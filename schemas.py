@@ -1,3 +1,6 @@
+import re
+from datetime import datetime
+
 from pydantic import BaseModel, validator
 from typing import List, Optional
 
@@ -14,6 +17,19 @@ class Autor(AutorBase):
     class Config:
         from_attributes = True
 
+class AutorConEstadisticas(Autor):
+    total_libros: int
+    precio_min: Optional[float] = None
+    precio_max: Optional[float] = None
+    precio_promedio: Optional[float] = None
+
+    @validator('precio_promedio')
+    def redondear_promedio(cls, v):
+        return round(v, 2) if v is not None else v
+
+    class Config:
+        from_attributes = True
+
 class LibroBase(BaseModel):
     titulo: str
     precio: float
@@ -52,4 +68,149 @@ class AutorConLibros(Autor):
     libros: List[LibroBase] = []
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class BusquedaLibros(BaseModel):
+    libros: List[LibroConAutor]
+    total: int
+
+class CubetaPrecio(BaseModel):
+    desde: Optional[float] = None  # None: sin límite inferior
+    hasta: Optional[float] = None  # None: sin límite superior
+    total: int
+
+class HistogramaPrecios(BaseModel):
+    cubetas: List[CubetaPrecio]
+    total: int
+
+class PercentilPrecio(BaseModel):
+    percentil: float
+    precio: Optional[float] = None
+
+class PercentilesPrecio(BaseModel):
+    total: int
+    percentiles: List[PercentilPrecio]
+
+class ErrorCarga(BaseModel):
+    indice: int
+    detalle: str
+
+class ResultadoCarga(BaseModel):
+    insertados: int
+    errores: List[ErrorCarga] = []
+
+# CAMBIOS (sincronización incremental)
+class AutorCambio(Autor):
+    secuencia: int
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class LibroCambio(LibroBase):
+    id: int
+    secuencia: int
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class PaginaCambios(BaseModel):
+    autores: List[AutorCambio]
+    libros: List[LibroCambio]
+    siguiente: int  # `since` de la próxima página (la mayor secuencia de esta)
+    hay_mas: bool
+
+# USUARIOS Y TAREAS
+PATRON_EMAIL = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+LARGO_MINIMO_PASSWORD = 8
+PRIORIDADES = ("low", "medium", "high")
+
+class UserBase(BaseModel):
+    email: str
+    full_name: str
+
+    @validator('email')
+    def validar_email(cls, v):
+        if not PATRON_EMAIL.match(v):
+            raise ValueError('Email inválido')
+        return v.lower()
+
+    @validator('full_name')
+    def validar_nombre(cls, v):
+        if not v.strip():
+            raise ValueError('El nombre no puede estar vacío')
+        return v.strip()
+
+class UserCreate(UserBase):
+    password: str
+
+    @validator('password')
+    def validar_password(cls, v):
+        if len(v) < LARGO_MINIMO_PASSWORD:
+            raise ValueError(f'La contraseña debe tener al menos {LARGO_MINIMO_PASSWORD} caracteres')
+        return v
+
+class User(UserBase):
+    id: int
+    is_active: bool = True
+
+    class Config:
+        from_attributes = True
+
+class Token(BaseModel):
+    access_token: str
+    token_type: str = "bearer"
+
+class TaskBase(BaseModel):
+    title: str
+    description: Optional[str] = None
+    priority: str = "medium"
+
+    @validator('title')
+    def validar_titulo(cls, v):
+        if not v.strip():
+            raise ValueError('El título no puede estar vacío')
+        return v.strip()
+
+    @validator('description')
+    def validar_descripcion(cls, v):
+        if v is not None and len(v) > 1000:
+            raise ValueError('La descripción admite hasta 1000 caracteres')
+        return v
+
+    @validator('priority')
+    def validar_prioridad(cls, v):
+        if v not in PRIORIDADES:
+            raise ValueError(f"La prioridad debe ser una de: {', '.join(PRIORIDADES)}")
+        return v
+
+class TaskCreate(TaskBase):
+    pass
+
+class TaskUpdate(TaskBase):
+    """Actualización parcial: solo se cambian los campos enviados"""
+    title: Optional[str] = None
+    priority: Optional[str] = None
+
+    # Los validadores solo corren con valores enviados: null explícito no es válido
+    @validator('title')
+    def validar_titulo(cls, v):
+        if v is None or not v.strip():
+            raise ValueError('El título no puede estar vacío')
+        return v.strip()
+
+    @validator('priority')
+    def validar_prioridad(cls, v):
+        if v not in PRIORIDADES:
+            raise ValueError(f"La prioridad debe ser una de: {', '.join(PRIORIDADES)}")
+        return v
+
+class Task(TaskBase):
+    id: int
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
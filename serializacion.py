@@ -0,0 +1,204 @@
+"""Ruta rápida de serialización: columnas planas -> dicts -> JSON, sin modelos Pydantic por fila"""
+import json
+from functools import lru_cache
+from typing import List, Optional
+
+from pydantic import TypeAdapter, create_model
+
+import models
+import schemas
+
+try:
+    import orjson
+except ImportError:  # Dependencia opcional
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # Dependencia opcional: sin ella ?formato=msgpack responde 406
+    msgpack = None
+
+
+def codificar_json(contenido) -> bytes:
+    """JSON compacto en UTF-8, igual al que produce FastAPI para los mismos datos"""
+    if orjson is not None:
+        return orjson.dumps(contenido)
+    return json.dumps(
+        contenido, ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def codificar_msgpack(contenido) -> bytes:
+    """MessagePack de los mismos datos que codificar_json (dicts, listas, números, textos)"""
+    return msgpack.packb(contenido, use_bin_type=True)
+
+def separar_autores(libros):
+    """Forma normalizada: cada libro referencia a su autor por `autor_id` y cada
+    autor aparece una sola vez en el mapa `autores` (clave: su id como texto)."""
+    autores = {}
+    for libro in libros:
+        autor = libro.pop("autor", None)
+        if autor is not None:
+            autores.setdefault(str(libro["autor_id"]), autor)
+    return {"libros": libros, "autores": autores}
+
+def normalizar(modelo, contenido):
+    """Valida `contenido` con `modelo` y lo devuelve como tipos JSON (dicts, listas, números)"""
+    adaptador = _adaptador(modelo)
+    return adaptador.dump_python(adaptador.validate_python(contenido, from_attributes=True), mode="json")
+
+@lru_cache(maxsize=None)
+def _adaptador(modelo):
+    return TypeAdapter(modelo)
+
+
+class Proyeccion:
+    """Columnas de un modelo en el orden de los campos de su esquema de respuesta.
+
+    `relaciones` son proyecciones anidadas que se resuelven con un LEFT JOIN,
+    `colecciones` relaciones uno a muchos que se leen aparte (ver
+    crud.obtener_autor_proyectado) y `ajustes` replica las transformaciones que
+    los validadores aplican al serializar (p. ej. el strip del título). La
+    `clave` primaria se lee siempre, aunque no esté entre los campos: marca el
+    cursor de la página y distingue un LEFT JOIN sin fila.
+    """
+
+    def __init__(self, modelo, campos, esquema, relaciones=None, colecciones=None, ajustes=None, clave="id"):
+        self.modelo = modelo
+        self.campos = list(campos)
+        self.esquema = esquema
+        self.relaciones = relaciones or {}
+        self.colecciones = colecciones or {}
+        self.ajustes = ajustes or {}
+        self.clave = clave
+        self.leidos = self.campos if clave in self.campos else self.campos + [clave]
+        self.indice_clave = self.leidos.index(clave)
+
+    def columnas(self):
+        columnas = [getattr(self.modelo, campo) for campo in self.leidos]
+        for relacion in self.relaciones.values():
+            columnas.extend(relacion.columnas())
+        return columnas
+
+    def aplicar(self, consulta):
+        """Convierte una consulta ORM de entidades en una de columnas (sin cargar objetos)"""
+        consulta = consulta.with_entities(*self.columnas())
+        for nombre in self.relaciones:
+            consulta = consulta.outerjoin(getattr(self.modelo, nombre))
+        return consulta
+
+    def a_dict(self, fila, inicio=0):
+        fin = inicio + len(self.leidos)
+        # La clave oculta va al final de `leidos`: zip la deja fuera
+        resultado = dict(zip(self.campos, fila[inicio:fin]))
+        for campo, ajuste in self.ajustes.items():
+            if resultado[campo] is not None:
+                resultado[campo] = ajuste(resultado[campo])
+        for nombre, relacion in self.relaciones.items():
+            # Sin fila relacionada el LEFT JOIN trae la clave primaria en NULL
+            if fila[fin + relacion.indice_clave] is None:
+                resultado[nombre] = None
+            else:
+                resultado[nombre] = relacion.a_dict(fila, fin)
+            fin += relacion.ancho()
+        return resultado
+
+    def id_de(self, fila):
+        return fila[self.indice_clave]
+
+    def ancho(self):
+        return len(self.leidos) + sum(relacion.ancho() for relacion in self.relaciones.values())
+
+    def filas(self, consulta):
+        return [self.a_dict(fila) for fila in consulta]
+
+    def restringir(self, campos):
+        """Proyección con solo `campos`, p. ej. ["id", "titulo", "autor.nombre"].
+
+        Los campos se ordenan como en el esquema. Una relación pedida sin
+        subcampos se incluye completa y una que no se pide no se une. Lanza
+        ValueError con el primer campo desconocido.
+        """
+        return _restringir(self, frozenset(campos))
+
+    def disponibles(self):
+        """Nombres aceptados por `restringir`"""
+        nombres = list(self.campos)
+        for nombre, anidada in {**self.relaciones, **self.colecciones}.items():
+            nombres.append(nombre)
+            nombres.extend(f"{nombre}.{campo}" for campo in anidada.disponibles())
+        return nombres
+
+
+@lru_cache(maxsize=256)
+def _restringir(proyeccion, campos):
+    anidadas = {**proyeccion.relaciones, **proyeccion.colecciones}
+    propios = set()
+    subcampos = {}
+    for campo in campos:
+        nombre, _, resto = campo.partition(".")
+        if nombre in anidadas:
+            pedidos = subcampos.setdefault(nombre, set())
+            # Sin subcampos se pide la relación completa
+            pedidos.add(resto or None)
+        elif nombre in proyeccion.campos and not resto:
+            propios.add(nombre)
+        else:
+            raise ValueError(campo)
+
+    def anidada(nombre):
+        pedidos = subcampos[nombre]
+        if None in pedidos:
+            return anidadas[nombre]
+        try:
+            return anidadas[nombre].restringir(pedidos)
+        except ValueError as error:
+            raise ValueError(f"{nombre}.{error}") from None
+
+    relaciones = {nombre: anidada(nombre) for nombre in proyeccion.relaciones if nombre in subcampos}
+    colecciones = {nombre: anidada(nombre) for nombre in proyeccion.colecciones if nombre in subcampos}
+    orden = [campo for campo in proyeccion.campos if campo in propios]
+
+    definiciones = {
+        campo: (informacion.annotation, informacion)
+        for campo, informacion in proyeccion.esquema.model_fields.items() if campo in propios
+    }
+    for nombre, relacion in relaciones.items():
+        definiciones[nombre] = (Optional[relacion.esquema], None)
+    for nombre, coleccion in colecciones.items():
+        definiciones[nombre] = (List[coleccion.esquema], [])
+    esquema = create_model(f"{proyeccion.esquema.__name__}Parcial", **definiciones)
+
+    return Proyeccion(
+        proyeccion.modelo, orden, esquema,
+        relaciones=relaciones,
+        colecciones=colecciones,
+        ajustes={campo: ajuste for campo, ajuste in proyeccion.ajustes.items() if campo in propios},
+        clave=proyeccion.clave
+    )
+
+
+# Mismo orden que los esquemas de respuesta de schemas.py
+AUTOR = Proyeccion(models.Autor, ["nombre", "nacionalidad", "id"], schemas.Autor)
+AUTOR_CON_ESTADISTICAS = Proyeccion(
+    models.Autor,
+    AUTOR.campos + ["total_libros", "precio_min", "precio_max", "precio_promedio"],
+    schemas.AutorConEstadisticas,
+    ajustes={"precio_promedio": lambda promedio: round(promedio, 2)}
+)
+LIBRO = Proyeccion(
+    models.Libro,
+    ["titulo", "precio", "paginas", "autor_id"],
+    schemas.LibroBase,
+    ajustes={"titulo": str.strip}
+)
+LIBRO_CON_AUTOR = Proyeccion(
+    models.Libro,
+    LIBRO.campos + ["id"],
+    schemas.LibroConAutor,
+    relaciones={"autor": AUTOR},
+    ajustes=LIBRO.ajustes
+)
+AUTOR_CON_LIBROS = Proyeccion(
+    models.Autor, AUTOR.campos, schemas.AutorConLibros, colecciones={"libros": LIBRO}
+)
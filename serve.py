@@ -0,0 +1,220 @@
+"""Servidor de producción: varios procesos worker de uvicorn sobre un mismo socket.
+
+El proceso maestro crea el esquema una sola vez (migrar.py), abre el socket,
+importa la app antes de hacer fork (salvo con --sin-precarga) y supervisa a
+los workers:
+
+- SIGTERM / SIGINT: apagado ordenado; los workers terminan lo que están atendiendo.
+- SIGHUP: recarga ordenada; se levantan workers nuevos y después se detienen
+  los viejos. Con --sin-precarga los nuevos importan el código actualizado.
+- Un worker que muere de forma inesperada se reemplaza.
+
+Cada worker descarta las conexiones heredadas del maestro al hacer fork
+(database.descartar_conexiones_heredadas) y abre su propio pool. Se usan
+uvloop y httptools si están instalados.
+
+Con más de un worker la caché de respuestas (LIBRERIA_CACHE) y la de usuarios
+de auth (LIBRERIA_AUTH_CACHE_USUARIO_TTL) quedan apagadas salvo que se fijen
+en el entorno: cada proceso tiene las suyas y no se enteran de las escrituras
+de los demás. La caché de tokens sigue activa; un token no cambia.
+
+Uso: python serve.py [--host H] [--puerto P] [--workers N] [--sin-precarga] [--sin-migrar]
+"""
+import argparse
+import asyncio
+import importlib.util
+import logging
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+import uvicorn
+
+HOST = os.getenv("LIBRERIA_HOST", "127.0.0.1")
+PUERTO = int(os.getenv("LIBRERIA_PUERTO", "8000"))
+WORKERS = int(os.getenv("LIBRERIA_WORKERS", "0")) or os.cpu_count() or 1
+TIEMPO_APAGADO = float(os.getenv("LIBRERIA_TIEMPO_APAGADO", "30"))
+# Margen entre dejar de aceptar y cerrar las conexiones sin petición en curso
+ESPERA_ACEPTADAS = 0.2
+
+logger = logging.getLogger("libreria.serve")
+
+def implementaciones():
+    """(loop, http) para uvicorn: uvloop y httptools cuando están instalados"""
+    def instalado(modulo):
+        return importlib.util.find_spec(modulo) is not None
+    return (
+        "uvloop" if instalado("uvloop") else "asyncio",
+        "httptools" if instalado("httptools") else "h11",
+    )
+
+def abrir_socket(host, puerto, backlog=2048):
+    """Socket de escucha compartido: los workers aceptan conexiones del mismo"""
+    familia = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(familia, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, puerto))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+class ServidorWorker(uvicorn.Server):
+    """Servidor de un worker que no corta conexiones recién aceptadas al apagarse.
+
+    Los workers comparten el socket de escucha: uno viejo puede aceptar una
+    conexión justo antes de dejar de aceptar, y uvicorn cierra sin responder las
+    que todavía no mandaron la petición. Se deja de aceptar primero y se espera
+    a que lleguen sus peticiones; esas se atienden como cualquier otra en curso.
+    """
+
+    async def shutdown(self, sockets=None):
+        for server in self.servers:
+            server.close()
+        await asyncio.sleep(ESPERA_ACEPTADAS)
+        await super().shutdown(sockets)
+
+def correr_worker(sock, app, loop, http, log_level):
+    config = uvicorn.Config(app, loop=loop, http=http, log_level=log_level, lifespan="on")
+    ServidorWorker(config).run(sockets=[sock])
+
+class Supervisor:
+    """Proceso maestro: lanza, reemplaza y detiene a los workers"""
+
+    def __init__(self, sock, workers, app, loop, http, log_level="info", tiempo_apagado=TIEMPO_APAGADO):
+        self.sock = sock
+        self.cantidad = workers
+        self.app = app
+        self.loop = loop
+        self.http = http
+        self.log_level = log_level
+        self.tiempo_apagado = tiempo_apagado
+        self.workers = {}  # pid -> generación
+        self.generacion = 0
+        self.apagar = False
+        self.recargar = False
+
+    def lanzar_worker(self):
+        pid = os.fork()
+        if pid == 0:
+            # En el hijo: señales por defecto, uvicorn instala sus propios manejadores
+            for senal in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+                signal.signal(senal, signal.SIG_DFL)
+            codigo = 0
+            try:
+                correr_worker(self.sock, self.app, self.loop, self.http, self.log_level)
+            except BaseException:
+                logger.exception("El worker terminó con error")
+                codigo = 1
+            finally:
+                os._exit(codigo)
+        self.workers[pid] = self.generacion
+        logger.info("Worker %s iniciado (generación %s)", pid, self.generacion)
+
+    def recolectar(self):
+        """Recoge los workers terminados y reemplaza a los de la generación actual"""
+        while self.workers:
+            try:
+                pid, estado = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            generacion = self.workers.pop(pid, None)
+            if not self.apagar and generacion == self.generacion:
+                logger.warning("Worker %s terminó inesperadamente (estado %s); se reemplaza", pid, estado)
+                self.lanzar_worker()
+
+    def detener(self, pids):
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        limite = time.monotonic() + self.tiempo_apagado
+        pendientes = set(pids)
+        while pendientes and time.monotonic() < limite:
+            for pid in list(pendientes):
+                try:
+                    terminado, _ = os.waitpid(pid, os.WNOHANG)
+                except ChildProcessError:
+                    terminado = pid
+                if terminado:
+                    pendientes.discard(pid)
+                    self.workers.pop(pid, None)
+            time.sleep(0.05)
+        for pid in pendientes:
+            logger.warning("Worker %s no terminó a tiempo; se fuerza", pid)
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+            self.workers.pop(pid, None)
+
+    def correr(self):
+        def pedir_apagado(senal, marco):
+            self.apagar = True
+
+        def pedir_recarga(senal, marco):
+            self.recargar = True
+
+        signal.signal(signal.SIGTERM, pedir_apagado)
+        signal.signal(signal.SIGINT, pedir_apagado)
+        signal.signal(signal.SIGHUP, pedir_recarga)
+
+        for _ in range(self.cantidad):
+            self.lanzar_worker()
+        while not self.apagar:
+            self.recolectar()
+            if self.recargar:
+                self.recargar = False
+                viejos = list(self.workers)
+                self.generacion += 1
+                logger.info("Recarga: %s workers nuevos reemplazan a %s", self.cantidad, viejos)
+                for _ in range(self.cantidad):
+                    self.lanzar_worker()
+                self.detener(viejos)
+            time.sleep(0.1)
+        logger.info("Apagando %s workers", len(self.workers))
+        self.detener(list(self.workers))
+
+def main():
+    parser = argparse.ArgumentParser(description="Levanta la API con varios procesos worker")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--puerto", type=int, default=PUERTO)
+    parser.add_argument("--workers", type=int, default=WORKERS, help="Por defecto, uno por CPU")
+    parser.add_argument("--sin-precarga", action="store_true",
+                        help="Cada worker importa la app después del fork (SIGHUP recarga el código)")
+    parser.add_argument("--sin-migrar", action="store_true", help="No crear el esquema antes de iniciar")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s [%(process)d] %(levelname)s %(message)s")
+
+    # El esquema se crea una vez en un proceso aparte; los workers no lo repiten
+    if not args.sin_migrar:
+        subprocess.run([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrar.py")],
+                       check=True)
+    os.environ["LIBRERIA_CREAR_ESQUEMA"] = "0"
+    if args.workers > 1:
+        # La caché de respuestas y la de usuarios son de cada proceso y una escritura
+        # solo invalida las del worker que la atendió: los demás servirían datos viejos
+        # (y 304 sobre ETags viejos) hasta el TTL. Se apagan salvo que se pidan explícitamente
+        os.environ.setdefault("LIBRERIA_CACHE", "0")
+        os.environ.setdefault("LIBRERIA_AUTH_CACHE_USUARIO_TTL", "0")
+
+    app = "main:app"
+    if not args.sin_precarga:
+        from main import app
+
+    loop, http = implementaciones()
+    sock = abrir_socket(args.host, args.puerto)
+    logger.info("Escuchando en http://%s:%s con %s workers (loop=%s, http=%s, precarga=%s)",
+                args.host, args.puerto, args.workers, loop, http, not args.sin_precarga)
+    try:
+        Supervisor(sock, args.workers, app, loop, http, args.log_level).correr()
+    finally:
+        sock.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlalchemy.orm import sessionmaker
+
+from main import app
+from database import Base, get_db
+import admision
+import cache
+import database
+
+def test_admision_presupuesto_fifo_y_rechazos():
+    async def escenario():
+        presupuesto = admision.Presupuesto(concurrencia=1, cola=1, espera_maxima=0.05)
+        assert await presupuesto.entrar()
+        espera = asyncio.ensure_future(presupuesto.entrar())
+        await asyncio.sleep(0)
+        assert presupuesto.en_cola == 1
+        # Cola llena: rechazo inmediato
+        assert not await presupuesto.entrar()
+        presupuesto.salir()  # El lugar pasa al que esperaba
+        assert await espera and presupuesto.en_curso == 1 and presupuesto.en_cola == 0
+        # Nadie libera el lugar: vence la espera
+        assert not await presupuesto.entrar()
+        presupuesto.salir()
+        return presupuesto.metricas()
+
+    estado = asyncio.run(escenario())
+    assert estado["en_curso"] == 0
+    assert (estado["admitidas"], estado["rechazadas_cola"], estado["rechazadas_espera"]) == (2, 1, 1)
+
+def test_admision_rechaza_pesadas_sin_frenar_ligeras(client, db_session, monkeypatch):
+    ocupado = admision.Presupuesto(concurrencia=1, cola=0)
+    ocupado.en_curso = 1  # Una petición pesada ya ocupa el único lugar
+    monkeypatch.setattr(admision, "presupuestos", {})
+    monkeypatch.setitem(admision.presupuestos, ("GET", "/estadisticas/"), ocupado)
+
+    respuesta = client.get("/estadisticas/")
+    assert respuesta.status_code == 503
+    assert int(respuesta.headers["retry-after"]) >= 1
+    assert client.get("/").status_code == 200
+    assert client.get("/libros/?limit=1").status_code == 200  # Otra ruta, otro presupuesto
+
+    estado = client.get("/admision/metricas").json()
+    assert estado["GET /estadisticas/"]["rechazadas_cola"] == 1
+    assert estado["GET /"]["admitidas"] == 1
+    texto = client.get("/metrics").text
+    assert 'libreria_admision_rechazadas_cola_total{metodo="GET",ruta="/estadisticas/"} 1' in texto
+    assert 'libreria_peticiones_total{metodo="GET",ruta="/estadisticas/",estado="503"} 1' in texto
+
+def test_admision_limita_concurrencia_por_ruta(tmp_path, monkeypatch, poblar):
+    # Base en archivo y una sesión por petición: la sesión compartida de las
+    # otras pruebas no admite dos peticiones a la vez
+    motor = database.crear_engine(f"sqlite:///{tmp_path / 'admision.db'}")
+    Base.metadata.create_all(bind=motor)
+    Sesion = sessionmaker(autoflush=False, bind=motor)
+    with Sesion() as db:
+        poblar(db, 3)
+
+    def sesion():
+        db = Sesion()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    monkeypatch.setitem(app.dependency_overrides, get_db, sesion)
+    monkeypatch.setattr(cache.respuestas, "habilitada", False)
+    monkeypatch.setattr(cache.coalescedor, "habilitado", False)
+    monkeypatch.setattr(admision, "presupuestos", {})
+    presupuesto = admision.Presupuesto(concurrencia=2, cola=16)
+    monkeypatch.setitem(admision.presupuestos, ("GET", "/libros/"), presupuesto)
+    en_vuelo, maximo = [0], [0]
+    lock = threading.Lock()
+
+    def contar(conn, cursor, statement, parameters, context, executemany):
+        with lock:
+            en_vuelo[0] += 1
+            maximo[0] = max(maximo[0], en_vuelo[0])
+        time.sleep(0.05)
+        with lock:
+            en_vuelo[0] -= 1
+
+    event.listen(motor, "before_cursor_execute", contar)
+    try:
+        with TestClient(app) as cliente, ThreadPoolExecutor(8) as pool:
+            respuestas = list(pool.map(lambda _: cliente.get("/libros/?limit=2"), range(8)))
+    finally:
+        event.remove(motor, "before_cursor_execute", contar)
+        motor.dispose()
+    assert all(r.status_code == 200 for r in respuestas)
+    # Dos a la vez, nunca más: el límite se respeta sin serializar la ruta
+    assert maximo[0] == 2 and presupuesto.admitidas == 8
@@ -1,5 +1,16 @@
+import asyncio
+import os
+import subprocess
+import sys
+import threading
+from datetime import timedelta
+
 import pytest
 from fastapi import status
+
+import auth
+import cache
+import models
 # from app.models import User  # Removed unused import or fix path if needed
 
 class TestAuth:
@@ -71,4 +82,63 @@ class TestAuth:
 
     def test_get_current_user_no_auth(self, client):
         response = client.get("/auth/me")
-        assert response.status_code == status.HTTP_401_UNAUTHORIZED
\ No newline at end of file
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+class TestAuthCache:
+    def test_token_cacheado_sin_consultas(self, client, db_session, consultas, monkeypatch):
+        db_session.add(models.User(email="cache@ejemplo.com", hashed_password="x", full_name="Caché"))
+        db_session.commit()
+        cabeceras = {"Authorization": f"Bearer {auth.create_access_token({'sub': 'cache@ejemplo.com'})}"}
+        assert client.get("/auth/me", headers=cabeceras).status_code == status.HTTP_200_OK
+
+        decodificados = []
+        decode = auth.jwt.decode
+        monkeypatch.setattr(auth.jwt, "decode", lambda *a, **k: decodificados.append(1) or decode(*a, **k))
+        consultas.clear()
+        response = client.get("/auth/me", headers=cabeceras)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["email"] == "cache@ejemplo.com"
+        # Ni la firma ni la base de datos: el token y el usuario salen de la caché
+        assert decodificados == [] and consultas == []
+
+        auth.invalidar_usuario("cache@ejemplo.com")
+        client.get("/auth/me", headers=cabeceras)
+        assert len(decodificados) == 1 and len(consultas) == 1
+
+    def test_usuario_sin_cache_con_ttl_cero(self, client, auth_headers, consultas, monkeypatch):
+        monkeypatch.setattr(auth, "AUTH_CACHE_USUARIO_TTL", 0)
+        client.get("/auth/me", headers=auth_headers)
+        consultas.clear()
+        client.get("/auth/me", headers=auth_headers)
+        assert len(consultas) == 1 and len(auth.usuarios) == 0
+
+    def test_token_cacheado_vence_con_el_token(self, monkeypatch):
+        ahora = [0.0]
+        monkeypatch.setattr(auth, "tokens", cache.CacheLRU(10, reloj=lambda: ahora[0]))
+        token = auth.create_access_token({"sub": "vence@ejemplo.com"}, timedelta(minutes=5))
+        assert auth.verificar_token(token) == "vence@ejemplo.com"
+        ahora[0] = 290
+        assert auth.tokens.obtener(token) == "vence@ejemplo.com"
+        ahora[0] = 301
+        assert auth.tokens.obtener(token) is None
+
+    def test_bcrypt_fuera_del_event_loop(self, monkeypatch):
+        hilos = []
+        hash_original = auth._hash
+        monkeypatch.setattr(auth, "BCRYPT_RONDAS", 4)
+        monkeypatch.setattr(auth, "_hash", lambda password: hilos.append(threading.current_thread().name)
+                            or hash_original(password))
+
+        async def registrar_y_verificar():
+            hashed = await auth.get_password_hash("una-contraseña")
+            return await auth.verify_password("una-contraseña", hashed)
+
+        assert asyncio.run(registrar_y_verificar())
+        assert len(hilos) == 1 and hilos[0].startswith("bcrypt")
+
+    def test_sin_clave_secreta_no_arranca(self):
+        entorno = {clave: valor for clave, valor in os.environ.items() if clave != "LIBRERIA_SECRET_KEY"}
+        resultado = subprocess.run([sys.executable, "-c", "import main"], env=entorno,
+                                   capture_output=True, text=True)
+        assert resultado.returncode != 0
+        assert "LIBRERIA_SECRET_KEY" in resultado.stderr
@@ -0,0 +1,96 @@
+import pytest
+
+import models
+import crud
+
+@pytest.mark.parametrize("url, esperados", [
+    # Sin tildes, con prefijo y sin distinguir mayúsculas
+    ("/libros/buscar/?titulo=espiritus", {"La Casa de los Espíritus", "Espíritus, espíritus y más espíritus"}),
+    ("/libros/buscar/?titulo=Espír", {"La Casa de los Espíritus", "Espíritus, espíritus y más espíritus"}),
+    ("/libros/buscar/?titulo=anos sol", {"Cien años de soledad"}),
+    ("/libros/buscar/?autor=marquez", {"Cien años de soledad", "Espíritus, espíritus y más espíritus"}),
+    ("/libros/buscar/?autor=isa", {"La Casa de los Espíritus", "Paula"}),
+    ("/libros/buscar/?titulo=!!!", set()),
+])
+def test_busqueda_texto_completo(client, db_session, crear_catalogo_busqueda, url, esperados):
+    crear_catalogo_busqueda(db_session)
+    data = client.get(url).json()
+    assert {libro["titulo"] for libro in data["libros"]} == esperados
+
+def test_busqueda_ordenada_por_relevancia(client, db_session, crear_catalogo_busqueda):
+    crear_catalogo_busqueda(db_session)
+    libros = client.get("/libros/buscar/?titulo=espiritus").json()["libros"]
+    assert libros[0]["titulo"] == "Espíritus, espíritus y más espíritus"
+
+    por_id = client.get("/libros/buscar/?titulo=espiritus&orden=id").json()["libros"]
+    assert por_id[0]["titulo"] == "La Casa de los Espíritus"
+    assert client.get("/libros/buscar/?titulo=espiritus&after=1").status_code == 400
+
+def test_indice_busqueda_sincronizado(client, db_session, crear_catalogo_busqueda):
+    crear_catalogo_busqueda(db_session)
+    libro = db_session.query(models.Libro).filter(models.Libro.titulo == "Paula").one()
+    libro.titulo = "Eva Luna"
+    libro.autor.nombre = "Isabel Allende Llona"
+    db_session.commit()
+
+    assert client.get("/libros/buscar/?titulo=paula").json()["total"] == 0
+    assert client.get("/libros/buscar/?titulo=eva").json()["total"] == 1
+    assert client.get("/libros/buscar/?autor=llona").json()["total"] == 2
+
+    db_session.delete(libro)
+    db_session.commit()
+    assert client.get("/libros/buscar/?titulo=eva").json()["total"] == 0
+
+def test_busqueda_usa_indice(db_session, crear_catalogo_busqueda, plan_de_consulta):
+    crear_catalogo_busqueda(db_session)
+    plan = plan_de_consulta(db_session, crud.consulta_libros_por_titulo(db_session, "espiritus"))
+    assert any("VIRTUAL TABLE INDEX" in paso for paso in plan)
+    assert "SCAN libros" not in plan
+
+def test_filtros_combinados(client, db_session, crear_catalogo_busqueda):
+    crear_catalogo_busqueda(db_session)
+    marquez_id = db_session.query(models.Autor.id).filter(models.Autor.nombre.startswith("Gabriel")).scalar()
+
+    data = client.get("/libros/buscar/?titulo=espiritus&precio_max=20").json()
+    assert [l["titulo"] for l in data["libros"]] == ["Espíritus, espíritus y más espíritus"]
+
+    data = client.get("/libros/buscar/?autor=allende&paginas_min=400").json()
+    assert [l["titulo"] for l in data["libros"]] == ["La Casa de los Espíritus"]
+
+    data = client.get(f"/libros/buscar/?autor_id={marquez_id}&orden=-precio").json()
+    assert [l["precio"] for l in data["libros"]] == [30.0, 12.0]
+
+    # Los límites de precio funcionan por separado
+    data = client.get("/libros/buscar/?precio_min=25&orden=precio").json()
+    assert [l["precio"] for l in data["libros"]] == [25.99, 30.0]
+    assert client.get("/libros/buscar/?precio_min=25&orden=precio&after=1").status_code == 400
+
+@pytest.mark.parametrize("filtros", [
+    {"autor_id": 1},
+    {"autor_id": 1, "precio_min": 10, "precio_max": 20},
+    {"autor_id": 1, "paginas_min": 100},
+    {"precio_min": 10, "precio_max": 20},
+    {"paginas_min": 100, "paginas_max": 300},
+    {"precio_min": 10, "precio_max": 12, "paginas_max": 300},
+    {"titulo": "espiritus"},
+    {"autor": "allende"},
+    {"titulo": "casa", "autor": "allende", "precio_max": 30, "paginas_min": 100},
+])
+@pytest.mark.parametrize("orden", ["id", "precio", "-paginas"])
+def test_busqueda_combinada_usa_indices(db_session, crear_catalogo_busqueda, plan_de_consulta, filtros, orden):
+    crear_catalogo_busqueda(db_session)
+    consulta = crud.paginar(
+        crud.consulta_busqueda_libros(db_session, orden=orden, **filtros),
+        models.Libro.id, limit=50
+    )
+    plan = plan_de_consulta(db_session, consulta)
+    # Ningún paso recorre la tabla libros completa
+    assert not [paso for paso in plan if paso.startswith("SCAN libros") and "libros_fts" not in paso], plan
+
+def test_rango_poco_selectivo_recorre_en_orden(db_session, crear_catalogo_busqueda, plan_de_consulta):
+    """Una sola cota puede conservar casi todas las filas: el planificador lee en
+    orden de id y corta en el límite, sin pasar por el índice de precio"""
+    crear_catalogo_busqueda(db_session)
+    consulta = crud.paginar(crud.consulta_busqueda_libros(db_session, precio_min=0), models.Libro.id, limit=50)
+    plan = plan_de_consulta(db_session, consulta)
+    assert not [paso for paso in plan if "ix_libros_precio" in paso or "TEMP B-TREE" in paso], plan
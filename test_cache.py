@@ -0,0 +1,183 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import pytest
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import event
+
+import admision
+import cache
+
+def test_cache_aciertos_sin_consultas(client, db_session, poblar, consultas):
+    poblar(db_session, 3)
+    primera = client.get("/autores/?limit=2")
+    consultas.clear()
+    segunda = client.get("/autores/?limit=2")
+    assert consultas == []
+    assert segunda.content == primera.content
+    assert segunda.headers["X-Siguiente-Cursor"] == "2"
+    assert segunda.json() == [{"nombre": "Autor 0", "nacionalidad": "Colombiana", "id": 1},
+                              {"nombre": "Autor 1", "nacionalidad": "Colombiana", "id": 2}]
+
+    metricas = client.get("/cache/metricas").json()
+    assert metricas["aciertos"] == 1 and metricas["fallos"] == 1
+
+def test_cache_etag_304(client, db_session, poblar):
+    poblar(db_session, 1)
+    response = client.get("/estadisticas/")
+    etag = response.headers["ETag"]
+    no_modificada = client.get("/estadisticas/", headers={"If-None-Match": etag})
+    assert no_modificada.status_code == 304
+    assert no_modificada.content == b""
+
+    client.post("/libros/", json={"titulo": "Nuevo", "precio": 99, "paginas": 10, "autor_id": 1})
+    modificada = client.get("/estadisticas/", headers={"If-None-Match": etag})
+    assert modificada.status_code == 200
+    assert modificada.json()["total_libros"] == 2
+
+def test_cache_invalidacion_precisa(client, db_session, poblar, consultas):
+    poblar(db_session, 2)
+    client.get("/autores/1")
+    client.get("/autores/2")
+    client.get("/autores/")
+
+    client.post("/libros/", json={"titulo": "Nuevo", "precio": 20, "paginas": 10, "autor_id": 1})
+    consultas.clear()
+    assert len(client.get("/autores/1").json()["libros"]) == 2
+    assert consultas
+    consultas.clear()
+    client.get("/autores/2")
+    client.get("/autores/")
+    assert consultas == []  # Un libro nuevo no cambia a otros autores ni la lista de autores
+
+    client.post("/autores/bulk", json=[{"nombre": "Nuevo", "nacionalidad": "Chilena"}])
+    assert len(client.get("/autores/").json()) == 3
+
+def test_cache_lru_ttl_y_etiquetas():
+    ahora = [0.0]
+    lru = cache.CacheLRU(max_entradas=2, reloj=lambda: ahora[0])
+    lru.guardar("a", 1, {"x"}, ttl=10)
+    lru.guardar("b", 2, {"x", "y"}, ttl=10)
+    assert lru.obtener("a") == 1
+    lru.guardar("c", 3, {"y"}, ttl=10)  # Expulsa "b", la menos usada
+    assert lru.obtener("b") is None and lru.expulsiones == 1
+
+    assert lru.invalidar({"y"}) == 1
+    assert lru.obtener("c") is None and lru.obtener("a") == 1
+
+    ahora[0] = 11
+    assert lru.obtener("a") is None
+    assert len(lru) == 0
+
+@pytest.mark.parametrize("url", [
+    "/estadisticas/?fuente=sql",
+    "/libros/buscar/?titulo=Libro",
+    "/libros/buscar/?autor=Autor&rapido=true",
+])
+def test_peticiones_concurrentes_identicas_una_ejecucion(client, db_session, poblar, engine, consultas,
+                                                        monkeypatch, url):
+    poblar(db_session, 5)
+    monkeypatch.setattr(cache.respuestas, "habilitada", False)  # Sin caché, solo el agrupamiento
+    consultas.clear()
+    referencia = client.get(url)
+    consultas_por_peticion = len(consultas)
+    concurrentes = 20
+    compartidas = cache.coalescedor.compartidas
+    # Que el control de admisión deje pasar a todas a la vez
+    monkeypatch.setitem(admision.presupuestos, ("GET", urlsplit(url).path), admision.Presupuesto(concurrentes, 0))
+
+    # La ejecución líder espera a que las demás peticiones se sumen a ella
+    def retener(conn, cursor, statement, parameters, context, executemany):
+        limite = time.monotonic() + 5
+        while cache.coalescedor.compartidas - compartidas < concurrentes - 1 and time.monotonic() < limite:
+            time.sleep(0.005)
+
+    consultas.clear()
+    event.listen(engine, "before_cursor_execute", retener)
+    try:
+        with ThreadPoolExecutor(concurrentes) as pool:
+            respuestas = list(pool.map(lambda _: client.get(url), range(concurrentes)))
+    finally:
+        event.remove(engine, "before_cursor_execute", retener)
+
+    assert cache.coalescedor.compartidas - compartidas == concurrentes - 1
+    assert len(consultas) == consultas_por_peticion
+    assert all(r.status_code == 200 and r.content == referencia.content for r in respuestas)
+    assert len(cache.coalescedor) == 0
+
+def test_coalescedor_propaga_errores_y_respeta_escrituras():
+    coalescedor = cache.Coalescedor(habilitado=True)
+    llamadas = []
+
+    async def fallar():
+        llamadas.append(1)
+        await asyncio.sleep(0.01)
+        raise ValueError("sin conexión")
+
+    async def correr():
+        return await asyncio.gather(*(coalescedor.compartir("k", fallar) for _ in range(5)),
+                                    return_exceptions=True)
+
+    resultados = asyncio.run(correr())
+    assert len(llamadas) == 1
+    assert all(isinstance(resultado, ValueError) for resultado in resultados)
+    assert len(coalescedor) == 0  # Un error no queda retenido para las siguientes
+
+    # Una lectura posterior a una escritura no se suma a una ejecución anterior
+    antes = cache._clave_en_vuelo("/estadisticas/?")
+    cache.respuestas.invalidar(cache.ETIQUETA_ESTADISTICAS)
+    assert cache._clave_en_vuelo("/estadisticas/?") != antes
+
+def test_coalescedor_lider_cancelada_no_suelta_su_sesion():
+    """La ejecución usa la sesión de la líder: si esta se cancela, no sale antes que la ejecución"""
+    coalescedor = cache.Coalescedor(habilitado=True)
+    continuar = threading.Event()
+    eventos = []
+
+    def leer():  # En el threadpool, como ejecutar() con una sesión sync
+        continuar.wait(5)
+        eventos.append("lectura")
+        return "resultado"
+
+    async def lider():
+        try:
+            await coalescedor.compartir("k", lambda: run_in_threadpool(leer))
+        finally:
+            eventos.append("sale la líder")  # Aquí get_db cerraría la sesión
+
+    async def con_seguidora():
+        primera = asyncio.ensure_future(lider())
+        await asyncio.sleep(0.01)
+        seguidora = asyncio.ensure_future(coalescedor.compartir("k", lambda: run_in_threadpool(leer)))
+        await asyncio.sleep(0.01)
+        primera.cancel()
+        await asyncio.sleep(0.05)
+        assert not primera.done()
+        continuar.set()
+        with pytest.raises(asyncio.CancelledError):
+            await primera
+        return await seguidora
+
+    assert asyncio.run(con_seguidora()) == "resultado"  # La seguidora recibe el resultado
+    assert eventos == ["lectura", "sale la líder"]
+    assert (coalescedor.ejecuciones, coalescedor.compartidas) == (1, 1)
+
+    # Sin seguidoras la ejecución se cancela y no queda en vuelo
+    terminadas = []
+
+    async def lenta():
+        await asyncio.sleep(1)
+        terminadas.append(1)
+
+    async def sola():
+        tarea = asyncio.ensure_future(coalescedor.compartir("k", lenta))
+        await asyncio.sleep(0.01)
+        tarea.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await tarea
+
+    asyncio.run(sola())
+    assert terminadas == [] and len(coalescedor) == 0
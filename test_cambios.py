@@ -0,0 +1,156 @@
+import asyncio
+import json
+import time
+from datetime import datetime
+
+import httpx
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+import admision
+import cambios
+import crud
+import models
+from database import Base
+from main import app
+
+def test_cambios_paginados_por_secuencia(client, db_session, poblar):
+    poblar(db_session, 3)  # El flush inserta primero los 3 autores y después los 3 libros
+    primera = client.get("/cambios?limit=4").json()
+    assert [a["nombre"] for a in primera["autores"]] == ["Autor 0", "Autor 1", "Autor 2"]
+    assert [l["titulo"] for l in primera["libros"]] == ["Libro 0"]
+    assert primera["hay_mas"] and primera["siguiente"] == primera["libros"][0]["secuencia"]
+    assert primera["autores"][0]["created_at"] is not None
+
+    segunda = client.get(f"/cambios?since={primera['siguiente']}&limit=4").json()
+    assert [l["titulo"] for l in segunda["libros"]] == ["Libro 1", "Libro 2"] and not segunda["hay_mas"]
+    hasta = segunda["siguiente"]
+    assert client.get(f"/cambios?since={hasta}").json() == {
+        "autores": [], "libros": [], "siguiente": hasta, "hay_mas": False
+    }
+
+    # Un libro nuevo cambia los agregados de su autor, pero el autor no cuenta como cambiado
+    nuevo = client.post("/libros/", json={"titulo": "Nuevo", "precio": 5, "paginas": 10, "autor_id": 1}).json()
+    cambios_nuevos = client.get(f"/cambios?since={hasta}").json()
+    assert cambios_nuevos["autores"] == [] and [l["id"] for l in cambios_nuevos["libros"]] == [nuevo["id"]]
+
+    libro = db_session.get(models.Libro, 1)
+    creado = libro.created_at
+    libro.precio = 99
+    db_session.commit()
+    ultimos = client.get(f"/cambios?since={cambios_nuevos['siguiente']}").json()["libros"]
+    assert [(l["id"], l["precio"]) for l in ultimos] == [(1, 99)]
+    assert ultimos[0]["secuencia"] > cambios_nuevos["siguiente"]
+    assert datetime.fromisoformat(ultimos[0]["updated_at"]) > creado
+
+def test_cambios_fuera_de_la_orm_marcan_updated_at(client, db_session, poblar):
+    """El trigger que asigna la secuencia también marca la hora: vale para SQL directo"""
+    poblar(db_session, 1)
+    antes = client.get("/cambios").json()
+    time.sleep(0.01)
+    db_session.execute(text("UPDATE libros SET precio = 99 WHERE id = 1"))
+    db_session.execute(text("INSERT INTO autores (nombre, nacionalidad) VALUES ('Sin ORM', 'Chilena')"))
+    db_session.commit()
+
+    despues = client.get(f"/cambios?since={antes['siguiente']}").json()
+    (libro,), (autor,) = despues["libros"], despues["autores"]
+    assert datetime.fromisoformat(libro["updated_at"]) > datetime.fromisoformat(antes["libros"][0]["updated_at"])
+    assert libro["created_at"] == antes["libros"][0]["created_at"]
+    assert autor["created_at"] is not None and autor["updated_at"] == autor["created_at"]
+
+@pytest.mark.parametrize("modelo", [models.Libro, models.Autor])
+def test_cambios_usan_indice(db_session, plan_de_consulta, modelo):
+    plan = plan_de_consulta(db_session, crud.consulta_cambios(db_session, modelo, 10).limit(100))
+    assert any(f"ix_{modelo.__tablename__}_secuencia" in paso for paso in plan), plan
+    assert not [paso for paso in plan if "TEMP B-TREE" in paso], plan
+
+def test_migracion_asigna_secuencia_a_filas_existentes(tmp_path):
+    motor = create_engine(f"sqlite:///{tmp_path / 'vieja.db'}")
+    with motor.begin() as conn:
+        conn.exec_driver_sql("CREATE TABLE autores (id INTEGER PRIMARY KEY, nombre VARCHAR, nacionalidad VARCHAR)")
+        conn.exec_driver_sql(
+            "CREATE TABLE libros (id INTEGER PRIMARY KEY, titulo VARCHAR, precio FLOAT, "
+            "paginas INTEGER, autor_id INTEGER REFERENCES autores (id))"
+        )
+        conn.exec_driver_sql("INSERT INTO autores VALUES (1, 'Isabel Allende', 'Chilena'), (2, 'Borges', 'Argentina')")
+        conn.exec_driver_sql("INSERT INTO libros VALUES (1, 'Paula', 10, 300, 1)")
+        # Un trigger de una versión anterior se reemplaza por el actual
+        conn.exec_driver_sql(
+            "CREATE TRIGGER libros_secuencia_update AFTER UPDATE OF titulo ON libros BEGIN SELECT 1; END"
+        )
+
+    Base.metadata.create_all(bind=motor)
+    with motor.connect() as conn:
+        trigger = conn.exec_driver_sql(
+            "SELECT sql FROM sqlite_master WHERE name = 'libros_secuencia_update'"
+        ).scalar()
+    assert "updated_at" in trigger
+    with sessionmaker(bind=motor)() as db:
+        filas, hay_mas = crud.cambios_desde(db, 0, 10)
+        assert [(type(fila).__name__, fila.id, fila.secuencia) for fila in filas] == [
+            ("Autor", 1, 1), ("Autor", 2, 2), ("Libro", 1, 3)
+        ]
+        assert all(fila.created_at is not None for fila in filas) and not hay_mas
+        db.add(models.Libro(titulo="Eva Luna", precio=20, paginas=250, autor_id=1))
+        db.commit()
+        assert [fila.secuencia for fila in crud.cambios_desde(db, 3, 10)[0]] == [4]
+    motor.dispose()
+
+def test_stream_de_cambios(client, db_session, poblar, monkeypatch):
+    """El stream envía lo existente y después lo que se crea, sin esperar al sondeo"""
+    poblar(db_session, 1)
+    monkeypatch.setattr(cambios, "SSE_SONDEO", 30)
+    recibidos = []
+
+    async def escenario():
+        listo = asyncio.Event()
+        mas_eventos = asyncio.Event()
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+            "scheme": "http", "path": "/cambios/stream", "raw_path": b"/cambios/stream",
+            "query_string": b"since=0", "root_path": "", "headers": [(b"host", b"test")],
+            "client": ("test", 1), "server": ("test", 80),
+        }
+        peticion_enviada = False
+
+        async def receive():
+            nonlocal peticion_enviada
+            if not peticion_enviada:
+                peticion_enviada = True
+                return {"type": "http.request", "body": b"", "more_body": False}
+            await listo.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(mensaje):
+            if mensaje["type"] == "http.response.start":
+                recibidos.append(dict(mensaje["headers"])[b"content-type"])
+            elif mensaje.get("body"):
+                recibidos.append(mensaje["body"])
+                mas_eventos.set()
+
+        tarea = asyncio.ensure_future(app(scope, receive, send))
+        await asyncio.wait_for(mas_eventos.wait(), 5)
+        while len(recibidos) < 3:  # Tipo de contenido, autor y libro
+            mas_eventos.clear()
+            await asyncio.wait_for(mas_eventos.wait(), 5)
+
+        mas_eventos.clear()
+        # En el mismo event loop que el stream, como en un worker
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as otro:
+            autor = await otro.post("/autores/", json={"nombre": "Nueva", "nacionalidad": "X"})
+        inicio = time.monotonic()
+        await asyncio.wait_for(mas_eventos.wait(), 5)
+        demora = time.monotonic() - inicio
+        listo.set()
+        await asyncio.wait_for(tarea, 5)
+        return autor.json(), demora
+
+    autor, demora = asyncio.run(escenario())
+    assert recibidos[0].startswith(b"text/event-stream")
+    assert recibidos[1].startswith(b"id: 1\nevent: autor\ndata: {") and recibidos[2].startswith(b"id: 2\nevent: libro\n")
+    assert recibidos[3].startswith(b"id: 3\nevent: autor\n")
+    assert json.loads(recibidos[3].split(b"data: ", 1)[1])["id"] == autor["id"]
+    assert demora < 1  # El alta avisó al stream; no esperó los 30 s del sondeo
+    # El stream no pasa por el control de admisión: no ocupa un lugar mientras dura
+    assert ("GET", "/cambios/stream") not in admision.presupuestos
@@ -0,0 +1,43 @@
+import json
+
+import models
+
+def test_carga_masiva_autores_json(client, db_session):
+    autores = [{"nombre": f"Autor {i}", "nacionalidad": "Peruana"} for i in range(5)]
+    autores.insert(2, {"nombre": "Sin nacionalidad"})
+    data = client.post("/autores/bulk?lote=2", json=autores).json()
+    assert data["insertados"] == 5
+    assert [error["indice"] for error in data["errores"]] == [2]
+    assert "nacionalidad" in data["errores"][0]["detalle"]
+    assert db_session.query(models.Autor).count() == 5
+
+def test_carga_masiva_libros_ndjson(client, db_session, poblar, consultas):
+    poblar(db_session, 2)
+    filas = [json.dumps({"titulo": f"Nuevo {i}", "precio": 10 + i, "paginas": 100, "autor_id": 1 + i % 2})
+             for i in range(6)]
+    filas[1] = json.dumps({"titulo": "Sin autor", "precio": 10, "paginas": 100, "autor_id": 99})
+    filas[3] = json.dumps({"titulo": "Gratis", "precio": -1, "paginas": 100, "autor_id": 1})
+    filas[4] = "{no es json"
+    consultas.clear()
+    response = client.post(
+        "/libros/bulk?lote=2",
+        content="\n".join(filas) + "\n",
+        headers={"Content-Type": "application/x-ndjson"}
+    )
+    data = response.json()
+    assert data["insertados"] == 3
+    assert {error["indice"]: error["detalle"] for error in data["errores"]} == {
+        1: "Autor no encontrado",
+        3: "precio: Value error, El precio debe ser mayor a 0",
+        4: "JSON inválido",
+    }
+    # Una verificación de autores y un INSERT por lote (3 filas válidas en lotes de 2)
+    assert len([c for c in consultas if c.startswith("SELECT autores.id")]) == 2
+    assert len([c for c in consultas if c.startswith("INSERT INTO libros")]) == 2
+
+    assert client.get("/libros/buscar/?titulo=nuevo").json()["total"] == 3
+    assert client.get("/estadisticas/").json()["total_libros"] == 5
+
+def test_carga_masiva_cuerpo_invalido(client):
+    assert client.post("/libros/bulk", json={"titulo": "No es lista"}).status_code == 400
+    assert client.post("/libros/bulk", content="{", headers={"Content-Type": "application/json"}).status_code == 400
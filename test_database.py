@@ -0,0 +1,219 @@
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.orm import sessionmaker
+
+import main
+from main import app
+from database import Base, get_db, crear_async_engine
+import models
+import crud
+import cache
+import database
+
+def test_esquema_actualiza_estadisticas(tmp_path):
+    motor = database.crear_engine(f"sqlite:///{tmp_path / 'estadisticas.db'}")
+    Base.metadata.create_all(bind=motor)
+    with sessionmaker(bind=motor)() as db:
+        db.add_all(models.Libro(titulo=f"Libro {i}", precio=i, paginas=100) for i in range(20))
+        db.commit()
+    Base.metadata.create_all(bind=motor)  # Como en el siguiente arranque o migrar.py
+    with motor.connect() as conn:
+        indices = {fila[0] for fila in conn.exec_driver_sql("SELECT idx FROM sqlite_stat1 WHERE tbl = 'libros'")}
+    motor.dispose()
+    assert "ix_libros_precio" in indices
+
+@pytest.fixture
+def cliente_async(tmp_path):
+    """Cliente cuyos handlers reciben una AsyncSession (aiosqlite) en lugar de una Session"""
+    url = f"sqlite:///{tmp_path / 'async.db'}"
+    motor_sync = create_engine(url)
+    Base.metadata.create_all(bind=motor_sync)
+    motor_sync.dispose()
+    motor, AsyncSessionLocal = crear_async_engine(url.replace("sqlite://", "sqlite+aiosqlite://"))
+
+    async def override_get_db():
+        async with AsyncSessionLocal() as db:
+            yield db
+
+    app.dependency_overrides[get_db] = override_get_db
+    cache.respuestas.limpiar()
+    with TestClient(app) as test_client:
+        yield test_client
+        test_client.portal.call(motor.dispose)
+    app.dependency_overrides.clear()
+
+def test_handlers_con_sesion_async(cliente_async):
+    autor = cliente_async.post("/autores/", json={"nombre": "Isabel Allende", "nacionalidad": "Chilena"}).json()
+    libro = cliente_async.post("/libros/", json={
+        "titulo": "La Casa de los Espíritus", "precio": 25.99, "paginas": 450, "autor_id": autor["id"]
+    })
+    assert libro.status_code == 201
+    assert libro.json()["autor"]["nombre"] == "Isabel Allende"
+    assert cliente_async.post("/libros/", json={
+        "titulo": "Huérfano", "precio": 10, "paginas": 10, "autor_id": 99
+    }).status_code == 404
+
+    carga = cliente_async.post("/libros/bulk", json=[
+        {"titulo": f"Paula {i}", "precio": 18.5, "paginas": 330, "autor_id": autor["id"]} for i in range(3)
+    ]).json()
+    assert carga == {"insertados": 3, "errores": []}
+
+    assert len(cliente_async.get("/libros/?limit=2").json()) == 2
+    assert cliente_async.get("/libros/buscar/?titulo=espiritus").json()["total"] == 1
+    assert len(cliente_async.get(f"/autores/{autor['id']}").json()["libros"]) == 4
+    lineas = cliente_async.get("/libros/?formato=ndjson").text.splitlines()
+    assert [json.loads(linea) for linea in lineas] == cliente_async.get("/libros/").json()
+    assert cliente_async.get("/estadisticas/").json()["total_libros"] == 4
+    exportados = cliente_async.get("/export/libros?formato=ndjson").text.splitlines()
+    assert [json.loads(linea)["autor_nombre"] for linea in exportados] == ["Isabel Allende"] * 4
+
+def test_importar_main_no_toca_la_base(tmp_path):
+    ruta = tmp_path / "importar.db"
+    entorno = dict(os.environ, LIBRERIA_DATABASE_URL=f"sqlite:///{ruta}")
+    subprocess.run([sys.executable, "-c", "import main"], env=entorno, check=True)
+    assert not ruta.exists() or inspect(create_engine(f"sqlite:///{ruta}")).get_table_names() == []
+
+@pytest.mark.parametrize("crear_esquema", [True, False])
+def test_esquema_en_el_arranque(monkeypatch, tmp_path, crear_esquema):
+    motor = database.crear_engine(f"sqlite:///{tmp_path / 'arranque.db'}")
+    monkeypatch.setattr(main, "engine", motor)
+    monkeypatch.setattr(main, "CREAR_ESQUEMA", crear_esquema)
+    with TestClient(app):
+        tablas = set(inspect(motor).get_table_names())
+    motor.dispose()
+    assert ({"autores", "libros", "estadisticas", "libros_fts"} <= tablas) == crear_esquema
+
+def test_fork_no_comparte_conexiones(monkeypatch, tmp_path):
+    motor = database.crear_engine(f"sqlite:///{tmp_path / 'fork.db'}")
+    monkeypatch.setattr(database, "engine", motor)
+    with motor.connect() as conn:
+        conexion_padre = id(conn.connection.dbapi_connection)
+
+    pid = os.fork()
+    if pid == 0:
+        # Hijo: el pool heredado se descartó y se abre una conexión propia
+        with motor.connect() as conn:
+            propia = id(conn.connection.dbapi_connection) != conexion_padre
+        os._exit(0 if propia else 1)
+    _, estado = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(estado) == 0
+    motor.dispose()
+
+@pytest.mark.slow
+def test_serve_con_varios_workers(tmp_path):
+    import httpx
+    from benchmarks.carga import puerto_libre
+    from benchmarks.escalado import esperar_servidor
+
+    puerto = puerto_libre()
+    entorno = dict(os.environ, LIBRERIA_DATABASE_URL=f"sqlite:///{tmp_path / 'serve.db'}")
+    servidor = subprocess.Popen(
+        [sys.executable, "serve.py", "--workers", "2", "--puerto", str(puerto), "--log-level", "warning"],
+        env=entorno
+    )
+    base = f"http://127.0.0.1:{puerto}"
+    try:
+        esperar_servidor(base, servidor)
+        # El maestro creó el esquema antes de lanzar a los workers
+        autor = httpx.post(base + "/autores/", json={"nombre": "Isabel Allende", "nacionalidad": "Chilena"})
+        assert autor.status_code == 201
+
+        servidor.send_signal(signal.SIGHUP)
+        for _ in range(20):
+            assert httpx.get(base + "/autores/").json()[0]["nombre"] == "Isabel Allende"
+            time.sleep(0.05)
+
+        # Sin caché compartida entre procesos: ningún worker sirve la lista anterior a una escritura
+        assert httpx.get(base + "/cache/metricas").json()["habilitada"] is False
+        httpx.post(base + "/autores/", json={"nombre": "Julio Cortázar", "nacionalidad": "Argentina"})
+        for _ in range(20):
+            assert len(httpx.get(base + "/autores/").json()) == 2
+    finally:
+        servidor.terminate()
+        assert servidor.wait(timeout=20) == 0
+
+def test_worker_atiende_conexiones_aceptadas_antes_de_apagarse(monkeypatch):
+    import socket
+    import threading
+    import serve
+    import uvicorn
+
+    async def app_minima(scope, receive, send):
+        if scope["type"] == "http":
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": b"ok"})
+
+    monkeypatch.setattr(serve, "ESPERA_ACEPTADAS", 1.0)
+    sock = serve.abrir_socket("127.0.0.1", 0)
+    servidor = serve.ServidorWorker(uvicorn.Config(app_minima, lifespan="off", log_level="warning"))
+    hilo = threading.Thread(target=servidor.run, kwargs={"sockets": [sock]})
+    hilo.start()
+    try:
+        while not servidor.started:
+            time.sleep(0.01)
+        # Aceptada pero sin petición todavía cuando el worker empieza a apagarse
+        with socket.create_connection(sock.getsockname()) as conexion:
+            while not servidor.server_state.connections:
+                time.sleep(0.01)
+            servidor.should_exit = True
+            time.sleep(0.3)
+            conexion.sendall(b"GET / HTTP/1.1\r\nHost: worker\r\n\r\n")
+            assert conexion.recv(1024).startswith(b"HTTP/1.1 200")
+    finally:
+        servidor.should_exit = True
+        hilo.join(timeout=10)
+        sock.close()
+
+def test_opciones_de_pool_desde_entorno(monkeypatch):
+    monkeypatch.setattr(database, "POOL_SIZE", 20)
+    monkeypatch.setattr(database, "MAX_OVERFLOW", 0)
+    monkeypatch.setattr(database, "POOL_PRE_PING", True)
+    opciones = database.opciones_engine("postgresql://usuario@servidor/libreria")
+    assert opciones["pool_size"] == 20
+    assert opciones["max_overflow"] == 0
+    assert opciones["pool_pre_ping"] is True
+    # SQLite en memoria no admite tamaño de pool
+    assert "pool_size" not in database.opciones_engine("sqlite://")
+
+def test_lectores_y_escritores_concurrentes(tmp_path):
+    motor = database.crear_engine(f"sqlite:///{tmp_path / 'concurrencia.db'}")
+    Base.metadata.create_all(bind=motor)
+    SesionConcurrente = sessionmaker(autocommit=False, autoflush=False, bind=motor)
+    with motor.connect() as conn:
+        assert conn.exec_driver_sql("PRAGMA journal_mode").scalar() == database.SQLITE_PRAGMAS["journal_mode"].lower()
+        assert conn.exec_driver_sql("PRAGMA busy_timeout").scalar() == database.SQLITE_PRAGMAS["busy_timeout"]
+
+    with SesionConcurrente() as db:
+        db.add(models.Autor(nombre="Autor", nacionalidad="Chilena"))
+        db.commit()
+
+    def escritor(n):
+        with SesionConcurrente() as db:
+            for i in range(20):
+                db.add(models.Libro(titulo=f"Libro {n}-{i}", precio=10.0, paginas=100, autor_id=1))
+                db.commit()
+
+    def lector(n):
+        with SesionConcurrente() as db:
+            for _ in range(20):
+                crud.consulta_busqueda_libros(db, titulo="libro", precio_min=5).limit(50).all()
+                crud.leer_estadisticas_materializadas(db)
+                db.rollback()
+
+    with ThreadPoolExecutor(max_workers=12) as pool:
+        tareas = [pool.submit(escritor, n) for n in range(6)] + [pool.submit(lector, n) for n in range(6)]
+        for tarea in tareas:
+            tarea.result()  # Propaga cualquier "database is locked"
+
+    with SesionConcurrente() as db:
+        assert crud.leer_estadisticas_materializadas(db)["total_libros"] == 120
+    motor.dispose()
@@ -0,0 +1,211 @@
+import statistics
+
+import pytest
+from sqlalchemy import create_engine, func
+from sqlalchemy.orm import sessionmaker
+
+import main
+from database import Base
+import models
+import crud
+import cache
+
+@pytest.mark.parametrize("fuente", ["materializada", "sql"])
+def test_estadisticas_una_consulta(client, db_session, poblar, consultas, fuente):
+    poblar(db_session, 10)
+    consultas.clear()
+    data = client.get(f"/estadisticas/?fuente={fuente}").json()
+    assert len(consultas) == 1
+    assert data == {
+        "total_libros": 10,
+        "total_autores": 10,
+        "precio_promedio": 14.5,
+        "precio_mas_alto": 19.0,
+        "precio_mas_bajo": 10.0
+    }
+
+def test_estadisticas_materializadas_siguen_escrituras(client, db_session):
+    vacia = client.get("/estadisticas/").json()
+    assert vacia["total_libros"] == 0 and vacia["precio_promedio"] == 0
+
+    autor_id = client.post("/autores/", json={"nombre": "Isabel Allende", "nacionalidad": "Chilena"}).json()["id"]
+    for precio in (12.5, 30.0, 7.25):
+        client.post("/libros/", json={"titulo": "Libro", "precio": precio, "paginas": 100, "autor_id": autor_id})
+    assert client.get("/estadisticas/").json() == client.get("/estadisticas/?fuente=sql").json()
+
+    # Bajas y cambios de precio fuera de la API también se reflejan
+    libro = db_session.query(models.Libro).filter(models.Libro.precio == 30.0).one()
+    db_session.delete(libro)
+    db_session.query(models.Libro).filter(models.Libro.precio == 7.25).update({"precio": 5.0})
+    db_session.commit()
+    # La caché de respuestas solo se invalida desde los endpoints de escritura
+    cache.respuestas.invalidar(cache.ETIQUETA_ESTADISTICAS)
+    data = client.get("/estadisticas/").json()
+    assert data == client.get("/estadisticas/?fuente=sql").json()
+    assert data["precio_mas_alto"] == 12.5 and data["precio_mas_bajo"] == 5.0
+
+def agregados_por_autor(db):
+    """Agregados calculados con GROUP BY, para comparar con las columnas materializadas"""
+    filas = db.query(
+        models.Libro.autor_id, func.count(), func.sum(models.Libro.precio),
+        func.min(models.Libro.precio), func.max(models.Libro.precio)
+    ).group_by(models.Libro.autor_id).all()
+    return {
+        autor_id: (total, pytest.approx(suma), minimo, maximo, pytest.approx(suma / total))
+        for autor_id, total, suma, minimo, maximo in filas
+    }
+
+def agregados_materializados(db):
+    db.expire_all()
+    return {
+        autor.id: (autor.total_libros, autor.suma_precios, autor.precio_min, autor.precio_max,
+                   autor.precio_promedio)
+        for autor in db.query(models.Autor).filter(models.Autor.total_libros > 0)
+    }
+
+def test_agregados_por_autor_siguen_escrituras(client, db_session, crear_catalogo_busqueda):
+    crear_catalogo_busqueda(db_session)
+    assert agregados_materializados(db_session) == agregados_por_autor(db_session)
+
+    client.post("/libros/", json={"titulo": "Paula", "precio": 99.5, "paginas": 330, "autor_id": 2})
+    client.post("/libros/bulk", json=[
+        {"titulo": f"Eva Luna {i}", "precio": 5 + i, "paginas": 300, "autor_id": 2} for i in range(3)
+    ])
+    assert agregados_materializados(db_session) == agregados_por_autor(db_session)
+
+    # Cambios de precio, de autor y bajas recalculan los autores afectados
+    libro = db_session.query(models.Libro).filter(models.Libro.autor_id == 1).first()
+    libro.precio = 1.5
+    db_session.commit()
+    libro.autor_id = 2
+    db_session.commit()
+    db_session.delete(db_session.query(models.Libro).filter(models.Libro.autor_id == 2).first())
+    db_session.commit()
+    assert agregados_materializados(db_session) == agregados_por_autor(db_session)
+
+def test_autores_con_estadisticas(client, db_session, crear_catalogo_busqueda, consultas):
+    crear_catalogo_busqueda(db_session)
+    consultas.clear()
+    antes = {a["id"]: a for a in client.get("/autores/?include=stats").json()}
+    assert len(consultas) == 1
+    assert set(antes[1]) == {"id", "nombre", "nacionalidad", "total_libros",
+                             "precio_min", "precio_max", "precio_promedio"}
+    assert "total_libros" not in client.get("/autores/").json()[0]
+
+    client.post("/libros/", json={"titulo": "Caro", "precio": 500, "paginas": 10, "autor_id": 1})
+    despues = {a["id"]: a for a in client.get("/autores/?include=stats").json()}
+    assert despues[1]["total_libros"] == antes[1]["total_libros"] + 1
+    assert despues[1]["precio_max"] == 500
+
+    sin_libros = client.post("/autores/", json={"nombre": "Inédito", "nacionalidad": "Chilena"}).json()
+    autor = client.get("/autores/?include=stats").json()[-1]
+    assert autor == {**sin_libros, "total_libros": 0, "precio_min": None,
+                     "precio_max": None, "precio_promedio": None}
+
+def test_ranking_de_autores(client, db_session, crear_catalogo_busqueda):
+    crear_catalogo_busqueda(db_session)
+    esperado = agregados_por_autor(db_session)
+    por_libros = client.get("/autores/ranking?limit=2").json()
+    assert [a["total_libros"] for a in por_libros] == sorted(
+        (total for total, *_ in esperado.values()), reverse=True
+    )[:2]
+
+    por_precio = client.get("/autores/ranking?por=precio").json()
+    promedios = [a["precio_promedio"] for a in por_precio]
+    assert promedios == sorted(promedios, reverse=True)
+    assert len(por_precio) == len(esperado)  # Los autores sin libros no entran
+
+    # El ranking se actualiza con los libros nuevos
+    nuevo = client.post("/autores/", json={"nombre": "Nuevo", "nacionalidad": "Chilena"}).json()
+    client.post("/libros/", json={"titulo": "Caro", "precio": 900, "paginas": 10, "autor_id": nuevo["id"]})
+    assert client.get("/autores/ranking?por=precio&limit=1").json()[0]["id"] == nuevo["id"]
+    assert client.get("/autores/ranking?por=otro").status_code == 422
+
+@pytest.mark.parametrize("por", ["libros", "precio"])
+def test_ranking_usa_indice(db_session, plan_de_consulta, por):
+    plan = plan_de_consulta(db_session, crud.consulta_ranking_autores(db_session, por))
+    assert any("ix_autores_" in paso for paso in plan), plan
+    assert not [paso for paso in plan if "TEMP B-TREE" in paso], plan
+
+def test_migracion_agrega_columnas_de_agregados(tmp_path):
+    motor = create_engine(f"sqlite:///{tmp_path / 'vieja.db'}")
+    with motor.begin() as conn:
+        # Esquema anterior: autores sin columnas de agregados
+        conn.exec_driver_sql("CREATE TABLE autores (id INTEGER PRIMARY KEY, nombre VARCHAR, nacionalidad VARCHAR)")
+        conn.exec_driver_sql(
+            "CREATE TABLE libros (id INTEGER PRIMARY KEY, titulo VARCHAR, precio FLOAT, "
+            "paginas INTEGER, autor_id INTEGER REFERENCES autores (id))"
+        )
+        conn.exec_driver_sql("INSERT INTO autores VALUES (1, 'Isabel Allende', 'Chilena'), (2, 'Sin libros', 'Peruana')")
+        conn.exec_driver_sql("INSERT INTO libros VALUES (1, 'Paula', 10, 300, 1), (2, 'Eva Luna', 20, 250, 1)")
+
+    Base.metadata.create_all(bind=motor)
+    with sessionmaker(bind=motor)() as db:
+        allende, sin_libros = db.query(models.Autor).order_by(models.Autor.id).all()
+        assert (allende.total_libros, allende.precio_min, allende.precio_max, allende.precio_promedio) == (2, 10, 20, 15)
+        assert (sin_libros.total_libros, sin_libros.precio_promedio) == (0, None)
+    motor.dispose()
+
+def test_histograma_de_precios(client, db_session, poblar):
+    poblar(db_session, 10)  # precios 10.0 ... 19.0
+    data = client.get("/libros/precios/histograma?limites=12&limites=15.5&limites=30").json()
+    assert data == {"total": 10, "cubetas": [
+        {"desde": None, "hasta": 12.0, "total": 2},
+        {"desde": 12.0, "hasta": 15.5, "total": 4},
+        {"desde": 15.5, "hasta": 30.0, "total": 4},
+        {"desde": 30.0, "hasta": None, "total": 0},
+    ]}
+
+    # Sin límites: cubetas del mismo ancho entre el mínimo y el máximo
+    data = client.get("/libros/precios/histograma?cubetas=3").json()
+    assert [(c["desde"], c["hasta"], c["total"]) for c in data["cubetas"]] == [
+        (10.0, 13.0, 3), (13.0, 16.0, 3), (16.0, 19.0, 4)
+    ]
+
+    client.post("/libros/", json={"titulo": "Caro", "precio": 99, "paginas": 10, "autor_id": 1})
+    assert client.get("/libros/precios/histograma?limites=30").json()["cubetas"][1]["total"] == 1
+    assert client.get("/libros/precios/histograma?limites=20&limites=10").status_code == 400
+
+@pytest.mark.parametrize("consulta", [
+    "limites=nan", "limites=inf", "limites=10&limites=-inf",
+    "&".join(f"limites={i}" for i in range(main.MAXIMO_CUBETAS)),
+])
+def test_histograma_limites_invalidos(client, consulta):
+    assert client.get(f"/libros/precios/histograma?{consulta}").status_code == 400
+
+def test_histograma_vacio(client):
+    assert client.get("/libros/precios/histograma").json() == {"cubetas": [], "total": 0}
+
+def test_percentiles_de_precio(client, db_session, poblar, consultas):
+    poblar(db_session, 11)
+    precios = [10.0 + i for i in range(11)]
+    consultas.clear()
+    data = client.get("/libros/precios/percentiles?p=50&p=90&p=25").json()
+    esperados = statistics.quantiles(precios, n=100, method="inclusive")
+    assert data["total"] == 11
+    assert data["percentiles"] == [
+        {"percentil": 50, "precio": pytest.approx(esperados[49])},
+        {"percentil": 90, "precio": pytest.approx(esperados[89])},
+        {"percentil": 25, "precio": pytest.approx(esperados[24])},
+    ]
+    # Un conteo y una lectura por percentil; nunca se cargan los libros
+    assert len(consultas) == 4
+    assert all("LIMIT" in sentencia for sentencia in consultas[1:])
+
+    assert client.get("/libros/precios/percentiles?p=101").status_code == 400
+    assert client.get("/libros/precios/percentiles?p=nan").status_code == 400
+
+def test_percentiles_repetidos_y_acotados(client, db_session, poblar, consultas):
+    poblar(db_session, 3)
+    consultas.clear()
+    data = client.get("/libros/precios/percentiles?" + "&".join(["p=50"] * 50)).json()
+    assert data["percentiles"] == [{"percentil": 50, "precio": 11.0}]
+    assert len(consultas) == 2
+    demasiados = "&".join(f"p={i}" for i in range(main.MAXIMO_PERCENTILES + 1))
+    assert client.get(f"/libros/precios/percentiles?{demasiados}").status_code == 400
+
+def test_histograma_usa_indice_cubriente(db_session, plan_de_consulta):
+    plan = plan_de_consulta(db_session, crud.consulta_por_cubeta(db_session, [10, 20]))
+    cuentas = [paso for paso in plan if "libros" in paso]
+    assert len(cuentas) == 3
+    assert all(paso.startswith("SEARCH libros USING COVERING INDEX ix_libros_precio") for paso in cuentas), plan
@@ -0,0 +1,69 @@
+import csv
+import io
+import json
+
+import pytest
+
+import crud
+import exportacion
+import models
+
+def test_exportar_csv_y_ndjson(client, db_session, poblar, consultas):
+    poblar(db_session, 30)
+    db_session.add(models.Libro(titulo="Sin autor, anónimo", precio=5.0, paginas=10))
+    db_session.commit()
+    consultas.clear()
+
+    respuesta = client.get("/export/libros")
+    assert respuesta.headers["content-type"].startswith("text/csv")
+    assert respuesta.headers["content-disposition"] == 'attachment; filename="libros.csv"'
+    # El autor llega por JOIN: una sola sentencia para toda la tabla
+    assert len(consultas) == 1 and "JOIN autores" in consultas[0]
+    filas = list(csv.DictReader(io.StringIO(respuesta.text)))
+    assert len(filas) == 31
+    assert filas[0] == {"id": "1", "titulo": "Libro 0", "precio": "10.0", "paginas": "100", "autor_id": "1",
+                        "autor_nombre": "Autor 0", "autor_nacionalidad": "Colombiana"}
+    assert filas[-1]["titulo"] == "Sin autor, anónimo" and filas[-1]["autor_nombre"] == ""
+
+    lineas = client.get("/export/libros?formato=ndjson").text.splitlines()
+    assert [json.loads(linea)["id"] for linea in lineas] == [int(fila["id"]) for fila in filas]
+    assert json.loads(lineas[-1])["autor_nombre"] is None
+
+    autores = client.get("/export/autores?formato=ndjson").text.splitlines()
+    assert json.loads(autores[3]) == {"id": 4, "nombre": "Autor 3", "nacionalidad": "Colombiana",
+                                      "total_libros": 1, "precio_min": 13.0, "precio_max": 13.0,
+                                      "precio_promedio": 13.0}
+
+@pytest.mark.parametrize("formato", ["csv", "ndjson", "arrow", "parquet"])
+def test_exportar_en_lotes(db_session, poblar, formato):
+    if formato in exportacion.FORMATOS_ARROW:
+        pytest.importorskip("pyarrow")
+    poblar(db_session, 25)
+    partes = list(exportacion.generar(db_session, crud.sentencia_exportar_libros(), formato, lote=10))
+    # Cada lote se envía apenas se codifica: nada acumula la tabla completa.
+    # Además: cabecera CSV, fin de stream Arrow (el esquema va con el primer
+    # lote) y número mágico y pie de Parquet
+    esperadas = {"csv": 1 + 3, "ndjson": 3, "arrow": 3 + 1, "parquet": 1 + 3 + 1}[formato]
+    assert len(partes) == esperadas
+
+def test_exportar_arrow_y_parquet(client, db_session, poblar):
+    pa = pytest.importorskip("pyarrow")
+    import pyarrow.parquet as pq
+    poblar(db_session, 12)
+    esperado = [json.loads(linea) for linea in client.get("/export/libros?formato=ndjson").text.splitlines()]
+
+    arrow = client.get("/export/libros?formato=arrow")
+    assert arrow.headers["content-type"] == "application/vnd.apache.arrow.stream"
+    tabla = pa.ipc.open_stream(arrow.content).read_all()
+    assert tabla.schema.field("precio").type == pa.float64()
+    assert tabla.to_pylist() == esperado
+
+    parquet = client.get("/export/libros?formato=parquet")
+    assert pq.read_table(io.BytesIO(parquet.content)).to_pylist() == esperado
+    assert len(pq.read_table(io.BytesIO(client.get("/export/autores?formato=parquet").content))) == 12
+
+def test_exportar_sin_pyarrow(client, monkeypatch):
+    monkeypatch.setattr(exportacion, "pa", None)
+    assert client.get("/export/libros?formato=parquet").status_code == 406
+    assert client.get("/export/autores?formato=arrow").status_code == 406
+    assert client.get("/export/autores?formato=csv").status_code == 200
@@ -0,0 +1,121 @@
+import asyncio
+import zlib
+
+import pytest
+
+import main
+from main import app
+import models
+import compresion
+import serializacion
+
+def test_forma_normalizada(client, db_session):
+    autor = models.Autor(nombre="Isabel Allende", nacionalidad="Chilena")
+    db_session.add_all([models.Libro(titulo=f"Libro {i}", precio=10 + i, paginas=100, autor=autor) for i in range(3)])
+    db_session.add(models.Libro(titulo="Huérfano", precio=5, paginas=5))
+    db_session.commit()
+
+    anidada = client.get("/libros/").json()
+    normalizada = client.get("/libros/?forma=normalizada").json()
+    assert normalizada["autores"] == {"1": anidada[0]["autor"]}
+    assert normalizada["libros"] == [{k: v for k, v in libro.items() if k != "autor"} for libro in anidada]
+
+    parcial = client.get("/libros/buscar/?titulo=libro&forma=normalizada&fields=titulo,autor.nombre").json()
+    assert parcial == {
+        "libros": [{"titulo": f"Libro {i}", "autor_id": 1} for i in range(3)],
+        "autores": {"1": {"nombre": "Isabel Allende"}},
+        "total": 3,
+    }
+    assert client.get("/libros/?forma=normalizada&formato=ndjson").status_code == 400
+
+@pytest.mark.skipif(serializacion.msgpack is None, reason="msgpack no instalado")
+@pytest.mark.parametrize("url", ["/libros/?limit=2", "/libros/buscar/?titulo=libro&forma=normalizada", "/autores/"])
+def test_formato_msgpack(client, db_session, poblar, url):
+    poblar(db_session, 3)
+    for _ in range(2):  # La segunda respuesta de /autores/ sale de la caché
+        binaria = client.get(url + "&formato=msgpack" if "?" in url else url + "?formato=msgpack")
+        assert binaria.headers["content-type"] == main.TIPO_MSGPACK
+        assert serializacion.msgpack.unpackb(binaria.content) == client.get(url).json()
+    assert binaria.headers.get(main.CABECERA_CURSOR) == client.get(url).headers.get(main.CABECERA_CURSOR)
+
+@pytest.mark.parametrize("codificacion", [
+    "gzip",
+    pytest.param("br", marks=pytest.mark.skipif(compresion.brotli is None, reason="brotli no instalado")),
+])
+def test_compresion_negociada(client, db_session, poblar, codificacion):
+    poblar(db_session, 40)
+    sin_comprimir = client.get("/libros/", headers={"Accept-Encoding": "identity"})
+    comprimida = client.get("/libros/", headers={"Accept-Encoding": codificacion})
+    assert "content-encoding" not in sin_comprimir.headers
+    # La copia sin comprimir también varía según Accept-Encoding, para los proxies
+    assert sin_comprimir.headers["vary"] == "Accept-Encoding"
+    assert comprimida.headers["content-encoding"] == codificacion
+    assert comprimida.headers["vary"] == "Accept-Encoding"
+    assert comprimida.content == sin_comprimir.content
+    assert comprimida.num_bytes_downloaded < sin_comprimir.num_bytes_downloaded / 3
+
+    # Por debajo del umbral no se comprime
+    pequena = client.get("/libros/?limit=1", headers={"Accept-Encoding": codificacion})
+    assert len(pequena.content) < compresion.COMPRESION_MINIMO
+    assert "content-encoding" not in pequena.headers and pequena.headers["vary"] == "Accept-Encoding"
+
+    # El streaming se comprime trozo a trozo
+    flujo = client.get("/libros/?formato=ndjson", headers={"Accept-Encoding": codificacion})
+    assert flujo.headers["content-encoding"] == codificacion
+    assert flujo.text == client.get("/libros/?formato=ndjson", headers={"Accept-Encoding": "identity"}).text
+
+@pytest.mark.parametrize("codificacion", [
+    "gzip",
+    pytest.param("br", marks=pytest.mark.skipif(compresion.brotli is None, reason="brotli no instalado")),
+])
+def test_streaming_comprimido_llega_por_linea(client, db_session, poblar, codificacion):
+    """Cada trozo comprimido se puede descomprimir apenas llega, sin esperar un bloque"""
+    poblar(db_session, 3)
+    lineas = client.get("/libros/?formato=ndjson", headers={"Accept-Encoding": "identity"}).content
+    trozos = []
+
+    async def escenario():
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+            "scheme": "http", "path": "/libros/", "raw_path": b"/libros/", "query_string": b"formato=ndjson",
+            "root_path": "", "headers": [(b"host", b"test"), (b"accept-encoding", codificacion.encode())],
+            "client": ("test", 1), "server": ("test", 80),
+        }
+        pedida = False
+
+        async def receive():
+            nonlocal pedida
+            if not pedida:
+                pedida = True
+                return {"type": "http.request", "body": b"", "more_body": False}
+            await asyncio.Event().wait()
+
+        async def send(mensaje):
+            if mensaje["type"] == "http.response.body":
+                trozos.append(mensaje["body"])
+
+        await app(scope, receive, send)
+
+    asyncio.run(escenario())
+    if codificacion == "gzip":
+        descomprimir = zlib.decompressobj(31).decompress
+    else:
+        descomprimir = compresion.brotli.Decompressor().process
+    assert [descomprimir(trozo) for trozo in trozos[:3]] == lineas.splitlines(keepends=True)
+
+def test_compresion_conserva_etag_debil(client, db_session, poblar):
+    poblar(db_session, 40)
+    primera = client.get("/autores/", headers={"Accept-Encoding": "gzip"})
+    etag = primera.headers["etag"]
+    assert primera.headers["content-encoding"] == "gzip" and etag.startswith('W/"')
+    revalidada = client.get("/autores/", headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+    assert revalidada.status_code == 304
+
+def test_elegir_codificacion():
+    assert compresion.elegir_codificacion("") is None
+    assert compresion.elegir_codificacion("gzip, deflate") == "gzip"
+    assert compresion.elegir_codificacion("gzip;q=0, identity") is None
+    assert compresion.elegir_codificacion("*") == ("br" if compresion.brotli else "gzip")
+    if compresion.brotli is not None:
+        assert compresion.elegir_codificacion("gzip, br") == "br"
+        assert compresion.elegir_codificacion("br;q=0, gzip") == "gzip"
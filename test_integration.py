@@ -54,7 +54,7 @@ class TestSecurity:
     def test_expired_token_rejected(self, client, test_user):
         # Crear un token expirado (usando freezegun o similar)
         with pytest.MonkeyPatch().context() as m:
-            m.setattr("app.auth.ACCESS_TOKEN_EXPIRE_MINUTES", -1)  # Token expirado
+            m.setattr("auth.ACCESS_TOKEN_EXPIRE_MINUTES", -1)  # Token expirado
             from auth import create_access_token
             expired_token = create_access_token({"sub": test_user.email})
         
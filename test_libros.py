@@ -1,14 +1,17 @@
 import pytest
-from fastapi.testclient import TestClient
-from main import app
-from database import Base, engine
 
-# Crear tablas de prueba
-Base.metadata.create_all(bind=engine)
+# `client` viene de conftest.py: cada prueba corre sobre una base aislada
 
-client = TestClient(app)
+@pytest.fixture
+def catalogo(client):
+    """Autores y libro de ejemplo para las pruebas de lectura"""
+    client.post("/autores/", json={"nombre": "Gabriel García Márquez", "nacionalidad": "Colombiana"})
+    autor_id = client.post("/autores/", json={"nombre": "Isabel Allende", "nacionalidad": "Chilena"}).json()["id"]
+    client.post("/libros/", json={
+        "titulo": "La Casa de los Espíritus", "precio": 25.99, "paginas": 450, "autor_id": autor_id
+    })
 
-def test_crear_autor():
+def test_crear_autor(client):
     response = client.post(
         "/autores/",
         json={"nombre": "Gabriel García Márquez", "nacionalidad": "Colombiana"}
@@ -18,7 +21,7 @@ def test_crear_autor():
     assert data["nombre"] == "Gabriel García Márquez"
     assert data["nacionalidad"] == "Colombiana"
 
-def test_crear_libro_con_autor():
+def test_crear_libro_con_autor(client):
     # Crear autor primero
     autor_response = client.post(
         "/autores/",
@@ -42,7 +45,7 @@ def test_crear_libro_con_autor():
     assert data["precio"] == 25.99
     assert data["autor"]["nombre"] == "Isabel Allende"
 
-def test_validacion_precio_negativo():
+def test_validacion_precio_negativo(client):
     response = client.post(
         "/libros/",
         json={
@@ -54,13 +57,13 @@ def test_validacion_precio_negativo():
     )
     assert response.status_code == 422  # Error de validación
 
-def test_listar_autores():
+def test_listar_autores(client, catalogo):
     response = client.get("/autores/")
     assert response.status_code == 200
     data = response.json()
     assert len(data) >= 2  # Debería tener al menos los 2 autores que creamos
 
-def test_obtener_autor_con_libros():
+def test_obtener_autor_con_libros(client, catalogo):
     # Primero obtener el ID de un autor existente
     autores_response = client.get("/autores/")
     autor_id = autores_response.json()[0]["id"]
@@ -70,14 +73,14 @@ def test_obtener_autor_con_libros():
     data = response.json()
     assert "libros" in data
 
-def test_buscar_libros_por_titulo():
+def test_buscar_libros_por_titulo(client, catalogo):
     response = client.get("/libros/buscar/?titulo=Espíritus")
     assert response.status_code == 200
     data = response.json()
     assert "libros" in data
     assert "total" in data
 
-def test_estadisticas():
+def test_estadisticas(client, catalogo):
     response = client.get("/estadisticas/")
     assert response.status_code == 200
     data = response.json()
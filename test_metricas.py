@@ -0,0 +1,39 @@
+import pytest
+
+import metricas
+
+def test_metricas_prometheus(client, db_session, poblar):
+    metricas.registro.limpiar()
+    poblar(db_session, 3)
+    client.get("/autores/1")
+    client.get("/autores/2")
+    client.get("/libros/?limit=2")
+    client.get("/libros/buscar/?rapido=true&limit=3")
+    client.get("/no-existe")
+
+    texto = client.get("/metrics").text
+    assert 'libreria_peticiones_total{metodo="GET",ruta="/autores/{autor_id}",estado="200"} 2' in texto
+    assert 'libreria_peticiones_total{metodo="GET",ruta="sin_ruta",estado="404"} 1' in texto
+    assert 'libreria_peticion_duracion_segundos_count{metodo="GET",ruta="/libros/"} 1' in texto
+    assert 'libreria_peticion_duracion_segundos_bucket{metodo="GET",ruta="/libros/",le="+Inf"} 1' in texto
+    # Autor + libros (selectinload) por cada detalle, un SELECT para la lista
+    assert 'libreria_sql_consultas_total{ruta="/autores/{autor_id}"} 4' in texto
+    assert 'libreria_sql_consultas_total{ruta="/libros/"} 1' in texto
+    # Filas leídas del cursor: el autor llega en la misma fila del JOIN, y las
+    # proyecciones (sin objetos ORM) también cuentan
+    assert 'libreria_sql_filas_total{ruta="/libros/"} 2' in texto
+    assert 'libreria_sql_filas_total{ruta="/libros/buscar/"} 3' in texto
+    assert "libreria_cache_fallos_total 2" in texto
+
+def test_consulta_fallida_no_deja_inicio_pendiente(db_session):
+    conexion = db_session.connection()
+    with pytest.raises(Exception):
+        conexion.exec_driver_sql("SELECT * FROM tabla_inexistente")
+    assert not conexion.info.get("inicio_consultas")
+
+def test_consultas_lentas_en_log(client, db_session, monkeypatch, caplog):
+    monkeypatch.setattr(metricas, "SQL_LENTO_SEGUNDOS", 1e-9)
+    with caplog.at_level("WARNING", logger="libreria.sql"):
+        client.get("/libros/")
+    assert any("Consulta lenta" in registro.message and "FROM libros" in registro.message
+               for registro in caplog.records)
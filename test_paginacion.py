@@ -0,0 +1,199 @@
+import json
+
+import pytest
+from sqlalchemy import event
+
+import main
+import models
+import schemas
+import serializacion
+
+@pytest.mark.parametrize("url", [
+    "/libros/",
+    "/libros/buscar/",
+    "/libros/buscar/?titulo=Libro",
+    "/libros/buscar/?autor=Autor",
+    "/libros/buscar/?precio_min=0&precio_max=1000",
+])
+def test_libros_sin_n_mas_1(client, db_session, poblar, consultas, url):
+    poblar(db_session, 3)
+    consultas.clear()
+    pocos = client.get(url)
+    consultas_pocos = len(consultas)
+
+    poblar(db_session, 20)
+    consultas.clear()
+    muchos = client.get(url)
+
+    assert pocos.status_code == muchos.status_code == 200
+    # El número de consultas no debe crecer con el número de libros
+    assert len(consultas) == consultas_pocos == 1
+
+def test_libros_incluyen_autor(client, db_session, poblar):
+    poblar(db_session, 2)
+    data = client.get("/libros/buscar/?autor=Autor 1").json()
+    assert data["total"] == 1
+    assert data["libros"][0]["autor"]["nombre"] == "Autor 1"
+
+def test_autor_con_libros_consultas_constantes(client, db_session, consultas):
+    autor = models.Autor(nombre="Isabel Allende", nacionalidad="Chilena")
+    autor.libros = [
+        models.Libro(titulo=f"Libro {i}", precio=20.0, paginas=300) for i in range(10)
+    ]
+    db_session.add(autor)
+    db_session.commit()
+    autor_id = autor.id
+    db_session.expunge_all()
+
+    consultas.clear()
+    response = client.get(f"/autores/{autor_id}")
+    assert response.status_code == 200
+    assert len(response.json()["libros"]) == 10
+    assert len(consultas) == 2
+
+def test_paginacion_por_cursor(client, db_session, poblar):
+    poblar(db_session, 5)
+    primera = client.get("/libros/?limit=2")
+    assert [l["id"] for l in primera.json()] == [1, 2]
+    cursor = primera.headers["X-Siguiente-Cursor"]
+
+    segunda = client.get(f"/libros/?limit=2&after={cursor}")
+    assert [l["id"] for l in segunda.json()] == [3, 4]
+
+    ultima = client.get("/libros/?limit=2&after=4")
+    assert [l["id"] for l in ultima.json()] == [5]
+    assert "X-Siguiente-Cursor" not in ultima.headers
+
+def test_paginacion_autores_y_busqueda(client, db_session, poblar):
+    poblar(db_session, 4)
+    autores = client.get("/autores/?limit=3&after=1").json()
+    assert [a["id"] for a in autores] == [2, 3, 4]
+
+    data = client.get("/libros/buscar/?titulo=Libro&orden=id&limit=2&after=2").json()
+    assert [l["id"] for l in data["libros"]] == [3, 4]
+    assert data["total"] == 2
+
+def test_streaming_ndjson(client, db_session, poblar):
+    poblar(db_session, 3)
+    response = client.get("/libros/?formato=ndjson")
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lineas = [json.loads(linea) for linea in response.text.splitlines()]
+    # Mismo contenido que la respuesta JSON normal
+    assert lineas == client.get("/libros/").json()
+
+    autores = client.get("/autores/?formato=ndjson&after=1").text.splitlines()
+    assert len(autores) == 2
+
+@pytest.mark.parametrize("url", [
+    "/libros/",
+    "/libros/?limit=2&after=1",
+    "/libros/buscar/?titulo=libro",
+    "/libros/buscar/?precio_min=11&orden=-precio",
+    "/autores/",
+    "/autores/?include=stats",
+])
+def test_ruta_rapida_identica(client, db_session, poblar, url):
+    poblar(db_session, 3)
+    # Caracteres no ASCII, espacios que recorta el validador y un libro sin autor
+    db_session.add(models.Libro(titulo="  Año único ", precio=0.1 + 0.2, paginas=7))
+    db_session.commit()
+
+    normal = client.get(url)
+    rapida = client.get(url + ("&" if "?" in url else "?") + "rapido=true")
+    assert rapida.content == normal.content
+    assert rapida.headers.get(main.CABECERA_CURSOR) == normal.headers.get(main.CABECERA_CURSOR)
+
+def test_ruta_rapida_sin_objetos_orm(client, db_session, poblar, consultas):
+    poblar(db_session, 3)
+    cargas = []
+
+    def registrar(objeto, contexto):
+        cargas.append(objeto)
+
+    event.listen(models.Base, "load", registrar, propagate=True)
+    try:
+        client.get("/libros/?rapido=true")
+    finally:
+        event.remove(models.Base, "load", registrar)
+    assert cargas == []
+    assert len([s for s in consultas if s.lstrip().upper().startswith("SELECT")]) == 1
+
+def test_proyecciones_siguen_a_los_esquemas():
+    assert serializacion.AUTOR.campos == list(schemas.Autor.model_fields)
+    assert serializacion.LIBRO.campos == list(schemas.LibroBase.model_fields)
+    assert serializacion.LIBRO_CON_AUTOR.campos + ["autor"] == list(schemas.LibroConAutor.model_fields)
+    assert serializacion.AUTOR_CON_LIBROS.campos + ["libros"] == list(schemas.AutorConLibros.model_fields)
+
+def recortar(objeto, campos):
+    return {campo: objeto[campo] for campo in objeto if campo in campos}
+
+@pytest.mark.parametrize("url,campos", [
+    ("/libros/?limit=2", ["id", "titulo"]),
+    ("/libros/", ["precio"]),
+    ("/libros/buscar/?titulo=libro", ["titulo", "paginas"]),
+    ("/autores/?limit=2", ["nombre"]),
+    ("/autores/?include=stats", ["id", "total_libros", "precio_promedio"]),
+])
+def test_fields_solo_columnas_pedidas(client, db_session, poblar, consultas, url, campos):
+    poblar(db_session, 3)
+    completa = client.get(url)
+    consultas.clear()
+    separador = "&" if "?" in url else "?"
+    parcial = client.get(f"{url}{separador}fields={','.join(campos)}")
+    rapida = client.get(f"{url}{separador}fields={','.join(campos)}&rapido=true")
+
+    assert parcial.status_code == 200
+    assert rapida.content == parcial.content
+    assert parcial.headers.get(main.CABECERA_CURSOR) == completa.headers.get(main.CABECERA_CURSOR)
+    esperado = completa.json()
+    if isinstance(esperado, dict):
+        esperado["libros"] = [recortar(libro, campos) for libro in esperado["libros"]]
+    else:
+        esperado = [recortar(fila, campos) for fila in esperado]
+    assert parcial.json() == esperado
+
+    sentencia = consultas[0]
+    assert " JOIN autores" not in sentencia.replace("\n", " ")
+    seleccion = sentencia.split("FROM")[0]
+    assert "nacionalidad" not in seleccion and "autor_id" not in seleccion
+
+def test_fields_con_campos_del_autor(client, db_session, poblar, consultas):
+    poblar(db_session, 2)
+    db_session.add(models.Libro(titulo="Huérfano", precio=5, paginas=5))
+    db_session.commit()
+    consultas.clear()
+
+    data = client.get("/libros/?fields=titulo,autor.nombre").json()
+    assert data == [
+        {"titulo": "Libro 0", "autor": {"nombre": "Autor 0"}},
+        {"titulo": "Libro 1", "autor": {"nombre": "Autor 1"}},
+        {"titulo": "Huérfano", "autor": None},
+    ]
+    assert len(consultas) == 1 and "LEFT OUTER JOIN autores" in consultas[0]
+    lineas = client.get("/libros/?fields=titulo,autor.nombre&formato=ndjson").text.splitlines()
+    assert [json.loads(linea) for linea in lineas] == data
+
+def test_fields_en_detalle_de_autor(client, db_session, poblar, consultas):
+    poblar(db_session, 1)
+    client.post("/libros/", json={"titulo": "Otro", "precio": 30, "paginas": 40, "autor_id": 1})
+    completo = client.get("/autores/1").json()
+    consultas.clear()
+
+    parcial = client.get("/autores/1?fields=nombre,libros.titulo").json()
+    assert parcial == {"nombre": completo["nombre"],
+                       "libros": [{"titulo": libro["titulo"]} for libro in completo["libros"]]}
+    assert len(consultas) == 2
+    assert client.get("/autores/1?fields=libros").json() == {"libros": completo["libros"]}
+    assert client.get("/autores/1?fields=id").json() == {"id": 1}
+    assert client.get("/autores/99?fields=id").status_code == 404
+
+@pytest.mark.parametrize("url", ["/libros/?fields=isbn", "/libros/?fields=autor.edad", "/autores/1?fields=",
+                                 "/autores/?fields=total_libros"])
+def test_fields_invalidos(client, db_session, poblar, url):
+    poblar(db_session, 1)
+    response = client.get(url)
+    assert response.status_code == 400
+
+def test_limite_de_pagina_invalido(client):
+    assert client.get("/libros/?limit=0").status_code == 422
+    assert client.get("/libros/?formato=xml").status_code == 422
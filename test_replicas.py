@@ -0,0 +1,125 @@
+import asyncio
+import sqlite3
+import time
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.requests import Request
+from sqlalchemy.orm import sessionmaker
+
+import cache
+import cambios
+import database
+import main
+import models
+from database import Base, get_db
+from main import app
+
+@pytest.fixture
+def con_replicas(tmp_path, monkeypatch):
+    """Primaria y dos réplicas: copias de archivo SQLite que después divergen a propósito.
+
+    El autor 1 se llama distinto en cada base, así la respuesta dice cuál atendió.
+    """
+    url_primaria = f"sqlite:///{tmp_path / 'primaria.db'}"
+    primaria = database.crear_engine(url_primaria)
+    Base.metadata.create_all(bind=primaria)
+    SesionPrimaria = sessionmaker(autoflush=False, bind=primaria)
+    with SesionPrimaria() as db:
+        db.add(models.Autor(nombre="Primaria", nacionalidad="Colombiana"))
+        db.commit()
+
+    urls = []
+    for i in range(2):
+        ruta = tmp_path / f"replica{i}.db"
+        with sqlite3.connect(tmp_path / "primaria.db") as origen, sqlite3.connect(ruta) as destino:
+            origen.backup(destino)
+            destino.execute("UPDATE autores SET nombre = ? WHERE id = 1", (f"Réplica {i}",))
+        urls.append(f"sqlite:///{ruta}")
+
+    def sesion():
+        db = SesionPrimaria()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def crear(seleccion="round_robin"):
+        monkeypatch.setattr(database, "replicas", database.Replicas(urls, seleccion))
+        monkeypatch.setattr(main, "replicas", database.replicas)
+        return database.replicas
+
+    crear()
+    app.dependency_overrides[get_db] = sesion
+    cache.respuestas.limpiar()
+    yield crear
+    app.dependency_overrides.clear()
+    for motor in [primaria, *database.replicas.engines]:
+        motor.dispose()
+
+def test_replicas_round_robin(con_replicas, monkeypatch):
+    monkeypatch.setattr(cache.respuestas, "habilitada", False)
+    cliente = TestClient(app)
+    nombres = [cliente.get("/autores/1").json()["nombre"] for _ in range(4)]
+    assert nombres == ["Réplica 0", "Réplica 1", "Réplica 0", "Réplica 1"]
+    assert [replica["lecturas"] for replica in database.replicas.metricas()["replicas"]] == [2, 2]
+    assert all(replica["abiertas"] == 0 for replica in database.replicas.metricas()["replicas"])
+    assert 'libreria_replica_lecturas_total{replica="1"} 2' in cliente.get("/metrics").text
+
+def test_replicas_leen_las_propias_escrituras(con_replicas, monkeypatch):
+    monkeypatch.setattr(database, "LEER_ESCRITURAS_SEGUNDOS", 30)
+    escritor, otro = TestClient(app), TestClient(app)
+    assert len(otro.get("/autores/").json()) == 1
+
+    nuevo = escritor.post("/autores/", json={"nombre": "Nuevo", "nacionalidad": "Chilena"}).json()
+    assert database.COOKIE_ESCRITURA in escritor.cookies
+    # Las réplicas no reciben la escritura: el otro cliente la ve recién cuando se repliquen
+    assert otro.get(f"/autores/{nuevo['id']}").status_code == 404
+    assert len(otro.get("/autores/").json()) == 1  # Y deja en la caché el listado sin ella
+    assert escritor.get(f"/autores/{nuevo['id']}").status_code == 200
+    assert len(escritor.get("/autores/").json()) == 2
+    assert database.replicas.lecturas_primaria == 2
+
+    # Pasada la ventana vuelve a las réplicas; se adelanta el reloj en vez de esperar
+    reloj = time.time() + 31
+    monkeypatch.setattr(database, "time", SimpleNamespace(time=lambda: reloj))
+    assert escritor.get("/autores/1").json()["nombre"].startswith("Réplica")
+
+def test_replicas_menos_conexiones(con_replicas):
+    replicas = con_replicas("menos_conexiones")
+    assert [replicas.elegir(), replicas.elegir(), replicas.elegir()] == [0, 1, 0]
+    replicas.liberar(1)
+    replicas.liberar(0)
+    assert replicas.elegir() == 1  # Quedan 1 en la 0 y 0 en la 1
+    assert replicas.abiertas == [1, 1]
+    with pytest.raises(ValueError):
+        database.Replicas([], "aleatoria")
+
+def test_lecturas_primaria_concurrentes(con_replicas):
+    replicas = database.replicas
+    with ThreadPoolExecutor(8) as pool:
+        for _ in range(8):
+            pool.submit(lambda: [replicas.contar_lectura_primaria() for _ in range(1000)])
+    assert replicas.metricas()["lecturas_primaria"] == 8000
+
+def test_stream_de_cambios_suelta_la_replica(con_replicas, monkeypatch):
+    """Cada sondeo del stream elige una réplica y la devuelve: esperando avisos no retiene ninguna"""
+    monkeypatch.setattr(cambios, "SSE_SONDEO", 0.01)
+    request = Request({"type": "http", "method": "GET", "path": "/cambios/stream", "headers": []})
+
+    async def escuchar():
+        respuesta = await main.stream_cambios(request, since=0, primaria=None)
+        recibidos, abiertas = [], []
+        for _ in range(3):  # El autor, un latido y, tras volver a leer, otro latido
+            recibidos.append(await anext(respuesta.body_iterator))
+            abiertas.append(list(database.replicas.abiertas))
+        await respuesta.body_iterator.aclose()
+        return recibidos, abiertas
+
+    recibidos, abiertas = asyncio.run(escuchar())
+    assert b"event: autor\n" in recibidos[0] and "Réplica 0".encode() in recibidos[0]
+    assert recibidos[1:] == [cambios.LATIDO, cambios.LATIDO]
+    assert abiertas == [[0, 0]] * 3
+    assert [replica["lecturas"] for replica in database.replicas.metricas()["replicas"]] == [1, 1]
@@ -91,4 +91,32 @@ class TestTasksCRUD:
 
     def test_delete_nonexistent_task(self, client, auth_headers):
         response = client.delete("/tasks/999", headers=auth_headers)
-        assert response.status_code == status.HTTP_404_NOT_FOUND
\ No newline at end of file
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+class TestTasksListing:
+    def test_get_tasks_paginated(self, client, auth_headers, task_factory):
+        tasks = [task_factory(title=f"Task {i}") for i in range(3)]
+
+        response = client.get("/tasks/?limit=2", headers=auth_headers)
+        assert [task["id"] for task in response.json()] == [tasks[0].id, tasks[1].id]
+        cursor = response.headers["X-Siguiente-Cursor"]
+        response = client.get(f"/tasks/?limit=2&after={cursor}", headers=auth_headers)
+        assert [task["id"] for task in response.json()] == [tasks[2].id]
+
+    def test_get_tasks_ndjson(self, client, auth_headers, task_factory):
+        task_factory(title="Task 1")
+        task_factory(title="Task 2")
+
+        response = client.get("/tasks/?formato=ndjson", headers=auth_headers)
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        assert len(response.text.splitlines()) == 2
+
+    @pytest.mark.parametrize("formato", ["msgpack", "xml"])
+    def test_get_tasks_unsupported_format(self, client, auth_headers, formato):
+        response = client.get(f"/tasks/?formato={formato}", headers=auth_headers)
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    def test_tasks_only_advertise_supported_options(self, client):
+        operacion = client.get("/openapi.json").json()["paths"]["/tasks/"]["get"]
+        parametros = {parametro["name"] for parametro in operacion["parameters"]}
+        assert parametros == {"limit", "after", "formato"}